@@ -1,11 +1,50 @@
 from aoab import AndroidOpenAccessoryBridge as AOAB
+import os
+import sys
 import usb
 
+try:
+  from ..accessory_daemon import DEFAULT_SOCKET, AccessoryClient
+except ImportError:
+  # accessory_daemon.py is in Android_Display_Control, above this directory
+  _parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  if _parent not in sys.path:
+    sys.path.append(_parent)
+  try:
+    from accessory_daemon import DEFAULT_SOCKET, AccessoryClient
+  except ImportError as e:
+    # accessory_daemon.py (or numpy) is not available: connect directly
+    print('localAccess: accessory daemon unavailable (%s), connecting '
+          'directly' % e)
+    DEFAULT_SOCKET, AccessoryClient = None, None
+
 PIXEL_VENDOR_ID = 0x18d1
 PIXEL_UNCONFIG_ID = 0x4ee7
 PIXEL_CONFIG_ID = 0x2d01
 
-def displayLocal(name):
+# Connection to 'python accessory_daemon.py local', kept across calls.
+_client = None
+
+def displayLocal(name, socket_path=DEFAULT_SOCKET):
+  global _client
+  #send through the accessory daemon if one is running, which skips the
+  #USB handshake of a new AOAB object
+  if isinstance(name, str) and _client is None and AccessoryClient is not None:
+      try:
+        _client = AccessoryClient(socket_path)
+      except OSError:
+        pass
+  if isinstance(name, str) and _client is not None:
+      try:
+        _client.write(name.encode('utf-8'))
+        return
+      except usb.core.USBError:
+        print('USBError occurred')
+        return
+      except OSError:
+        _client.close()  # daemon stopped, fall back to a direct connection
+        _client = None
+
   #create object to access Image Stream Local App
   if isinstance(name, str):
       try:
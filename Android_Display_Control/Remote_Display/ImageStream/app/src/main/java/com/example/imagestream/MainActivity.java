@@ -6,20 +6,27 @@ import androidx.constraintlayout.widget.ConstraintLayout;
 import android.graphics.Bitmap;
 import android.media.Image;
 import android.os.Bundle;
+import android.view.Choreographer;
 import android.view.View;
 import android.view.ViewGroup;
 import android.view.WindowManager;
 import android.widget.ImageView;
 import com.example.background.USBComms;
 import com.example.background.ImageBuffer;
+import com.example.background.FrameDecoder;
+
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
 
 public class MainActivity extends AppCompatActivity implements USBComms.Listener{
 
     ConstraintLayout constraintLayout;
     private USBComms comms;
     private Bitmap image;
-    private int [] pixels;
-    private int numPixels = ImageBuffer.imageWidth*ImageBuffer.imageHeight;
+    private FrameDecoder decoder;
+    // Acknowledgements are written off the UI thread, one at a time.
+    private ImageBuffer ackBuffer;
+    private ExecutorService ackWriter;
     private ImageView i;
     private View decorView;
 
@@ -30,7 +37,9 @@ public class MainActivity extends AppCompatActivity implements USBComms.Listener
         // prevent screen from dimming
         getWindow().addFlags(WindowManager.LayoutParams.FLAG_KEEP_SCREEN_ON);
         comms = new USBComms(this, this);
-        pixels = new int[numPixels];
+        decoder = new FrameDecoder();
+        ackBuffer = new ImageBuffer(FrameDecoder.PRESENTED_SIZE);
+        ackWriter = Executors.newSingleThreadExecutor();
         image = Bitmap.createBitmap(ImageBuffer.imageWidth, ImageBuffer.imageHeight,
                 Bitmap.Config.ARGB_8888);
 
@@ -57,18 +66,24 @@ public class MainActivity extends AppCompatActivity implements USBComms.Listener
 
     @Override
     public void onAoabRead(final ImageBuffer buffer) {
+        final long receivedNs = System.nanoTime();
         try {
-            for(int i = 0; i < numPixels; i++){
-                pixels[i] = (0xff) << 24 | (buffer.bytes.get(3*i) & 0xff) << 16 |
-                        (buffer.bytes.get(3*i + 1) & 0xff) << 8 | (buffer.bytes.get(3*i + 2) & 0xff);
+            // raw frames, full frames and dirty-rectangle updates
+            if (!decoder.decode(buffer)) {
+                return;
             }
-            image.setPixels(pixels, 0, ImageBuffer.imageWidth, 0, 0,
+            image.setPixels(decoder.pixels, 0, ImageBuffer.imageWidth, 0, 0,
                     ImageBuffer.imageWidth, ImageBuffer.imageHeight);
 
+            final boolean ack = decoder.ackRequested;
+            final int frameId = decoder.frameId;
             runOnUiThread(new Runnable() {
                 @Override
                 public void run() {
                     i.setImageBitmap(image);
+                    if (ack) {
+                        acknowledgeWhenPresented(frameId, receivedNs);
+                    }
                 }
             });
         } catch (NumberFormatException exception) {
@@ -79,9 +94,36 @@ public class MainActivity extends AppCompatActivity implements USBComms.Listener
         //}
     }
 
+    // The first frame callback runs before the traversal that draws the new
+    // bitmap; the one after it marks the vsync at which that frame is shown.
+    private void acknowledgeWhenPresented(final int frameId, final long receivedNs) {
+        Choreographer.getInstance().postFrameCallback(new Choreographer.FrameCallback() {
+            @Override
+            public void doFrame(long drawNs) {
+                Choreographer.getInstance().postFrameCallback(new Choreographer.FrameCallback() {
+                    @Override
+                    public void doFrame(final long presentedNs) {
+                        ackWriter.execute(new Runnable() {
+                            @Override
+                            public void run() {
+                                if (comms == null) {
+                                    return;
+                                }
+                                FrameDecoder.writePresented(ackBuffer, frameId, receivedNs,
+                                        presentedNs);
+                                comms.write(ackBuffer);
+                            }
+                        });
+                    }
+                });
+            }
+        });
+    }
+
     @Override
     protected void onDestroy() {
         super.onDestroy();
+        ackWriter.shutdown();
         comms = null;
     }
 
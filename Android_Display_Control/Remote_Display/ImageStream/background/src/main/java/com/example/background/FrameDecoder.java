@@ -0,0 +1,245 @@
+/*
+  Decodes the messages sent by image_stream.py into ARGB pixels.
+
+  A message is either a raw frame of imageWidth*imageHeight*3 bytes
+  [R1, G1, B1, R2, ...], or a versioned message that starts with an 8-byte
+  header: 'I', 'S', version, type, frame id (4 bytes). See frame_protocol.py
+  on the Python side for the layout of each message type. All integers are
+  big endian.
+ */
+
+package com.example.background;
+
+import android.util.Log;
+
+import java.nio.ByteBuffer;
+import java.util.Arrays;
+import java.util.zip.DataFormatException;
+import java.util.zip.Inflater;
+
+public class FrameDecoder {
+    private static final String TAG = FrameDecoder.class.getSimpleName();
+    public static final int VERSION = 1;
+    public static final int MSG_FULL = 0x01;
+    public static final int MSG_DELTA = 0x02;
+    public static final int MSG_ENCODED = 0x03;
+    public static final int MSG_STORE = 0x04;
+    public static final int MSG_SHOW = 0x05;
+    public static final int MSG_PRESENTED = 0x10;
+    public static final int FLAG_ACK = 0x80;
+    public static final int MAX_SLOTS = 16;
+    public static final int LAYOUT_RGB = 0;
+    public static final int LAYOUT_CHANNEL = 1;
+    public static final int COMPRESS_NONE = 0;
+    public static final int COMPRESS_RLE = 1;
+    public static final int COMPRESS_ZLIB = 2;
+    private static final int HEADER_SIZE = 8;
+    private static final int RECT_SIZE = 8;
+    private static final int ENCODING_SIZE = 3;
+    private static final int RUN_SIZE = 3;
+    private static final int SLOT_SIZE = 2;
+    public static final int PRESENTED_SIZE = HEADER_SIZE + 16;
+
+    public final int[] pixels;
+    public int frameId;
+    // Whether the host asked for a MSG_PRESENTED answer to the last message.
+    public boolean ackRequested;
+    // Decompressed data of MSG_ENCODED messages.
+    private final byte[] mPlane;
+    private final Inflater mInflater;
+    // Frame store of MSG_STORE messages, allocated on first use of a slot.
+    private final int[][] mSlots = new int[MAX_SLOTS][];
+
+    public FrameDecoder() {
+        pixels = new int[ImageBuffer.imageWidth * ImageBuffer.imageHeight];
+        Arrays.fill(pixels, 0xff000000);
+        mPlane = new byte[pixels.length * 3];
+        mInflater = new Inflater();
+    }
+
+    // Applies the message in buffer to pixels. Returns false if there is
+    // nothing new to draw: the message could not be decoded or only stored a
+    // frame.
+    public boolean decode(final ImageBuffer buffer) {
+        final ByteBuffer bytes = buffer.bytes;
+        ackRequested = false;
+        if (buffer.size == pixels.length * 3) {
+            readRect(bytes, 0, 0, 0, ImageBuffer.imageWidth, ImageBuffer.imageHeight, pixels);
+            return true;
+        }
+        if (buffer.size < HEADER_SIZE || bytes.get(0) != 'I' || bytes.get(1) != 'S') {
+            Log.d(TAG, "Unknown message of size " + buffer.size);
+            return false;
+        }
+        final int version = bytes.get(2) & 0xff;
+        if (version > VERSION) {
+            Log.d(TAG, "Unsupported protocol version " + version);
+            return false;
+        }
+        final int type = bytes.get(3) & 0xff & ~FLAG_ACK;
+        switch (type) {
+            case MSG_FULL:
+                if (buffer.size != HEADER_SIZE + pixels.length * 3) {
+                    Log.d(TAG, "Incorrect size of full frame: " + buffer.size);
+                    return false;
+                }
+                readRect(bytes, HEADER_SIZE, 0, 0,
+                        ImageBuffer.imageWidth, ImageBuffer.imageHeight, pixels);
+                break;
+            case MSG_ENCODED:
+                if (!decodeEncoded(bytes, HEADER_SIZE, buffer.size, pixels)) {
+                    return false;
+                }
+                break;
+            case MSG_STORE: {
+                final int slot = bytes.getShort(HEADER_SIZE) & 0xffff;
+                if (slot >= MAX_SLOTS) {
+                    Log.d(TAG, "Slot out of range: " + slot);
+                    return false;
+                }
+                if (mSlots[slot] == null) {
+                    mSlots[slot] = new int[pixels.length];
+                }
+                if (!decodeEncoded(bytes, HEADER_SIZE + SLOT_SIZE, buffer.size, mSlots[slot])) {
+                    mSlots[slot] = null;
+                    return false;
+                }
+                // Stored frames are not displayed, so there is nothing to draw.
+                frameId = bytes.getInt(4);
+                return false;
+            }
+            case MSG_SHOW: {
+                final int slot = bytes.getShort(HEADER_SIZE) & 0xffff;
+                if (slot >= MAX_SLOTS || mSlots[slot] == null) {
+                    Log.d(TAG, "Empty slot: " + slot);
+                    return false;
+                }
+                System.arraycopy(mSlots[slot], 0, pixels, 0, pixels.length);
+                break;
+            }
+            case MSG_DELTA:
+                final int count = bytes.getShort(HEADER_SIZE) & 0xffff;
+                int position = HEADER_SIZE + 2;
+                for (int r = 0; r < count; r++) {
+                    final int x = bytes.getShort(position) & 0xffff;
+                    final int y = bytes.getShort(position + 2) & 0xffff;
+                    final int w = bytes.getShort(position + 4) & 0xffff;
+                    final int h = bytes.getShort(position + 6) & 0xffff;
+                    position += RECT_SIZE;
+                    if (x + w > ImageBuffer.imageWidth || y + h > ImageBuffer.imageHeight
+                            || position + 3 * w * h > buffer.size) {
+                        Log.d(TAG, "Rectangle out of bounds: " + x + "," + y + " " + w + "x" + h);
+                        return false;
+                    }
+                    readRect(bytes, position, x, y, w, h, pixels);
+                    position += 3 * w * h;
+                }
+                break;
+            default:
+                Log.d(TAG, "Unknown message type " + type);
+                return false;
+        }
+        frameId = bytes.getInt(4);
+        ackRequested = (bytes.get(3) & FLAG_ACK) != 0;
+        return true;
+    }
+
+    // Fills buffer with the MSG_PRESENTED answer for frameId. Timestamps are
+    // System.nanoTime() values.
+    public static void writePresented(final ImageBuffer buffer, final int frameId,
+                                      final long receivedNs, final long presentedNs) {
+        final ByteBuffer bytes = buffer.bytes;
+        bytes.clear();
+        bytes.put((byte) 'I').put((byte) 'S').put((byte) VERSION).put((byte) MSG_PRESENTED);
+        bytes.putInt(frameId);
+        bytes.putLong(receivedNs);
+        bytes.putLong(presentedNs);
+        buffer.size = PRESENTED_SIZE;
+    }
+
+    // Decodes the encoding and body starting at offset into target.
+    private boolean decodeEncoded(final ByteBuffer bytes, final int offset, final int size,
+                                  final int[] target) {
+        final byte[] data = bytes.array();
+        final int layout = bytes.get(offset) & 0xff;
+        final int channel = bytes.get(offset + 1) & 0xff;
+        final int compression = bytes.get(offset + 2) & 0xff;
+        final int start = offset + ENCODING_SIZE;
+        final int expected = layout == LAYOUT_RGB ? pixels.length * 3 : pixels.length;
+        if ((layout != LAYOUT_RGB && layout != LAYOUT_CHANNEL) || channel > 2) {
+            Log.d(TAG, "Unknown layout " + layout + " (channel " + channel + ")");
+            return false;
+        }
+
+        final byte[] plane;
+        int planeStart = 0;
+        int length = 0;
+        switch (compression) {
+            case COMPRESS_NONE:
+                plane = data;
+                planeStart = start;
+                length = size - start;
+                break;
+            case COMPRESS_RLE:
+                plane = mPlane;
+                for (int p = start; p + RUN_SIZE <= size; p += RUN_SIZE) {
+                    final int run = (data[p + 1] & 0xff) << 8 | (data[p + 2] & 0xff);
+                    if (length + run > expected) {
+                        break;
+                    }
+                    Arrays.fill(mPlane, length, length + run, data[p]);
+                    length += run;
+                }
+                break;
+            case COMPRESS_ZLIB:
+                plane = mPlane;
+                mInflater.reset();
+                mInflater.setInput(data, start, size - start);
+                try {
+                    while (length < expected && !mInflater.finished()) {
+                        final int n = mInflater.inflate(mPlane, length, expected - length);
+                        if (n == 0 && mInflater.needsInput()) {
+                            break;
+                        }
+                        length += n;
+                    }
+                } catch (DataFormatException exception) {
+                    Log.d(TAG, "Corrupt zlib stream", exception);
+                    return false;
+                }
+                break;
+            default:
+                Log.d(TAG, "Unknown compression " + compression);
+                return false;
+        }
+        if (length != expected) {
+            Log.d(TAG, "Incorrect size of encoded frame: actual=" + length
+                    + " expected=" + expected);
+            return false;
+        }
+
+        if (layout == LAYOUT_RGB) {
+            readRect(ByteBuffer.wrap(plane), planeStart, 0, 0,
+                    ImageBuffer.imageWidth, ImageBuffer.imageHeight, target);
+        } else {
+            final int shift = 16 - 8 * channel;
+            for (int i = 0; i < target.length; i++) {
+                target[i] = (0xff) << 24 | (plane[planeStart + i] & 0xff) << shift;
+            }
+        }
+        return true;
+    }
+
+    private void readRect(final ByteBuffer bytes, int position,
+                          final int x, final int y, final int w, final int h,
+                          final int[] target) {
+        final byte[] data = bytes.array();
+        for (int row = y; row < y + h; row++) {
+            int p = row * ImageBuffer.imageWidth + x;
+            for (int col = 0; col < w; col++, p++, position += 3) {
+                target[p] = (0xff) << 24 | (data[position] & 0xff) << 16 |
+                        (data[position + 1] & 0xff) << 8 | (data[position + 2] & 0xff);
+            }
+        }
+    }
+}
@@ -26,8 +26,12 @@ public class ImageBuffer {
     public static int imageWidth = 1080;
 
     public ImageBuffer() {
+        this(0xffffff);
+    }
+
+    public ImageBuffer(final int capacity) {
         mSizeBytes = new byte[3];
-        bytes = ByteBuffer.allocate(0xffffff);
+        bytes = ByteBuffer.allocate(capacity);
     }
 
     public void reset() {
@@ -100,12 +104,12 @@ public class ImageBuffer {
     }
 
     private void writeSizeBytes(final int value) {
-        if (BuildConfig.DEBUG && (value <= 0 || value > 0xffff)) {
+        if (BuildConfig.DEBUG && (value <= 0 || value > 0xffffff)) {
             throw new AssertionError("Size value out of bounds: " + value);
         }
-        mSizeBytes[0] = (byte) ((value & 0xff00) >> 16);
-        mSizeBytes[1] = (byte) ((value & 0x00ff) >> 8);
-        mSizeBytes[2] = (byte) (value & 0x00ff);
+        mSizeBytes[0] = (byte) ((value & 0xff0000) >> 16);
+        mSizeBytes[1] = (byte) ((value & 0x00ff00) >> 8);
+        mSizeBytes[2] = (byte) (value & 0x0000ff);
     }
 
     private boolean ioExceptionIsNoSuchDevice(IOException ioException) {
@@ -0,0 +1,194 @@
+# Chunked Transport of the 3-Byte Framed AndroidOpenAccessoryBridges
+#
+#  The write(), write_async() and flush() machinery shared by the bridges of
+#  image_stream.py and aoab3.py: every message is a 3-byte big-endian length
+#  followed by the payload, sent in CHUNK_SIZE bulk transfers, either from
+#  the calling thread or from a background writer thread with two frame
+#  buffers. The bridges inherit from AccessoryTransport, call
+#  _initTransport() once their OUT endpoint is open and _closeTransport()
+#  before disposing of the device.
+
+from __future__ import print_function, unicode_literals
+
+import array
+import collections
+import queue
+import sys
+import threading
+import time
+import usb
+
+
+_B = 'B' if sys.version_info.major == 3 else b'B'
+
+CHUNK_SIZE = 0x40000  # bytes handed to the OUT endpoint per bulk transfer
+MAX_ATTEMPTS = 5  # timed-out attempts of a resendable transfer
+BACKOFF = 0.005  # seconds before the first retry, doubled on every retry
+
+
+def _asView(data):
+    """ Flat byte memoryview of any bytes-like object (or list of ints). """
+    try:
+        return memoryview(data).cast('B')
+    except TypeError:
+        return memoryview(bytes(bytearray(data)))
+
+
+class TransferStats:
+    """
+    Per-frame byte and latency counters of an AndroidOpenAccessoryBridge.
+
+    frame_bytes, frame_latency and transfer_time keep the last 'history'
+    frames. frame_latency is measured from the write()/write_async() call to
+    the last byte accepted by the endpoint, transfer_time only covers the
+    time spent on the bus.
+    """
+
+    def __init__(self, history=1000):
+        self.frames = 0
+        self.bytes = 0
+        self.retries = 0
+        self.frame_bytes = collections.deque(maxlen=history)
+        self.frame_latency = collections.deque(maxlen=history)
+        self.transfer_time = collections.deque(maxlen=history)
+
+    def record(self, num_bytes, latency, transfer_time):
+        self.frames += 1
+        self.bytes += num_bytes
+        self.frame_bytes.append(num_bytes)
+        self.frame_latency.append(latency)
+        self.transfer_time.append(transfer_time)
+
+    def throughput(self):
+        """ Bytes per second on the bus over the recorded history. """
+        busy = sum(self.transfer_time)
+        return sum(self.frame_bytes) / busy if busy else 0.0
+
+
+class AccessoryTransport:
+    """
+    Length-prefixed writes to self._endpoint_out of a bridge that also sets
+    self._device.
+    """
+
+    def _initTransport(self):
+        self.stats = TransferStats()
+        self._writer = None
+        self._writer_error = None
+        self._cut_short = None  # USBError that left a message incomplete
+        self._pending = queue.Queue()
+        # Two frame buffers: one on the wire while the next one is filled.
+        self._free_buffers = queue.Queue()
+        for _ in range(2):
+            self._free_buffers.put(bytearray())
+
+    def _write(self, data, timeout):
+        assert(self._device and self._endpoint_out and len(data))
+        self._checkFraming()
+        t_submit = time.perf_counter()
+        self.flush()
+        self._writeFrame(_asView(data), timeout, t_submit)
+
+    def _writeAsync(self, data, timeout):
+        assert(self._device and self._endpoint_out and len(data))
+        self._checkFraming()
+        t_submit = time.perf_counter()
+        self._raiseWriterError()
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._writerLoop)
+            self._writer.daemon = True
+            self._writer.start()
+        view = _asView(data)
+        size = len(view)
+        buf = self._free_buffers.get()
+        if len(buf) < size:
+            buf = bytearray(size)
+        buf[:size] = view
+        self._pending.put((buf, size, timeout, t_submit))
+
+    def flush(self):
+        """ Waits until every frame queued with write_async() has been sent. """
+        if self._writer is not None:
+            self._pending.join()
+        self._raiseWriterError()
+
+    def _raiseWriterError(self):
+        error, self._writer_error = self._writer_error, None
+        if error is not None:
+            raise error
+
+    def _writerLoop(self):
+        while True:
+            item = self._pending.get()
+            if item is None:
+                self._pending.task_done()
+                return
+            buf, size, timeout, t_submit = item
+            try:
+                if self._writer_error is None:
+                    self._writeFrame(memoryview(buf)[:size], timeout, t_submit)
+            except Exception as e:
+                self._writer_error = e
+            finally:
+                self._free_buffers.put(buf)
+                self._pending.task_done()
+
+    def _stopWriter(self):
+        if self._writer is not None:
+            self._pending.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def _writeFrame(self, view, timeout, t_submit):
+        size = len(view)
+        size_bytes = array.array(_B, [(size & 0x00ff0000) >> 16,
+            (size & 0x0000ff00) >> 8,
+            (size & 0x000000ff)])
+        t_start = time.perf_counter()
+        assert(self._writeChunk(size_bytes, timeout) == 3)
+        offset = 0
+        try:
+            while offset < size:
+                # Copy one chunk into an array: pyusb converts anything else,
+                # memoryviews included, element by element.
+                chunk = array.array(_B)
+                chunk.frombytes(view[offset:offset + CHUNK_SIZE])
+                offset += self._writeChunk(chunk, timeout)
+        except usb.core.USBError as e:
+            # The app has the length and part of the payload may be out:
+            # anything sent now would be read as the rest of this message.
+            # Refuse to write until the bridge is reopened, which resets
+            # the app.
+            self._cut_short = e
+            raise
+        t_end = time.perf_counter()
+        self.stats.record(size, t_end - t_submit, t_end - t_start)
+
+    def _writeChunk(self, chunk, timeout):
+        # A transfer of at most one packet (e.g. the length) reaches the app
+        # whole or not at all, so it is resent when it times out, backing
+        # off exponentially. A longer one may have been cut anywhere and a
+        # resend could duplicate bytes, so its timeout is raised.
+        resendable = len(chunk) <= self._endpoint_out.wMaxPacketSize
+        delay = BACKOFF
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                return self._endpoint_out.write(chunk, timeout=timeout)
+            except usb.core.USBError as e:
+                if (e.errno != 110 or not resendable
+                        or attempt == MAX_ATTEMPTS - 1):
+                    raise
+                # Operation timed out, back off before retrying.
+                self.stats.retries += 1
+                time.sleep(delay)
+                delay *= 2
+
+    def _checkFraming(self):
+        if self._cut_short is not None:
+            raise usb.core.USBError('A message was cut short (%s); close and '
+                                    'reopen the bridge.' % self._cut_short)
+
+    def _closeTransport(self):
+        self._stopWriter()
+        if self._cut_short is None:  # the app would not read the marker
+            self._endpoint_out.write(array.array(_B, [0, 0]))
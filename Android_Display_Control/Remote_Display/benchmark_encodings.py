@@ -0,0 +1,127 @@
+# Benchmark Whole-Frame Encodings of the Image Stream Protocol
+#
+#  Compares encode time plus estimated transfer time against the compression
+#  ratio of the MSG_ENCODED encodings in frame_protocol.py, on synthetic
+#  versions of the patterns sent in the data_collection notebooks:
+#
+#    mnist        a 28x28 input expanded 5x and centered (run_MLP_MPPC_fc0)
+#    kaleidoscope a padded 28x28 input tiled 5x5 with mirrored, attenuated
+#                 copies, as produced by utils/kaleidoscope.py
+#    stl10        a 711x711 natural-looking image binarized at its median,
+#                 as in run_rand_dotprod_711x711_STL10_MPPC
+#    noise        random RGB, the worst case
+#
+#  Usage: python benchmark_encodings.py [bandwidth in MB/s]
+
+from __future__ import print_function, unicode_literals
+
+import sys
+import time
+import zlib
+
+import numpy as np
+
+from frame_encoding import FRAME_NUM_BYTES, FRAME_SHAPE, GREEN
+from frame_protocol import (DEFAULT_BANDWIDTH, DeltaEncoder, FrameReceiver,
+                            rle_encode)
+
+
+def center(image):
+    frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+    h, w = image.shape
+    y0, x0 = (FRAME_SHAPE[0] - h) // 2, (FRAME_SHAPE[1] - w) // 2
+    frame[y0:y0 + h, x0:x0 + w, GREEN] = image
+    return frame
+
+
+def digit(rng):
+    image = rng.integers(0, 256, size=(28, 28), dtype=np.uint8)
+    image[rng.random((28, 28)) < 0.8] = 0
+    return image
+
+
+def mnist_pattern(rng):
+    return center(np.kron(digit(rng), np.ones((5, 5), dtype=np.uint8)))
+
+
+def kaleidoscope_pattern(rng, reps=2, pad=2, reflectivity=0.9):
+    block = np.pad(digit(rng), pad)
+    rows = []
+    for i in range(-reps, reps + 1):
+        row = []
+        for j in range(-reps, reps + 1):
+            tile = block[::1 - 2 * (i % 2), ::1 - 2 * (j % 2)]
+            row.append(tile * reflectivity ** (abs(i) + abs(j)))
+        rows.append(np.hstack(row))
+    tiled = np.vstack(rows).astype(np.uint8)
+    return center(np.kron(tiled, np.ones((3, 3), dtype=np.uint8)))
+
+
+def stl10_pattern(rng, size=711):
+    # Low-pass filtered noise stands in for a natural image.
+    spectrum = np.fft.fft2(rng.standard_normal((size, size)))
+    freq = np.hypot(*np.meshgrid(np.fft.fftfreq(size), np.fft.fftfreq(size)))
+    image = np.real(np.fft.ifft2(spectrum / (1 + (freq * 40) ** 2)))
+    binary = image <= np.percentile(image, 50)
+    return center(binary.astype(np.uint8) * 255)
+
+
+def noise_pattern(rng):
+    return rng.integers(0, 256, size=FRAME_SHAPE, dtype=np.uint8)
+
+
+def encoders():
+    green = lambda frame: np.ascontiguousarray(frame[:, :, GREEN])
+    return [
+        ('raw RGB', lambda frame: frame.tobytes()),
+        ('channel8', lambda frame: green(frame).tobytes()),
+        ('RGB + RLE', lambda frame: rle_encode(frame)),
+        ('channel8 + RLE', lambda frame: rle_encode(green(frame))),
+        ('RGB + zlib', lambda frame: zlib.compress(frame, 1)),
+        ('channel8 + zlib', lambda frame: zlib.compress(green(frame), 1)),
+    ]
+
+
+def timed(func, frame, repeats=3):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        body = func(frame)
+    return body, (time.perf_counter() - t0) / repeats
+
+
+if __name__ == '__main__':
+    bandwidth = float(sys.argv[1]) * 1e6 if len(sys.argv) > 1 \
+        else DEFAULT_BANDWIDTH
+    rng = np.random.default_rng(0)
+    patterns = [('mnist', mnist_pattern(rng)),
+                ('kaleidoscope', kaleidoscope_pattern(rng)),
+                ('stl10', stl10_pattern(rng)),
+                ('noise', noise_pattern(rng))]
+
+    print('bandwidth %.0f MB/s, raw frame %d bytes\n'
+          % (bandwidth / 1e6, FRAME_NUM_BYTES))
+    print('%-13s %-16s %10s %8s %10s %10s %10s'
+          % ('pattern', 'encoding', 'bytes', 'ratio', 'encode ms',
+             'bus ms', 'total ms'))
+    for name, frame in patterns:
+        rows = [(label, func) for label, func in encoders()
+                if 'channel8' not in label or name != 'noise']
+        for label, func in rows:
+            body, encode_time = timed(func, frame)
+            bus_time = len(body) / bandwidth
+            print('%-13s %-16s %10d %8.0f %10.2f %10.2f %10.2f'
+                  % (name, label, len(body), FRAME_NUM_BYTES / len(body),
+                     1e3 * encode_time, 1e3 * bus_time,
+                     1e3 * (encode_time + bus_time)))
+
+        # The per-frame choice made by AndroidOpenAccessoryBridge.write_frame()
+        encoder = DeltaEncoder(bandwidth=bandwidth)
+        message, encode_time = timed(lambda f: encoder.encode(f, False), frame)
+        receiver = FrameReceiver()
+        receiver.feed(message)
+        assert (receiver.canvas == frame).all()
+        bus_time = len(message) / bandwidth
+        print('%-13s %-16s %10d %8.0f %10.2f %10.2f %10.2f\n'
+              % (name, 'auto', len(message), FRAME_NUM_BYTES / len(message),
+                 1e3 * encode_time, 1e3 * bus_time,
+                 1e3 * (encode_time + bus_time)))
@@ -0,0 +1,165 @@
+# Encode Images into the Byte Layout of the Image Stream Android App
+#
+#  The ImageStream app expects every frame as one contiguous run of bytes
+#  [R1, G1, B1, R2, ... RN, GN, BN] for a 1080x1920 (width x height) display.
+#  The helpers below produce that layout from NumPy arrays, torch tensors and
+#  PIL images with vectorized copies only, and hand it out as a memoryview so
+#  that AndroidOpenAccessoryBridge.write() can send it without another copy.
+#
+#  Run this file directly to benchmark the encoder against the per-pixel loop
+#  used by send_png.py and the data_collection notebooks.
+
+from __future__ import print_function, unicode_literals
+
+import time
+
+import numpy as np
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+PHONE_HEIGHT = 1920
+PHONE_WIDTH = 1080
+FRAME_SHAPE = (PHONE_HEIGHT, PHONE_WIDTH, 3)
+FRAME_NUM_BYTES = PHONE_HEIGHT * PHONE_WIDTH * 3
+GREEN = 1
+
+
+def as_array(image):
+    """
+    Returns a uint8 numpy.ndarray sharing memory with 'image' whenever the
+    input allows it.
+
+    image: a PIL image, torch.tensor or numpy array, either height x width
+    (single channel) or height x width x channels. Values are expected in the
+    range 0-255; other dtypes are cast to uint8.
+    """
+    if torch is not None and isinstance(image, torch.Tensor):
+        array = image.detach().cpu().numpy()  # no copy for CPU tensors
+    else:
+        array = np.asarray(image)
+    if array.dtype != np.uint8:
+        array = array.astype(np.uint8)
+    return array
+
+
+class FrameEncoder:
+    """
+    Packs images into the byte layout expected by the ImageStream app.
+
+    The encoder owns one preallocated height x width x 3 frame buffer. Inputs
+    that already are contiguous RGB frames are passed through untouched,
+    everything else is written into the buffer with a single vectorized copy.
+    The memoryview returned by encode() aliases either the input or the
+    internal buffer, so it is only valid until the next call to encode().
+    """
+
+    def __init__(self, height=PHONE_HEIGHT, width=PHONE_WIDTH):
+        self.shape = (int(height), int(width), 3)
+        self.num_bytes = self.shape[0] * self.shape[1] * 3
+        self._frame = np.zeros(self.shape, dtype=np.uint8)
+        # Channels of the buffer that may hold stale values from an RGB frame.
+        self._dirty_channels = set()
+
+    def encode(self, image, channel=GREEN):
+        """
+        Returns a flat memoryview of 'image' in [R, G, B, R, G, B, ...] order.
+
+        image: a PIL image, torch.tensor or numpy array of the frame size.
+        Single-channel (height x width) inputs are written into 'channel' of
+        the frame (green by default) with the other two channels set to 0.
+        RGBA inputs have their alpha channel dropped. Bytes-like objects of
+        exactly one frame, e.g. the output of a previous encode(), are taken
+        to be in wire layout already.
+        """
+        if (isinstance(image, (bytes, bytearray, memoryview))
+                and len(image) == self.num_bytes):
+            image = np.frombuffer(image, dtype=np.uint8).reshape(self.shape)
+        array = as_array(image)
+        if array.shape[:2] != self.shape[:2]:
+            raise ValueError('Image must be %dx%d (height x width), got %s.'
+                             % (self.shape[0], self.shape[1], array.shape))
+
+        if array.ndim == 3 and array.shape[2] == 1:
+            array = array[:, :, 0]
+
+        if array.ndim == 2:
+            # Expand a single channel by writing it straight into one plane
+            # of the frame buffer; the other planes stay (or are made) black.
+            for c in self._dirty_channels - {channel}:
+                self._frame[:, :, c] = 0
+            self._frame[:, :, channel] = array
+            self._dirty_channels = {channel}
+            return memoryview(self._frame).cast('B')
+
+        if array.ndim != 3 or array.shape[2] not in (3, 4):
+            raise ValueError('Unsupported image shape %s.' % (array.shape,))
+
+        if array.shape[2] == 3 and array.flags['C_CONTIGUOUS']:
+            return memoryview(array).cast('B')  # already in wire layout
+
+        self._frame[...] = array[:, :, :3]
+        self._dirty_channels = {0, 1, 2}
+        return memoryview(self._frame).cast('B')
+
+
+def encode_frame(image, channel=GREEN):
+    """
+    Returns the ImageStream byte layout of 'image' as a bytes object.
+
+    Convenience wrapper around FrameEncoder for one-off frames, e.g. a
+    background image that is sent many times. Use a FrameEncoder directly in
+    loops to avoid allocating a frame per call.
+    """
+    return FrameEncoder().encode(image, channel).tobytes()
+
+
+if __name__ == '__main__':
+    try:
+        from PIL import Image
+    except ImportError:
+        Image = None
+
+    def PIL_to_bytestream(img_px):
+        # Per-pixel reference encoder, as used by the data_collection notebooks.
+        array_px = np.array(img_px)
+        byte_array_px = bytearray()
+
+        for i in range(array_px.shape[0]):
+            for j in range(array_px.shape[1]):
+                byte_array_px.append(array_px[i, j, 0])
+                byte_array_px.append(array_px[i, j, 1])
+                byte_array_px.append(array_px[i, j, 2])
+
+        return byte_array_px
+
+    def frames_per_second(func, image, repeats):
+        t0 = time.perf_counter()
+        for _ in range(repeats):
+            func(image)
+        return repeats / (time.perf_counter() - t0)
+
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, size=FRAME_SHAPE, dtype=np.uint8)
+    green = np.ascontiguousarray(rgb[:, :, GREEN])
+    encoder = FrameEncoder()
+
+    # The per-pixel loop takes seconds per frame, so one frame is enough.
+    fps_loop = frames_per_second(PIL_to_bytestream, rgb, 1)
+    assert bytes(encoder.encode(rgb)) == bytes(PIL_to_bytestream(rgb))
+    print('per-pixel loop               : %8.2f frames/s' % fps_loop)
+
+    inputs = [('numpy RGB', rgb), ('numpy green-only', green)]
+    if Image is not None:
+        inputs.append(('PIL RGB', Image.fromarray(rgb)))
+    if torch is not None:
+        inputs.append(('torch RGB', torch.from_numpy(rgb)))
+        inputs.append(('torch green-only', torch.from_numpy(green)))
+
+    for name, image in inputs:
+        fps = frames_per_second(encoder.encode, image, 50)
+        print('FrameEncoder %-16s: %8.2f frames/s (x%.0f)'
+              % (name, fps, fps / fps_loop))
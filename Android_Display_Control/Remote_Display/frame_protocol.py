@@ -0,0 +1,594 @@
+# Versioned Frame Messages for the Image Stream Android App
+#
+#  The original protocol sends every frame as a raw payload of exactly
+#  1920*1080*3 bytes behind the 3-byte length prefix. This module adds
+#  messages that start with an 8-byte header instead:
+#
+#    'I' 'S' | version (1 byte) | type (1 byte) | frame id (4 bytes)
+#
+#  All integers are big endian. Raw payloads of exactly FRAME_NUM_BYTES bytes
+#  are still understood by the app, so old scripts keep working. The app
+#  tells them apart by their length only, so DeltaEncoder never makes a
+#  message of that length: such a delta or encoded frame is sent as MSG_FULL
+#  (or, for MSG_STORE, without compression) instead.
+#
+#    MSG_FULL    the header followed by a raw RGB frame.
+#    MSG_DELTA   the header, a 2-byte rectangle count, then for every
+#                rectangle x, y, width, height (2 bytes each) followed by
+#                its width*height*3 RGB bytes, row by row. Pixels outside
+#                the rectangles keep the values of the previous frame.
+#    MSG_ENCODED the header, then layout, channel and compression (1 byte
+#                each) followed by the encoded frame. The layout is either
+#                LAYOUT_RGB (all three channels) or LAYOUT_CHANNEL (only
+#                'channel' is sent, the other two are black). The data of
+#                the layout is sent as is (COMPRESS_NONE), as runs of
+#                (value, 2-byte length) (COMPRESS_RLE) or as a zlib stream
+#                (COMPRESS_ZLIB).
+#    MSG_STORE   the header, a 2-byte slot number, then a frame encoded as
+#                in MSG_ENCODED. The app keeps the frame in that slot of its
+#                frame store without displaying it.
+#    MSG_SHOW    the header and a 2-byte slot number. The app displays the
+#                frame stored in that slot.
+#
+#  Setting FLAG_ACK in the type byte of a message that changes the display
+#  asks the app to answer, over the IN endpoint, once the frame is on the
+#  panel:
+#
+#    MSG_PRESENTED  the header with the id of the acknowledged frame, then
+#                   the app's clock in nanoseconds when the message was
+#                   received and when the frame was presented (8 bytes each).
+#
+#  FrameCache keeps track of which frames are resident in the app's frame
+#  store and evicts the least recently used one when it is full.
+#
+#  FrameReceiver decodes the messages the same way as the app does, and
+#  LoopbackEndpoint feeds it from the bytes a bridge writes to its OUT
+#  endpoint, so the protocol can be checked without a phone. Run this file
+#  directly to verify delta frames and print the bytes sent per frame.
+
+from __future__ import print_function, unicode_literals
+
+import collections
+import struct
+import time
+import zlib
+
+import numpy as np
+
+try:
+    from .frame_encoding import (FRAME_NUM_BYTES, FRAME_SHAPE, GREEN,
+                                 FrameEncoder)
+except ImportError:
+    from frame_encoding import (FRAME_NUM_BYTES, FRAME_SHAPE, GREEN,
+                                FrameEncoder)
+
+
+MAGIC = b'IS'
+VERSION = 1
+MSG_FULL = 0x01
+MSG_DELTA = 0x02
+MSG_ENCODED = 0x03
+MSG_STORE = 0x04
+MSG_SHOW = 0x05
+MSG_PRESENTED = 0x10
+FLAG_ACK = 0x80
+
+LAYOUT_RGB = 0
+LAYOUT_CHANNEL = 1
+COMPRESS_NONE = 0
+COMPRESS_RLE = 1
+COMPRESS_ZLIB = 2
+
+# Encodings a whole frame may be sent with; 'raw' is always available.
+ENCODINGS = ('raw', 'channel8', 'rle', 'zlib')
+DEFAULT_BANDWIDTH = 35e6  # bytes/s of a USB 2.0 bulk endpoint
+ZLIB_SPEED = 200e6  # bytes/s compressed by zlib at level 1, roughly
+MAX_SLOTS = 16  # frames the app can store, 8 MB of memory each
+
+_HEADER = struct.Struct('>2sBBI')
+_COUNT = struct.Struct('>H')
+_RECT = struct.Struct('>HHHH')
+_ENCODING = struct.Struct('>BBB')
+_SLOT = struct.Struct('>H')
+_PRESENTED = struct.Struct('>QQ')
+_RUN = np.dtype([('value', 'u1'), ('length', '>u2')])
+MAX_RUN = 0xffff
+HEADER_SIZE = _HEADER.size
+
+
+def pack_header(msg_type, frame_id, ack=False):
+    if ack:
+        msg_type |= FLAG_ACK
+    return _HEADER.pack(MAGIC, VERSION, msg_type, frame_id & 0xffffffff)
+
+
+def pack_presented(frame_id, received_ns, presented_ns):
+    """ The MSG_PRESENTED message the app sends for an acknowledged frame. """
+    return (pack_header(MSG_PRESENTED, frame_id)
+            + _PRESENTED.pack(received_ns, presented_ns))
+
+
+def unpack_presented(message):
+    """
+    Returns (frame id, received ns, presented ns) of a MSG_PRESENTED message,
+    or None for any other message.
+    """
+    if len(message) != HEADER_SIZE + _PRESENTED.size:
+        return None
+    magic, version, msg_type, frame_id = _HEADER.unpack_from(message)
+    if magic != MAGIC or msg_type != MSG_PRESENTED:
+        return None
+    return (frame_id,) + _PRESENTED.unpack_from(message, HEADER_SIZE)
+
+
+def _runs(indices, gap):
+    """ Start and stop of the runs in sorted 'indices' split at gaps > 'gap'. """
+    breaks = np.flatnonzero(np.diff(indices) > gap)
+    starts = indices[np.r_[0, breaks + 1]]
+    stops = indices[np.r_[breaks, indices.size - 1]] + 1
+    return zip(starts.tolist(), stops.tolist())
+
+
+def dirty_rects(previous, current, gap=16, max_rects=256):
+    """
+    Returns a list of (x, y, width, height) rectangles covering every pixel
+    that differs between the frames 'previous' and 'current'.
+
+    Changed rows are grouped into horizontal bands, and the changed columns
+    of each band into rectangles. Runs separated by no more than 'gap'
+    unchanged pixels are merged, since an 8-byte rectangle header costs
+    about as much as three pixels. If more than 'max_rects' rectangles are
+    found, their common bounding box is returned instead.
+    """
+    changed = (previous != current).any(axis=2)
+    rows = np.flatnonzero(changed.any(axis=1))
+    if rows.size == 0:
+        return []
+
+    rects = []
+    for y0, y1 in _runs(rows, gap):
+        cols = np.flatnonzero(changed[y0:y1].any(axis=0))
+        for x0, x1 in _runs(cols, gap):
+            rects.append((x0, y0, x1 - x0, y1 - y0))
+
+    if len(rects) > max_rects:
+        x0 = min(r[0] for r in rects)
+        x1 = max(r[0] + r[2] for r in rects)
+        y0, y1 = int(rows[0]), int(rows[-1]) + 1
+        rects = [(x0, y0, x1 - x0, y1 - y0)]
+    return rects
+
+
+def rle_encode(data):
+    """
+    Run-length encodes the flat uint8 array 'data' into (value, length)
+    runs of 3 bytes each, with runs longer than MAX_RUN split up.
+    """
+    data = data.reshape(-1)
+    if data.size == 0:
+        return b''
+    starts = np.flatnonzero(np.r_[True, data[1:] != data[:-1]])
+    lengths = np.diff(np.r_[starts, data.size])
+    pieces = (lengths + MAX_RUN - 1) // MAX_RUN
+    runs = np.empty(pieces.sum(), dtype=_RUN)
+    runs['value'] = np.repeat(data[starts], pieces)
+    runs['length'] = MAX_RUN
+    runs['length'][np.cumsum(pieces) - 1] = lengths - (pieces - 1) * MAX_RUN
+    return runs.tobytes()
+
+
+def rle_decode(body):
+    runs = np.frombuffer(body, dtype=_RUN)
+    return np.repeat(runs['value'], runs['length'].astype(np.intp))
+
+
+def encode_payload(frame, encodings=ENCODINGS, bandwidth=DEFAULT_BANDWIDTH):
+    """
+    Returns (layout, channel, compression, body) of the cheapest way to send
+    the height x width x 3 uint8 array 'frame' as a MSG_ENCODED message.
+
+    The cost of an encoding is the time it takes to encode plus the time the
+    body spends on the bus at 'bandwidth' bytes per second. LAYOUT_CHANNEL is
+    used whenever at most one channel is non-zero and 'channel8' is allowed.
+    RLE and zlib are skipped when the number of runs in the data shows that
+    they cannot pay off.
+    """
+    layout, channel, data = LAYOUT_RGB, 0, frame.reshape(-1)
+    if 'channel8' in encodings:
+        used = [c for c in range(3) if frame[:, :, c].any()]
+        if len(used) <= 1:
+            layout = LAYOUT_CHANNEL
+            channel = used[0] if used else GREEN
+            data = np.ascontiguousarray(frame[:, :, channel]).reshape(-1)
+
+    best_cost, compression, body = data.nbytes / bandwidth, COMPRESS_NONE, data
+    if 'rle' not in encodings and 'zlib' not in encodings:
+        return layout, channel, compression, body
+
+    # The number of runs tells how compressible the data is at all.
+    num_runs = 1 + np.count_nonzero(data[1:] != data[:-1])
+    if 'rle' in encodings and num_runs * _RUN.itemsize / bandwidth < best_cost:
+        t0 = time.perf_counter()
+        runs = rle_encode(data)
+        cost = time.perf_counter() - t0 + len(runs) / bandwidth
+        if cost < best_cost:
+            best_cost, compression, body = cost, COMPRESS_RLE, runs
+    if ('zlib' in encodings and 4 * num_runs < data.nbytes
+            and best_cost > data.nbytes / ZLIB_SPEED):
+        t0 = time.perf_counter()
+        packed = zlib.compress(data, 1)
+        cost = time.perf_counter() - t0 + len(packed) / bandwidth
+        if cost < best_cost:
+            best_cost, compression, body = cost, COMPRESS_ZLIB, packed
+    return layout, channel, compression, body
+
+
+def decode_payload(layout, channel, compression, body):
+    """ Returns the height x width x 3 frame encoded by encode_payload(). """
+    if compression == COMPRESS_NONE:
+        data = np.frombuffer(body, dtype=np.uint8)
+    elif compression == COMPRESS_RLE:
+        data = rle_decode(body)
+    elif compression == COMPRESS_ZLIB:
+        data = np.frombuffer(zlib.decompress(body), dtype=np.uint8)
+    else:
+        raise ValueError('Unknown compression %d.' % compression)
+
+    if layout == LAYOUT_RGB:
+        return data.reshape(FRAME_SHAPE)
+    if layout == LAYOUT_CHANNEL:
+        frame = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+        frame[:, :, channel] = data.reshape(FRAME_SHAPE[:2])
+        return frame
+    raise ValueError('Unknown layout %d.' % layout)
+
+
+class DeltaEncoder:
+    """
+    Turns a sequence of frames into MSG_DELTA and whole-frame messages.
+
+    The encoder remembers the last frame it encoded. The first frame, and any
+    frame whose delta is larger than the whole frame encoded with the
+    cheapest allowed encoding, is sent whole: as MSG_ENCODED, or as MSG_FULL
+    if 'encodings' only allows 'raw'. Call reset() whenever the app may have
+    lost its state (e.g. after it was restarted) so that the next frame is
+    sent whole.
+
+    encodings: the subset of ENCODINGS the app understands.
+
+    bandwidth: bytes per second assumed when comparing encodings; the bridge
+    updates it with the measured throughput.
+    """
+
+    # Deltas up to this size are sent without trying a whole-frame encoding.
+    SMALL_DELTA = 0x10000
+
+    def __init__(self, gap=16, max_rects=256, encodings=ENCODINGS,
+                 bandwidth=DEFAULT_BANDWIDTH):
+        self.gap = gap
+        self.max_rects = max_rects
+        self.encodings = tuple(encodings)
+        self.bandwidth = bandwidth
+        self.frame_id = 0
+        self._encoder = FrameEncoder()
+        self._previous = None
+
+    def reset(self):
+        self._previous = None
+
+    def encode(self, image, delta=True, ack=False):
+        """
+        Returns the message (bytes) that brings the app from the previously
+        encoded frame to 'image'.
+
+        image: anything accepted by FrameEncoder.encode().
+
+        delta: if False, 'image' is sent whole.
+        ack: if True, the app answers with MSG_PRESENTED once the frame is
+        displayed.
+        """
+        view = self._encoder.encode(image)
+        frame = np.frombuffer(view, dtype=np.uint8).reshape(FRAME_SHAPE)
+        self.frame_id = (self.frame_id + 1) & 0xffffffff
+
+        if self._previous is None or not delta:
+            self._previous = frame.copy()
+            return self._encodeWhole(frame, ack)
+
+        rects = self._dirtyRects(self._previous, frame)
+        delta_size = sum(w * h * 3 + _RECT.size for (_, _, w, h) in rects)
+        if delta_size > self.SMALL_DELTA:
+            whole = self._encodeWhole(frame, ack)
+            if len(whole) <= HEADER_SIZE + _COUNT.size + delta_size:
+                self._previous[...] = frame
+                return whole
+
+        message = bytearray(pack_header(MSG_DELTA, self.frame_id, ack))
+        message += _COUNT.pack(len(rects))
+        for (x, y, w, h) in rects:
+            patch = frame[y:y + h, x:x + w]
+            message += _RECT.pack(x, y, w, h)
+            message += np.ascontiguousarray(patch).data
+            self._previous[y:y + h, x:x + w] = patch
+        if len(message) == FRAME_NUM_BYTES:
+            # The app would take it for a raw frame without header.
+            return self._encodeWhole(frame, ack, ('raw',))
+        return bytes(message)
+
+    def store(self, slot, image):
+        """
+        Returns (message, frame): the MSG_STORE message that puts 'image' into
+        'slot' of the app's frame store, and the encoded height x width x 3
+        frame. The display, and thus the base of the next delta, is unchanged.
+        """
+        view = self._encoder.encode(image)
+        frame = np.frombuffer(view, dtype=np.uint8).reshape(FRAME_SHAPE)
+        self.frame_id = (self.frame_id + 1) & 0xffffffff
+        message = bytearray(pack_header(MSG_STORE, self.frame_id))
+        message += _SLOT.pack(slot)
+        self._appendPayload(message, frame, self.encodings)
+        if len(message) == FRAME_NUM_BYTES:
+            # Uncompressed RGB makes it longer than a raw frame.
+            del message[HEADER_SIZE + _SLOT.size:]
+            self._appendPayload(message, frame, ('raw',))
+        return bytes(message), frame.copy()
+
+    def show(self, slot, frame, ack=False):
+        """
+        Returns the MSG_SHOW message that displays 'slot' of the app's frame
+        store, which holds 'frame' (as returned by store()).
+        """
+        self.frame_id = (self.frame_id + 1) & 0xffffffff
+        if self._previous is None:
+            self._previous = frame.copy()
+        else:
+            self._previous[...] = frame
+        return pack_header(MSG_SHOW, self.frame_id, ack) + _SLOT.pack(slot)
+
+    def _dirtyRects(self, previous, frame):
+        return dirty_rects(previous, frame, self.gap, self.max_rects)
+
+    def _encodeWhole(self, frame, ack=False, encodings=None):
+        if encodings is None:
+            encodings = self.encodings
+        if set(encodings) <= {'raw'}:
+            return pack_header(MSG_FULL, self.frame_id, ack) + frame.tobytes()
+        message = bytearray(pack_header(MSG_ENCODED, self.frame_id, ack))
+        self._appendPayload(message, frame, encodings)
+        if len(message) == FRAME_NUM_BYTES:
+            # The app would take it for a raw frame without header.
+            return self._encodeWhole(frame, ack, ('raw',))
+        return bytes(message)
+
+    def _appendPayload(self, message, frame, encodings):
+        layout, channel, compression, body = encode_payload(
+            frame, encodings, self.bandwidth)
+        message += _ENCODING.pack(layout, channel, compression)
+        message += memoryview(body).cast('B')
+
+
+class FrameCache:
+    """
+    Host-side bookkeeping of the frames resident in the app's frame store.
+
+    Frames are identified by any hashable key chosen by the caller. Each
+    resident frame occupies one of 'capacity' slots; when all slots are
+    taken, the least recently stored or shown frame is evicted.
+    """
+
+    def __init__(self, capacity=8):
+        if not 0 < capacity <= MAX_SLOTS:
+            raise ValueError('capacity must be between 1 and %d.' % MAX_SLOTS)
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()  # key -> (slot, frame)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self):
+        """ Resident keys, from least to most recently used. """
+        return list(self._entries.keys())
+
+    def clear(self):
+        self._entries.clear()
+
+    def lookup(self, key):
+        """ Returns (slot, frame) of a resident key and marks it as used. """
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def allocate(self, key):
+        """
+        Returns (slot, evicted) for storing 'key' and forgets what that slot
+        held until insert() is called: the slot 'key' already has, a free
+        slot, or the slot of the least recently used frame, whose key is
+        returned as 'evicted' (None otherwise).
+        """
+        if key in self._entries:
+            return self._entries.pop(key)[0], None
+        used = set(slot for slot, _ in self._entries.values())
+        for slot in range(self.capacity):
+            if slot not in used:
+                return slot, None
+        evicted, (slot, _) = self._entries.popitem(last=False)
+        return slot, evicted
+
+    def insert(self, key, slot, frame):
+        """ Records that 'frame' was stored into 'slot' under 'key'. """
+        self._entries[key] = (slot, frame)
+
+
+class FrameReceiver:
+    """
+    Python mirror of the app's FrameDecoder: applies messages to 'canvas', a
+    height x width x 3 uint8 array of the frame currently on the display.
+
+    feed() returns the MSG_PRESENTED answer to messages with FLAG_ACK, timed
+    with the host clock, and None otherwise.
+    """
+
+    def __init__(self):
+        self.canvas = np.zeros(FRAME_SHAPE, dtype=np.uint8)
+        self.slots = {}
+        self.frame_id = None
+        self.messages = 0
+
+    def feed(self, payload):
+        received_ns = time.perf_counter_ns()
+        payload = memoryview(payload).cast('B')
+        flat = self.canvas.reshape(-1)
+        self.messages += 1
+
+        if len(payload) == FRAME_NUM_BYTES:  # raw frame without header
+            flat[:] = np.frombuffer(payload, dtype=np.uint8)
+            return
+
+        magic, version, msg_type, frame_id = _HEADER.unpack_from(payload)
+        if magic != MAGIC or version > VERSION:
+            raise ValueError('Unknown message (magic %r, version %d).'
+                             % (magic, version))
+        self.frame_id = frame_id
+        ack = bool(msg_type & FLAG_ACK)
+        msg_type &= ~FLAG_ACK
+
+        if msg_type == MSG_FULL:
+            flat[:] = np.frombuffer(payload, dtype=np.uint8,
+                                    count=FRAME_NUM_BYTES, offset=HEADER_SIZE)
+        elif msg_type == MSG_ENCODED:
+            self.canvas[...] = self._decodeEncoded(payload, HEADER_SIZE)
+        elif msg_type == MSG_STORE:
+            slot, = _SLOT.unpack_from(payload, HEADER_SIZE)
+            if slot >= MAX_SLOTS:
+                raise ValueError('Slot %d out of range.' % slot)
+            self.slots[slot] = self._decodeEncoded(payload,
+                                                   HEADER_SIZE + _SLOT.size)
+            return None  # nothing is displayed, so nothing to acknowledge
+        elif msg_type == MSG_SHOW:
+            slot, = _SLOT.unpack_from(payload, HEADER_SIZE)
+            self.canvas[...] = self.slots[slot]
+        elif msg_type == MSG_DELTA:
+            position = HEADER_SIZE
+            count, = _COUNT.unpack_from(payload, position)
+            position += _COUNT.size
+            for _ in range(count):
+                x, y, w, h = _RECT.unpack_from(payload, position)
+                position += _RECT.size
+                patch = np.frombuffer(payload, dtype=np.uint8,
+                                      count=w * h * 3, offset=position)
+                self.canvas[y:y + h, x:x + w] = patch.reshape(h, w, 3)
+                position += w * h * 3
+        else:
+            raise ValueError('Unknown message type %d.' % msg_type)
+        if ack:
+            return pack_presented(frame_id, received_ns,
+                                  time.perf_counter_ns())
+        return None
+
+    @staticmethod
+    def _decodeEncoded(payload, position):
+        layout, channel, compression = _ENCODING.unpack_from(payload, position)
+        body = payload[position + _ENCODING.size:]
+        return decode_payload(layout, channel, compression, body)
+
+
+class LoopbackEndpoint:
+    """
+    Stand-in for the OUT endpoint of an AndroidOpenAccessoryBridge that
+    hands every length-prefixed message to a FrameReceiver.
+
+    Like the app, it expects the 3 length bytes in a transfer of their own
+    and collects the payload from the transfers that follow. Transfers of
+    any other size in place of a length are ignored (e.g. the close marker).
+    """
+
+    def __init__(self, receiver=None):
+        self.receiver = FrameReceiver() if receiver is None else receiver
+        self.bytes_written = 0
+        self._payload = None
+        self._size = 0
+
+    def write(self, data, timeout=None):
+        data = bytes(data)
+        self.bytes_written += len(data)
+        if self._payload is None:
+            if len(data) == 3:
+                self._size = (data[0] << 16) | (data[1] << 8) | data[2]
+                self._payload = bytearray()
+            return len(data)
+        self._payload += data
+        if len(self._payload) >= self._size:
+            payload, self._payload = self._payload, None
+            self.receiver.feed(payload)
+        return len(data)
+
+
+if __name__ == '__main__':
+    import time
+
+    def send(endpoint, message):
+        size = len(message)
+        endpoint.write(bytes([size >> 16, (size >> 8) & 0xff, size & 0xff]))
+        endpoint.write(message)
+
+    # A 28x28 input expanded 5x and centered, alternating with black frames
+    # as in the MLP notebooks.
+    rng = np.random.default_rng(0)
+    black = np.zeros(FRAME_SHAPE[:2], dtype=np.uint8)
+    frames = []
+    for _ in range(10):
+        digit = rng.integers(0, 256, size=(28, 28), dtype=np.uint8)
+        digit[rng.random((28, 28)) < 0.8] = 0
+        expanded = np.repeat(np.repeat(digit, 5, axis=0), 5, axis=1)
+        frame = black.copy()
+        y0 = (FRAME_SHAPE[0] - expanded.shape[0]) // 2
+        x0 = (FRAME_SHAPE[1] - expanded.shape[1]) // 2
+        frame[y0:y0 + expanded.shape[0], x0:x0 + expanded.shape[1]] = expanded
+        frames += [black, frame]
+
+    encoder = DeltaEncoder()
+    endpoint = LoopbackEndpoint()
+    reference = FrameEncoder()
+    sizes = []
+    t0 = time.perf_counter()
+    for frame in frames:
+        message = encoder.encode(frame)
+        sizes.append(len(message))
+        send(endpoint, message)
+        assert bytes(reference.encode(frame)) == endpoint.receiver.canvas.tobytes()
+    elapsed = time.perf_counter() - t0
+
+    # A delta of exactly FRAME_NUM_BYTES bytes would be taken for a raw frame
+    # by the app: four rectangles covering all but 14 pixels of the frame.
+    (height, width) = FRAME_SHAPE[:2]
+
+    class FixedRects(DeltaEncoder):
+        def _dirtyRects(self, previous, frame):
+            return [(0, 0, width, height - 1), (0, height - 1, 1000, 1),
+                    (1000, height - 1, 60, 1), (1060, height - 1, 6, 1)]
+
+    frame = np.ones(FRAME_SHAPE, dtype=np.uint8)
+    frame[height - 1, 1066:] = 0
+    boundary = FixedRects(encodings=('raw',))
+    boundaryEndpoint = LoopbackEndpoint()
+    send(boundaryEndpoint, boundary.encode(np.zeros(FRAME_SHAPE, dtype=np.uint8)))
+    rects = boundary._dirtyRects(None, frame)
+    assert (HEADER_SIZE + _COUNT.size + sum(w * h * 3 + _RECT.size for (_, _, w, h) in rects)
+            == FRAME_NUM_BYTES)
+    message = boundary.encode(frame)
+    assert len(message) != FRAME_NUM_BYTES
+    send(boundaryEndpoint, message)
+    assert (boundaryEndpoint.receiver.canvas == frame).all()
+
+    print('frames sent               : %d, all reconstructed byte-identical'
+          % len(frames))
+    print('delta of a raw frame size : sent as %d bytes, reconstructed'
+          % len(message))
+    print('first (whole) frame       : %d bytes' % sizes[0])
+    print('delta frames, mean        : %.0f bytes' % np.mean(sizes[1:]))
+    print('reduction vs. raw frames  : x%.0f'
+          % (FRAME_NUM_BYTES / np.mean(sizes[1:])))
+    print('encode + decode time      : %.2f ms/frame'
+          % (1e3 * elapsed / len(frames)))
@@ -10,26 +10,70 @@
 
 from __future__ import print_function, unicode_literals
 
-import array
-import sys
+import collections
 import time
 import usb
 
+import numpy as np
+
+try:
+    from .accessory_transport import AccessoryTransport
+    from .frame_protocol import (DEFAULT_BANDWIDTH, ENCODINGS, DeltaEncoder,
+                                 FrameCache, unpack_presented)
+except ImportError:
+    from accessory_transport import AccessoryTransport
+    from frame_protocol import (DEFAULT_BANDWIDTH, ENCODINGS, DeltaEncoder,
+                                FrameCache, unpack_presented)
+
 
 PIXEL_VENDOR_ID = 0x18d1
 PIXEL_UNCONFIG_ID =  0x4ee7
 PIXEL_CONFIG_ID = 0x2d01
-_B = 'B' if sys.version_info.major == 3 else b'B'
 
 
-class AndroidOpenAccessoryBridge:
+class PresentationStats:
+    """
+    Display latencies of the frames sent with write_and_wait_presented().
+
+    latency keeps, for the last 'history' frames, the time from the call to
+    the arrival of the app's acknowledgement; device_latency the time the
+    app took from receiving the message to presenting the frame. 'missed'
+    counts frames that were not acknowledged in time.
+    """
+
+    def __init__(self, history=1000):
+        self.frames = 0
+        self.missed = 0
+        self.latency = collections.deque(maxlen=history)
+        self.device_latency = collections.deque(maxlen=history)
+
+    def record(self, latency, device_latency):
+        self.frames += 1
+        self.latency.append(latency)
+        self.device_latency.append(device_latency)
+
+    def histogram(self, bins=20, device=False):
+        """ (counts, bin edges in seconds) as returned by numpy.histogram. """
+        values = self.device_latency if device else self.latency
+        return np.histogram(np.asarray(values), bins=bins)
+
+    def percentile(self, q, device=False):
+        """ The q-th percentile of the recorded latencies, in seconds. """
+        values = self.device_latency if device else self.latency
+        return float(np.percentile(np.asarray(values), q))
+
+
+
+class AndroidOpenAccessoryBridge(AccessoryTransport):
 
     def __init__(self,
                  vendor_id, unconfigured_product_id, configured_product_id,
-                 manufacturer, model, description, version, uri, serial):
+                 manufacturer, model, description, version, uri, serial,
+                 encodings=ENCODINGS, cache_slots=8, backend=None):
         self._vendor_id = int(vendor_id)
         self._unconfigured_product_id = int(unconfigured_product_id)
         self._configured_product_id = int(configured_product_id)
+        self._backend = backend  # pyusb backend, None for the default
         self._device = self._configureAndOpenDevice(
             str(manufacturer),
             str(model),
@@ -38,6 +82,10 @@ class AndroidOpenAccessoryBridge:
             str(uri),
             str(serial))
         self._endpoint_out, self._endpoint_in = self._detectEndpoints()
+        self._initTransport()
+        self.presentation = PresentationStats()
+        self._frames = DeltaEncoder(encodings=encodings)
+        self.frame_cache = FrameCache(cache_slots)
 
     def __enter__(self):
         return self  # All 'enter' work is done in __init__().
@@ -47,9 +95,11 @@ class AndroidOpenAccessoryBridge:
 
     def _detectDevice(self, attempts_left=5):
         unconfigured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id)
+            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id,
+            backend=self._backend)
         configured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._configured_product_id)
+            idVendor=self._vendor_id, idProduct=self._configured_product_id,
+            backend=self._backend)
         if not (configured_device is None):
             return configured_device, True
         elif not (unconfigured_device is None):
@@ -111,32 +161,139 @@ class AndroidOpenAccessoryBridge:
         return endpoint_out, endpoint_in
 
     def write(self, data, timeout=None):
-        assert(self._device and self._endpoint_out and data)
-        size = len(data)
-        size_bytes = array.array(_B, [(size & 0x00ff0000) >> 16,
-            (size & 0x0000ff00) >> 8,
-            (size & 0x000000ff)])
-        data_bytes = array.array(_B, data)
+        """
+        Sends 'data' as one length-prefixed message and returns once it has
+        been handed to the endpoint. Frames queued with write_async() are
+        sent first.
+        """
+        self._frames.reset()  # raw data replaces what write_frame() sent
+        self._write(data, timeout)
+
+    def write_async(self, data, timeout=None):
+        """
+        Queues 'data' for the background writer thread and returns as soon as
+        it has been copied into a free frame buffer, so that the next frame
+        can be prepared while this one is on the wire. Blocks only while both
+        frame buffers are in use. Errors of the writer are raised on the next
+        write_async() or flush().
+        """
+        self._frames.reset()
+        self._writeAsync(data, timeout)
+
+    def write_frame(self, image, timeout=None, asynchronous=False,
+                    delta=True):
+        """
+        Displays 'image' (anything accepted by FrameEncoder.encode()) on the
+        ImageStream app. Only the rectangles that changed since the previous
+        write_frame() call are sent (see frame_protocol.py), or the whole
+        frame if that is smaller. Whole frames are sent with the cheapest of
+        the encodings passed to the constructor, judged by the measured
+        throughput of the bridge. Returns the number of payload bytes.
+
+        delta: if False, the whole frame is always sent.
+        """
+        self._frames.bandwidth = self.stats.throughput() or DEFAULT_BANDWIDTH
+        message = self._frames.encode(image, delta)
+        self._writeMessage(message, timeout, asynchronous)
+        return len(message)
+
+    def write_and_wait_presented(self, image, timeout=None, delta=True,
+                                 present_timeout=1.0):
+        """
+        Like write_frame(), but asks the app to acknowledge the frame once it
+        is on the panel and waits for that acknowledgement. Returns the time
+        in seconds from this call to the acknowledgement, or None if none
+        arrived within 'present_timeout' seconds (e.g. with an older app).
+        The latencies are collected in the 'presentation' attribute.
+        """
+        t_submit = time.perf_counter()
+        self._frames.bandwidth = self.stats.throughput() or DEFAULT_BANDWIDTH
+        message = self._frames.encode(image, delta, ack=True)
+        frame_id = self._frames.frame_id
+        self._writeMessage(message, timeout, False)
+        deadline = t_submit + present_timeout
         while True:
-            try:
-                bytes_wrote = self._endpoint_out.write(size_bytes, timeout=timeout)
-            except usb.core.USBError as e:
-                if e.errno == 110:  # Operation timed out
-                    print('here')
-                    continue
-                else:
-                    raise e
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                self.presentation.missed += 1
+                return None
+            reply = self.read(timeout=max(1, int(remaining * 1e3)))
+            presented = reply and unpack_presented(reply)
+            if presented and presented[0] == frame_id:
+                # Acknowledgements of earlier frames that timed out are
+                # skipped.
+                latency = time.perf_counter() - t_submit
+                _, received_ns, presented_ns = presented
+                self.presentation.record(
+                    latency, (presented_ns - received_ns) / 1e9)
+                return latency
+
+    def _writeMessage(self, message, timeout, asynchronous):
+        try:
+            if asynchronous:
+                self._writeAsync(message, timeout)
             else:
-                assert(bytes_wrote == 3)
-                break
-        assert(self._endpoint_out.write(data_bytes, timeout=timeout) == size)
+                self._write(message, timeout)
+        except Exception:
+            self._frames.reset()  # the app may not have the previous frame
+            raise
+
+    def upload_frames(self, frames, timeout=None, replace=False):
+        """
+        Stores frames in the app's frame store without displaying them, so
+        that show_frame() can later display them with a message of a few
+        bytes. Frames that are already resident are skipped unless 'replace'
+        is set. When the store is full, the least recently used frames are
+        evicted. Returns the list of evicted keys.
+
+        frames: a dict or an iterable of (key, image) pairs, where key is any
+        hashable identifier and image anything accepted by
+        FrameEncoder.encode().
+        """
+        if hasattr(frames, 'items'):
+            frames = frames.items()
+        evicted_keys = []
+        self._frames.bandwidth = self.stats.throughput() or DEFAULT_BANDWIDTH
+        for key, image in frames:
+            if key in self.frame_cache and not replace:
+                continue
+            slot, evicted = self.frame_cache.allocate(key)
+            if evicted is not None:
+                evicted_keys.append(evicted)
+            message, frame = self._frames.store(slot, image)
+            self._write(message, timeout)
+            self.frame_cache.insert(key, slot, frame)
+        return evicted_keys
+
+    def show_frame(self, key, timeout=None, asynchronous=False):
+        """
+        Displays the frame uploaded under 'key' with upload_frames(). Raises
+        KeyError if it is not resident in the app's frame store. The next
+        write_frame() sends its changes relative to this frame.
+        """
+        slot, frame = self.frame_cache.lookup(key)
+        self._writeMessage(self._frames.show(slot, frame), timeout,
+                           asynchronous)
+
+    def reset_frames(self):
+        """
+        Sends the next write_frame() in full and forgets the frames uploaded
+        with upload_frames(), e.g. after the app was restarted. write() and
+        write_async() only do the former.
+        """
+        self._frames.reset()
+        self.frame_cache.clear()
 
     def read(self, timeout=None):
+        """
+        Returns the next message sent by the app (bytes), or None if none
+        arrived within 'timeout' milliseconds.
+        """
         assert(self._device and self._endpoint_in)
         try:
-            size_bytes = self._endpoint_in.read(2, timeout=timeout)
+            size_bytes = self._endpoint_in.read(3, timeout=timeout)
             size = (size_bytes[0] << 16) | (size_bytes[1] << 8) | (size_bytes[2])
-            return self._endpoint_in.read(size, timeout=timeout).tostring()
+            return self._endpoint_in.read(size, timeout=timeout).tobytes()
         except usb.core.USBError as e:
             if e.errno == 110:  # Operation timed out.
                 return None
@@ -145,11 +302,12 @@ class AndroidOpenAccessoryBridge:
 
     def close(self):
         assert(self._device and self._endpoint_out)
-        self._endpoint_out.write(array.array(_B, [0, 0]))
+        self._closeTransport()
         usb.util.dispose_resources(self._device)
         self._device = None
         self._endpoint_out = None
         self._endpoint_in = None
+        self._raiseWriterError()
 
 
 if __name__ == '__main__':
@@ -11,9 +11,9 @@
 # Written by Brian Richard, bcr53
 # Last Updated March 2020
 
-import numpy as np
 from PIL import Image
 
+from frame_encoding import FRAME_NUM_BYTES, encode_frame
 from image_stream import AndroidOpenAccessoryBridge as AOAB
 
 PIXEL_VENDOR_ID = 0x18d1
@@ -24,27 +24,11 @@ PIXEL_CONFIG_ID = 0x2d01
 img1 = Image.open('black.png')
 # add second file name here, with extention
 img2 = Image.open('test_digit_0_00003.png')
-array1 = np.array(img1)
-array2 = np.array(img2)
-new_array1 = bytearray()
-new_array2 = bytearray()
+new_array1 = encode_frame(img1)
+new_array2 = encode_frame(img2)
 
-
-for i in range(array1.shape[0]):
-  for j in range(array1.shape[1]):
-    new_array1.append(array1[i, j, 0])
-    new_array1.append(array1[i, j, 1])
-    new_array1.append(array1[i, j, 2])
-
-for i in range(array2.shape[0]):
-  for j in range(array2.shape[1]):
-    new_array2.append(array2[i, j, 0])
-    new_array2.append(array2[i, j, 1])
-    new_array2.append(array2[i, j, 2])
-
-assert(len(new_array1) == 1920*1080*3)
-assert(len(new_array2) == 1920*1080*3)
-print('here')
+assert(len(new_array1) == FRAME_NUM_BYTES)
+assert(len(new_array2) == FRAME_NUM_BYTES)
 
 aoab = AOAB(PIXEL_VENDOR_ID, PIXEL_UNCONFIG_ID, 
   PIXEL_CONFIG_ID,
@@ -0,0 +1,372 @@
+# Accessory Session Daemon
+#
+#  Opening an AndroidOpenAccessoryBridge takes seconds: the phone is looked up
+#  with 1-second retries, switched into accessory mode (or reset) and waited
+#  for again. The daemon below does this once, keeps the bridge open and
+#  serves display requests of any number of Python processes over a Unix
+#  socket, so that a request costs a local round trip instead of a USB
+#  handshake. When the phone drops off the bus, the bridge is reopened in the
+#  background and, failing that, on the next request.
+#
+#  Start one daemon per phone and session:
+#
+#    python accessory_daemon.py stream    # Image Stream app (image_stream.py)
+#    python accessory_daemon.py local     # Image Stream Local app (aoab2.py)
+#
+#  then use an AccessoryClient wherever a script or notebook created an AOAB
+#  object:
+#
+#    aoab = AccessoryClient()
+#    aoab.write(image_bytes)
+#
+#  Each request is a 5-byte header (operation, payload length as a big-endian
+#  uint32) followed by the payload; the daemon answers with a 5-byte header
+#  (status, message length) and an error message if the status is not OK.
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import os
+import socket
+import struct
+import tempfile
+import threading
+import time
+import usb
+
+try:
+    from .Remote_Display.frame_encoding import FRAME_SHAPE, FrameEncoder
+except ImportError:
+    from Remote_Display.frame_encoding import FRAME_SHAPE, FrameEncoder
+
+
+PIXEL_VENDOR_ID = 0x18d1
+PIXEL_UNCONFIG_ID = 0x4ee7
+PIXEL_CONFIG_ID = 0x2d01
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'aoab_daemon.sock')
+
+OP_PING = 0x00
+OP_WRITE = 0x01
+OP_WRITE_FRAME = 0x02  # payload: delta flag (1 byte), then an RGB frame
+OP_RESET_FRAMES = 0x03
+STATUS_OK = 0x00
+STATUS_ERROR = 0x01
+
+_HEADER = struct.Struct('>BI')
+
+# Accessory strings of the two apps; the manufacturer must match the app's
+# accessory_filter.xml.
+APPS = {
+    'stream': dict(manufacturer='ImageStreamManufacturer',
+                   model='ImageStream1',
+                   description='Stream Images to Android',
+                   version=1,
+                   uri='https://github.com/chris-blay/android-open-accessory-bridge',
+                   serial='AoabSerial'),
+    'local': dict(manufacturer='ImageStreamLocal',
+                  model='AoabModel',
+                  description='Display Local Images',
+                  version=1,
+                  uri='https://github.com/chris-blay/android-open-accessory-bridge',
+                  serial='AoabSerial'),
+}
+
+
+def open_bridge(app, backend=None):
+    """
+    Opens the AndroidOpenAccessoryBridge of 'app' ('stream' or 'local'),
+    optionally on a pyusb 'backend' such as fake_usb.FakeBackend.
+    """
+    if app == 'stream':
+        try:
+            from .Remote_Display.image_stream import AndroidOpenAccessoryBridge
+        except ImportError:
+            from Remote_Display.image_stream import AndroidOpenAccessoryBridge
+    elif app == 'local':
+        try:
+            from .aoab2 import AndroidOpenAccessoryBridge
+        except ImportError:
+            from aoab2 import AndroidOpenAccessoryBridge
+    else:
+        raise ValueError('Unknown app %r, expected one of %s.'
+                         % (app, sorted(APPS)))
+    return AndroidOpenAccessoryBridge(PIXEL_VENDOR_ID, PIXEL_UNCONFIG_ID,
+                                      PIXEL_CONFIG_ID, backend=backend,
+                                      **APPS[app])
+
+
+def _recvInto(sock, view):
+    """ Fills 'view' from 'sock'; returns False if the peer closed first. """
+    received = 0
+    while received < len(view):
+        n = sock.recv_into(view[received:])
+        if not n:
+            return False
+        received += n
+    return True
+
+
+class AccessoryDaemon:
+    """
+    Owns one accessory connection and serves AccessoryClient requests.
+
+    Requests of all clients are executed one at a time, in the order they
+    arrive, by the thread of the requesting connection. A request that fails
+    with a USBError closes the bridge, reopens it and is tried once more.
+    The bridge is opened without holding the request lock, so that a
+    reconnection does not block the requests that do not need the phone.
+    """
+
+    def __init__(self, open_bridge, socket_path=DEFAULT_SOCKET,
+                 poll_interval=1.0, device_ids=(PIXEL_VENDOR_ID,
+                                                PIXEL_CONFIG_ID),
+                 backend=None):
+        """
+        open_bridge: callable without arguments returning a new bridge.
+        poll_interval: seconds between checks that the phone is still on the
+        bus, or attempts to reopen the bridge while it is not.
+        device_ids: (vendor id, product id) of the phone in accessory mode.
+        backend: pyusb backend to look for the phone with, None for the
+        default.
+        """
+        self._open_bridge = open_bridge
+        self.socket_path = socket_path
+        self.poll_interval = poll_interval
+        self.device_ids = device_ids
+        self.backend = backend
+        self.requests = 0
+        self.connects = 0
+        self._bridge = None
+        self._lock = threading.Lock()  # guards _bridge and the transfers
+        self._connectLock = threading.Lock()  # one handshake at a time
+        self._stopped = threading.Event()
+        self._server = None
+
+    def serve_forever(self):
+        """ Listens on socket_path until shutdown() is called. """
+        self._removeStaleSocket()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen(16)
+        monitor = threading.Thread(target=self._monitorLoop)
+        monitor.daemon = True
+        monitor.start()
+        try:
+            while not self._stopped.is_set():
+                try:
+                    connection, _ = self._server.accept()
+                except OSError:
+                    break  # closed by shutdown()
+                handler = threading.Thread(target=self._serveClient,
+                                           args=(connection,))
+                handler.daemon = True
+                handler.start()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """ Stops serving and closes the bridge. """
+        self._stopped.set()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+        with self._lock:
+            self._disconnect()
+
+    def _removeStaleSocket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            os.remove(self.socket_path)  # left behind by a dead daemon
+        else:
+            raise OSError('A daemon is already listening on %s.'
+                          % self.socket_path)
+        finally:
+            probe.close()
+
+    def _connect(self):
+        """
+        Opens a bridge if there is none. The handshake runs outside _lock;
+        only the new bridge is swapped in under it.
+        """
+        with self._connectLock:
+            with self._lock:
+                if self._bridge is not None:
+                    return
+            bridge = self._open_bridge()
+            with self._lock:
+                self._bridge = bridge
+                self.connects += 1
+
+    def _disconnect(self):
+        bridge, self._bridge = self._bridge, None
+        if bridge is not None:
+            try:
+                bridge.close()
+            except Exception:
+                pass  # the device is most likely gone already
+
+    def _monitorLoop(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                with self._lock:
+                    connected = self._bridge is not None
+                if not connected:
+                    self._connect()
+                elif usb.core.find(idVendor=self.device_ids[0],
+                                   idProduct=self.device_ids[1],
+                                   backend=self.backend) is None:
+                    with self._lock:
+                        self._disconnect()
+            except Exception as e:
+                # keep monitoring; try again on the next poll
+                print('Accessory monitor: %s: %s' % (type(e).__name__, e))
+
+    def _serveClient(self, connection):
+        header = bytearray(_HEADER.size)
+        payload = bytearray()
+        try:
+            while _recvInto(connection, memoryview(header)):
+                op, size = _HEADER.unpack(header)
+                if len(payload) < size:
+                    payload = bytearray(size)
+                view = memoryview(payload)[:size]
+                if not _recvInto(connection, view):
+                    break
+                try:
+                    self._execute(op, view)
+                except Exception as e:
+                    message = ('%s: %s' % (type(e).__name__, e)).encode('utf-8')
+                    connection.sendall(_HEADER.pack(STATUS_ERROR, len(message))
+                                       + message)
+                else:
+                    connection.sendall(_HEADER.pack(STATUS_OK, 0))
+        except OSError:
+            pass  # client went away
+        finally:
+            connection.close()
+
+    def _execute(self, op, view):
+        with self._lock:
+            self.requests += 1
+        if op == OP_PING:
+            return
+        for attempt in range(2):
+            try:
+                self._connect()
+                with self._lock:
+                    if self._bridge is None:
+                        raise usb.core.USBError('The accessory was disconnected.')
+                    return self._dispatch(op, view)
+            except usb.core.USBError:
+                with self._lock:
+                    self._disconnect()
+                if attempt:
+                    raise
+
+    def _dispatch(self, op, view):
+        if op == OP_WRITE:
+            self._bridge.write(view)
+        elif op == OP_WRITE_FRAME:
+            frame = view[1:].cast('B', FRAME_SHAPE)
+            self._bridge.write_frame(frame, delta=bool(view[0]))
+        elif op == OP_RESET_FRAMES:
+            self._bridge.reset_frames()
+        else:
+            raise ValueError('Unknown operation %d.' % op)
+
+
+class AccessoryClient:
+    """
+    Connection to an AccessoryDaemon with the write methods of the bridge.
+
+    Each call returns once the daemon has handed the data to the phone and
+    raises usb.core.USBError if the daemon could not. The connection stays
+    open until close(), so keep one client per process.
+    """
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(socket_path)
+        self._encoder = None
+        self._reply = bytearray(_HEADER.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def ping(self):
+        """ Returns the round-trip time to the daemon in seconds. """
+        t0 = time.perf_counter()
+        self._request(OP_PING)
+        return time.perf_counter() - t0
+
+    def write(self, data):
+        """ Sends 'data' with the daemon's AndroidOpenAccessoryBridge.write(). """
+        self._request(OP_WRITE, data)
+
+    def write_frame(self, image, delta=True):
+        """
+        Displays 'image' (anything accepted by FrameEncoder.encode()) with the
+        daemon's AndroidOpenAccessoryBridge.write_frame(). The image stream
+        app only.
+        """
+        if self._encoder is None:
+            self._encoder = FrameEncoder()
+        self._request(OP_WRITE_FRAME, self._encoder.encode(image),
+                      flag=int(delta))
+
+    def reset_frames(self):
+        self._request(OP_RESET_FRAMES)
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _request(self, op, payload=b'', flag=None):
+        view = memoryview(payload).cast('B')
+        size = len(view) if flag is None else len(view) + 1
+        header = _HEADER.pack(op, size)
+        if flag is not None:
+            header += bytes([flag])
+        self._socket.sendall(header)
+        if len(view):
+            self._socket.sendall(view)
+        if not _recvInto(self._socket, memoryview(self._reply)):
+            raise usb.core.USBError('Accessory daemon closed the connection')
+        status, size = _HEADER.unpack(self._reply)
+        message = bytearray(size)
+        _recvInto(self._socket, memoryview(message))
+        if status != STATUS_OK:
+            raise usb.core.USBError(message.decode('utf-8'))
+
+
+if __name__ == '__main__':
+    from signal import signal, SIGTERM, SIGINT
+
+    parser = argparse.ArgumentParser(
+        description='Keep an accessory connection open and serve display '
+                    'requests over a Unix socket.')
+    parser.add_argument('app', choices=sorted(APPS))
+    parser.add_argument('--socket', default=DEFAULT_SOCKET)
+    parser.add_argument('--poll-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    daemon = AccessoryDaemon(lambda: open_bridge(args.app), args.socket,
+                             args.poll_interval)
+
+    def signal_handler(signal, frame):
+        daemon.shutdown()
+
+    signal(SIGTERM, signal_handler)
+    signal(SIGINT, signal_handler)
+    print('Serving the %s app on %s' % (args.app, args.socket))
+    daemon.serve_forever()
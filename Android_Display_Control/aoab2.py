@@ -38,10 +38,12 @@ class AndroidOpenAccessoryBridge:
 
     def __init__(self,
                  vendor_id, unconfigured_product_id, configured_product_id,
-                 manufacturer, model, description, version, uri, serial):
+                 manufacturer, model, description, version, uri, serial,
+                 backend=None):
         self._vendor_id = int(vendor_id)
         self._unconfigured_product_id = int(unconfigured_product_id)
         self._configured_product_id = int(configured_product_id)
+        self._backend = backend  # pyusb backend, None for the default
         self._device = self._configureAndOpenDevice(
             str(manufacturer),
             str(model),
@@ -59,9 +61,11 @@ class AndroidOpenAccessoryBridge:
 
     def _detectDevice(self, attempts_left=5):
         unconfigured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id)
+            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id,
+            backend=self._backend)
         configured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._configured_product_id)
+            idVendor=self._vendor_id, idProduct=self._configured_product_id,
+            backend=self._backend)
         if not (configured_device is None):
             return configured_device, True
         elif not (unconfigured_device is None):
@@ -149,7 +153,7 @@ class AndroidOpenAccessoryBridge:
         try:
             size_bytes = self._endpoint_in.read(2, timeout=timeout)
             size = (size_bytes[0] << 8) | size_bytes[1]
-            return self._endpoint_in.read(size, timeout=timeout).tostring()
+            return self._endpoint_in.read(size, timeout=timeout).tobytes()
         except usb.core.USBError as e:
             if e.errno == 110:  # Operation timed out.
                 return None
@@ -4,26 +4,30 @@
 
 from __future__ import print_function, unicode_literals
 
-import array
-import sys
 import time
 import usb
 
+try:
+    from .Remote_Display.accessory_transport import AccessoryTransport
+except ImportError:
+    from Remote_Display.accessory_transport import AccessoryTransport
+
 
 PIXEL_VENDOR_ID = 0x18d1
 PIXEL_UNCONFIG_ID =  0x4ee7
 PIXEL_CONFIG_ID = 0x2d01
-_B = 'B' if sys.version_info.major == 3 else b'B'
 
 
-class AndroidOpenAccessoryBridge:
+class AndroidOpenAccessoryBridge(AccessoryTransport):
 
     def __init__(self,
                  vendor_id, unconfigured_product_id, configured_product_id,
-                 manufacturer, model, description, version, uri, serial):
+                 manufacturer, model, description, version, uri, serial,
+                 backend=None):
         self._vendor_id = int(vendor_id)
         self._unconfigured_product_id = int(unconfigured_product_id)
         self._configured_product_id = int(configured_product_id)
+        self._backend = backend  # pyusb backend, None for the default
         self._device = self._configureAndOpenDevice(
             str(manufacturer),
             str(model),
@@ -32,6 +36,7 @@ class AndroidOpenAccessoryBridge:
             str(uri),
             str(serial))
         self._endpoint_out, self._endpoint_in = self._detectEndpoints()
+        self._initTransport()
 
     def __enter__(self):
         return self  # All 'enter' work is done in __init__().
@@ -41,9 +46,11 @@ class AndroidOpenAccessoryBridge:
 
     def _detectDevice(self, attempts_left=5):
         unconfigured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id)
+            idVendor=self._vendor_id, idProduct=self._unconfigured_product_id,
+            backend=self._backend)
         configured_device = usb.core.find(
-            idVendor=self._vendor_id, idProduct=self._configured_product_id)
+            idVendor=self._vendor_id, idProduct=self._configured_product_id,
+            backend=self._backend)
         if not (configured_device is None):
             return configured_device, True
         elif not (unconfigured_device is None):
@@ -105,33 +112,29 @@ class AndroidOpenAccessoryBridge:
         return endpoint_out, endpoint_in
 
     def write(self, data, timeout=None):
-        assert(self._device and self._endpoint_out and data)
-        size = len(data)
-        size_bytes = array.array(_B, [(size & 0x00ff0000) >> 16,
-            (size & 0x0000ff00) >> 8,
-            (size & 0x000000ff)])
-        data_bytes = array.array(_B, data)
-        while True:
-            try:
-                bytes_wrote = self._endpoint_out.write(size_bytes,
-                                                       timeout=timeout)
-            except usb.core.USBError as e:
-                if e.errno == 110:  # Operation timed out
-                    print('here')
-                    continue
-                else:
-                    raise e
-            else:
-                assert(bytes_wrote == 3)
-                break
-        assert(self._endpoint_out.write(data_bytes, timeout=timeout) == size)
+        """
+        Sends 'data' as one length-prefixed message and returns once it has
+        been handed to the endpoint. Frames queued with write_async() are
+        sent first.
+        """
+        self._write(data, timeout)
+
+    def write_async(self, data, timeout=None):
+        """
+        Queues 'data' for the background writer thread and returns as soon as
+        it has been copied into a free frame buffer, so that the next frame
+        can be prepared while this one is on the wire. Blocks only while both
+        frame buffers are in use. Errors of the writer are raised on the next
+        write_async() or flush().
+        """
+        self._writeAsync(data, timeout)
 
     def read(self, timeout=None):
         assert(self._device and self._endpoint_in)
         try:
-            size_bytes = self._endpoint_in.read(2, timeout=timeout)
+            size_bytes = self._endpoint_in.read(3, timeout=timeout)
             size = (size_bytes[0] << 16) | (size_bytes[1] << 8) | (size_bytes[2])
-            return self._endpoint_in.read(size, timeout=timeout).tostring()
+            return self._endpoint_in.read(size, timeout=timeout).tobytes()
         except usb.core.USBError as e:
             if e.errno == 110:  # Operation timed out.
                 return None
@@ -140,8 +143,9 @@ class AndroidOpenAccessoryBridge:
 
     def close(self):
         assert(self._device and self._endpoint_out)
-        self._endpoint_out.write(array.array(_B, [0, 0]))
+        self._closeTransport()
         usb.util.dispose_resources(self._device)
         self._device = None
         self._endpoint_out = None
-        self._endpoint_in = None
\ No newline at end of file
+        self._endpoint_in = None
+        self._raiseWriterError()
\ No newline at end of file
@@ -0,0 +1,161 @@
+# Benchmark the AndroidOpenAccessoryBridge Variants on a Fake Phone
+#
+#  Runs aoab2.py, aoab3.py and Remote_Display/image_stream.py against the
+#  FakeAccessory of fake_usb.py and reports, per bridge:
+#
+#    handshake    time to open the bridge on a phone that is not yet in
+#                 accessory mode (control requests and re-enumeration)
+#    reconnect    time to open it again once the phone is in accessory mode
+#                 (device reset and settle sleep)
+#    frames/s and MB/s of write(), write_async() and, for image_stream.py,
+#                 write_frame() with the alternating digit/black frames of
+#                 the MLP notebooks
+#
+#  aoab2.py frames are limited to 0xffff bytes by its 2-byte framing; the
+#  other bridges send whole 1920x1080 RGB frames. With --timeout-rate, a
+#  frame cut short by a timeout is dropped and the bridge reopened, as the
+#  accessory daemon does.
+#
+#  Usage: python benchmark_bridges.py [--bandwidth MB/s] [--latency ms]
+#                                     [--timeout-rate p] [--reenumeration s]
+#                                     [--frames N]
+
+from __future__ import print_function, unicode_literals
+
+import argparse
+import time
+
+import numpy as np
+import usb
+
+import aoab2
+import aoab3
+from fake_usb import (FakeAccessory, FakeBackend, PIXEL_CONFIG_ID,
+                      PIXEL_UNCONFIG_ID, PIXEL_VENDOR_ID)
+from Remote_Display import image_stream
+from Remote_Display.frame_encoding import FRAME_NUM_BYTES, FRAME_SHAPE
+
+
+ACCESSORY = dict(manufacturer='ImageStreamManufacturer',
+                 model='ImageStream1',
+                 description='Stream Images to Android',
+                 version=1,
+                 uri='https://github.com/chris-blay/android-open-accessory-bridge',
+                 serial='AoabSerial')
+
+# name, module, length bytes, payload bytes per frame
+BRIDGES = [('aoab2', aoab2, 2, 0xffff),
+           ('aoab3', aoab3, 3, FRAME_NUM_BYTES),
+           ('image_stream', image_stream, 3, FRAME_NUM_BYTES)]
+
+
+def open_bridge(module, backend):
+    t0 = time.perf_counter()
+    bridge = module.AndroidOpenAccessoryBridge(
+        PIXEL_VENDOR_ID, PIXEL_UNCONFIG_ID, PIXEL_CONFIG_ID, backend=backend,
+        **ACCESSORY)
+    return bridge, time.perf_counter() - t0
+
+
+def digit_frames(rng):
+    """ A 140x140 random digit centered in green, then a black frame. """
+    digit = np.zeros(FRAME_SHAPE[:2], dtype=np.uint8)
+    y0, x0 = (FRAME_SHAPE[0] - 140) // 2, (FRAME_SHAPE[1] - 140) // 2
+    digit[y0:y0 + 140, x0:x0 + 140] = np.kron(
+        rng.integers(0, 256, size=(28, 28), dtype=np.uint8),
+        np.ones((5, 5), dtype=np.uint8))
+    black = np.zeros(FRAME_SHAPE[:2], dtype=np.uint8)
+    return [digit, black]
+
+
+def measure(phone, send, frames, finish=None):
+    """ Returns (frames/s, bytes/s on the bus) of 'frames' calls to send(i). """
+    bytes_before = phone.bytes_received
+    t0 = time.perf_counter()
+    for i in range(frames):
+        send(i)
+    if finish is not None:
+        finish()
+    elapsed = time.perf_counter() - t0
+    return frames / elapsed, (phone.bytes_received - bytes_before) / elapsed
+
+
+def benchmark(name, module, framing, size, args):
+    phone = FakeAccessory(framing=framing, latency=args.latency / 1e3,
+                          bandwidth=args.bandwidth * 1e6 or None,
+                          reenumeration_delay=args.reenumeration)
+    backend = FakeBackend(phone)
+    results = []
+
+    bridge, handshake = open_bridge(module, backend)
+    bridge.close()
+    bridge, reconnect = open_bridge(module, backend)
+    results.append(('handshake', '%.3f s' % handshake))
+    results.append(('reconnect', '%.3f s' % reconnect))
+
+    payload = np.random.default_rng(0).integers(0, 256, size=size,
+                                                dtype=np.uint8)
+    data = payload.tobytes() if module is aoab2 else payload
+    bridges = [bridge]
+    dropped = [0]
+
+    def send(call):
+        """ call(bridge), reopening the bridge if a timeout cut it short. """
+        try:
+            call(bridges[0])
+        except usb.core.USBError:
+            dropped[0] += 1
+            try:
+                bridges[0].close()
+            except usb.core.USBError:
+                pass
+            bridges[0], _ = open_bridge(module, backend)
+
+    # Only frames time out; the handshake and close do not.
+    phone.timeout_rate = args.timeout_rate
+    rates = {'write': measure(phone, lambda i: send(lambda b: b.write(data)),
+                              args.frames)}
+    if not args.timeout_rate:
+        assert phone.messages[-1] == payload.tobytes()
+    if hasattr(bridge, 'write_async'):
+        rates['write_async'] = measure(
+            phone, lambda i: send(lambda b: b.write_async(data)), args.frames,
+            lambda: send(lambda b: b.flush()))
+    if hasattr(bridge, 'write_frame'):
+        frames = digit_frames(np.random.default_rng(0))
+        rates['write_frame'] = measure(
+            phone, lambda i: send(lambda b: b.write_frame(frames[i % 2])),
+            args.frames)
+    phone.timeout_rate = 0.0
+    bridges[0].close()
+
+    for mode, (fps, bps) in rates.items():
+        results.append((mode, '%.1f frames/s, %.1f MB/s' % (fps, bps / 1e6)))
+    if phone.timeouts:
+        results.append(('timeouts', '%d, %d frames dropped'
+                        % (phone.timeouts, dropped[0])))
+    for label, value in results:
+        print('%-13s %-12s %s' % (name, label, value))
+    print()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the accessory bridges on a fake phone.')
+    parser.add_argument('--bandwidth', type=float, default=35.0,
+                        help='bus bandwidth in MB/s, 0 for no limit')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='latency per transfer in ms')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='probability of a bulk transfer timing out')
+    parser.add_argument('--reenumeration', type=float, default=0.0,
+                        help='seconds the phone takes to re-enumerate in '
+                             'accessory mode')
+    parser.add_argument('--frames', type=int, default=10)
+    args = parser.parse_args()
+
+    print('bandwidth %s, latency %.2f ms, timeout rate %.3f\n'
+          % ('%.0f MB/s' % args.bandwidth if args.bandwidth else 'unlimited',
+             args.latency, args.timeout_rate))
+    for name, module, framing, size in BRIDGES:
+        benchmark(name, module, framing, size, args)
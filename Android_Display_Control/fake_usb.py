@@ -0,0 +1,316 @@
+# In-Process Stand-In for a Phone Running an Accessory App
+#
+#  FakeBackend is a pyusb backend that presents FakeAccessory devices instead
+#  of real hardware. Pass it to any AndroidOpenAccessoryBridge variant to run
+#  the real bridge code, including pyusb's device and endpoint objects,
+#  without a phone attached:
+#
+#    phone = FakeAccessory(framing=3, bandwidth=35e6)
+#    bridge = AndroidOpenAccessoryBridge(..., backend=FakeBackend(phone))
+#
+#  A FakeAccessory implements the Android Open Accessory handshake (control
+#  requests 51, 52 and 53, after which it re-enumerates with the accessory
+#  product id), parses the OUT stream with the 2-byte (Image Stream Local) or
+#  3-byte (Image Stream) length framing, and models the link: every bulk
+#  transfer takes 'latency' seconds plus its size divided by 'bandwidth',
+#  and transfers can be made to time out or the phone to drop off the bus.
+
+from __future__ import print_function, unicode_literals
+
+import collections
+import errno
+import random
+import threading
+import time
+import usb
+import usb.backend
+
+
+PIXEL_VENDOR_ID = 0x18d1
+PIXEL_UNCONFIG_ID = 0x4ee7
+PIXEL_CONFIG_ID = 0x2d01
+
+AOA_GET_PROTOCOL = 51
+AOA_SEND_STRING = 52
+AOA_START = 53
+AOA_PROTOCOL_VERSION = 2
+
+ENDPOINT_OUT = 0x01
+ENDPOINT_IN = 0x81
+_LIBUSB_ERROR_TIMEOUT = -7
+_LIBUSB_ERROR_NO_DEVICE = -4
+_LIBUSB_ERROR_PIPE = -9
+
+
+class _Descriptor:
+    """ Plain attribute holder standing in for a libusb descriptor. """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+        self.extra_descriptors = []
+
+
+def _timeoutError():
+    return usb.core.USBTimeoutError('Operation timed out',
+                                    _LIBUSB_ERROR_TIMEOUT, errno.ETIMEDOUT)
+
+
+class FakeAccessory:
+    """
+    A phone in the role of an Android accessory device.
+
+    framing: number of length bytes in front of each message, 2 for
+    aoab2.py and 3 for aoab3.py and image_stream.py.
+    bandwidth: bytes per second of bulk transfers, None for no limit.
+    latency: seconds added to every bulk and control transfer.
+    timeout_rate: probability of a bulk transfer timing out.
+    reenumeration_delay: seconds between entering accessory mode and the
+    accessory product id showing up on the bus.
+    on_message: called with every received message (a bytearray). If it
+    returns bytes, they are sent back to the host as a message with the same
+    length framing, as the apps do. Messages are otherwise only counted; the
+    last 'history' are kept in 'messages'.
+    """
+
+    def __init__(self, framing=3, bandwidth=None, latency=0.0,
+                 timeout_rate=0.0, reenumeration_delay=0.0, on_message=None,
+                 history=16, vendor_id=PIXEL_VENDOR_ID,
+                 unconfigured_product_id=PIXEL_UNCONFIG_ID,
+                 configured_product_id=PIXEL_CONFIG_ID, seed=0):
+        if framing not in (2, 3):
+            raise ValueError('framing must be 2 or 3 length bytes.')
+        self.framing = framing
+        self.bandwidth = bandwidth
+        self.latency = latency
+        self.timeout_rate = timeout_rate
+        self.reenumeration_delay = reenumeration_delay
+        self.on_message = on_message
+        self.vendor_id = vendor_id
+        self.unconfigured_product_id = unconfigured_product_id
+        self.configured_product_id = configured_product_id
+        self.plugged = True
+        self.accessory_strings = {}
+        self.messages = collections.deque(maxlen=history)
+        self.num_messages = 0
+        self.bytes_received = 0
+        self.closes = 0
+        self.resets = 0
+        self.timeouts = 0
+        self._accessory_since = None
+        self._forced_timeouts = 0
+        self._random = random.Random(seed)
+        self._payload = None
+        self._received = 0
+        self._in = bytearray()
+        self._in_ready = threading.Condition()
+
+    @property
+    def product_id(self):
+        if (self._accessory_since is not None
+                and time.perf_counter() >= self._accessory_since):
+            return self.configured_product_id
+        return self.unconfigured_product_id
+
+    def inject_timeouts(self, count=1):
+        """ Makes the next 'count' bulk transfers time out. """
+        self._forced_timeouts += count
+
+    def unplug(self):
+        """ Removes the phone from the bus; pending transfers fail. """
+        self.plugged = False
+        self._accessory_since = None
+        self._payload = None
+        with self._in_ready:
+            self._in_ready.notify_all()
+
+    def plug(self):
+        """ Puts the phone back on the bus, out of accessory mode. """
+        self.plugged = True
+
+    def send_to_host(self, data):
+        """ Queues 'data' for bulk reads on the IN endpoint. """
+        with self._in_ready:
+            self._in += data
+            self._in_ready.notify_all()
+
+    def control(self, request_type, request, value, index, data):
+        """ Handles a control transfer; returns bytes written or read. """
+        self._checkPlugged()
+        self._wait(self.latency)
+        if request_type == 0xc0 and request == AOA_GET_PROTOCOL:
+            data[0] = AOA_PROTOCOL_VERSION & 0xff
+            data[1] = AOA_PROTOCOL_VERSION >> 8
+            return 2
+        if request_type == 0x40 and request == AOA_SEND_STRING:
+            self.accessory_strings[index] = data.tobytes().decode('utf-8')
+            return len(data)
+        if request_type == 0x40 and request == AOA_START:
+            self._accessory_since = (time.perf_counter()
+                                     + self.reenumeration_delay)
+            return 0
+        raise usb.core.USBError('Pipe error', _LIBUSB_ERROR_PIPE, errno.EPIPE)
+
+    def bulk_write(self, data, timeout):
+        """ Receives one OUT transfer; 'timeout' is in milliseconds. """
+        self._transfer(len(data), timeout)
+        self.bytes_received += len(data)
+        if self._payload is None:
+            # Like the apps, expect the length in a transfer of its own.
+            size = int.from_bytes(data.tobytes()[:self.framing], 'big')
+            if size == 0:
+                self.closes += 1
+            else:
+                self._payload = bytearray(size)
+                self._received = 0
+            return len(data)
+        n = min(len(data), len(self._payload) - self._received)
+        self._payload[self._received:self._received + n] = memoryview(data)[:n]
+        self._received += n
+        if self._received == len(self._payload):
+            payload, self._payload = self._payload, None
+            self.num_messages += 1
+            self.messages.append(payload)
+            if self.on_message is not None:
+                reply = self.on_message(payload)
+                if reply:
+                    self.send_to_host(
+                        len(reply).to_bytes(self.framing, 'big') + reply)
+        return len(data)
+
+    def bulk_read(self, buff, timeout):
+        """ Fills 'buff' from data queued with send_to_host(). """
+        deadline = time.perf_counter() + (timeout or 0) / 1e3
+        with self._in_ready:
+            while not self._in:
+                self._checkPlugged()
+                remaining = deadline - time.perf_counter()
+                if timeout and remaining <= 0:
+                    raise _timeoutError()
+                self._in_ready.wait(remaining if timeout else None)
+            n = min(len(buff), len(self._in))
+            memoryview(buff)[:n] = self._in[:n]
+            del self._in[:n]
+        return n
+
+    def reset(self):
+        self._checkPlugged()
+        self.resets += 1
+        self._payload = None
+
+    def _checkPlugged(self):
+        if not self.plugged:
+            raise usb.core.USBError('No such device', _LIBUSB_ERROR_NO_DEVICE,
+                                    errno.ENODEV)
+
+    def _transfer(self, size, timeout):
+        self._checkPlugged()
+        duration = self.latency
+        if self.bandwidth:
+            duration += size / self.bandwidth
+        timed_out = self._forced_timeouts > 0 or (
+            self.timeout_rate and self._random.random() < self.timeout_rate)
+        if timeout and duration > timeout / 1e3:
+            timed_out = True
+            duration = timeout / 1e3
+        if timed_out:
+            self._forced_timeouts = max(self._forced_timeouts - 1, 0)
+            self.timeouts += 1
+            self._wait(duration)
+            raise _timeoutError()
+        self._wait(duration)
+        self._checkPlugged()
+
+    @staticmethod
+    def _wait(duration):
+        if duration > 0:
+            time.sleep(duration)
+
+
+class FakeBackend(usb.backend.IBackend):
+    """
+    pyusb backend enumerating FakeAccessory devices, one configuration with
+    one interface and a bulk OUT and IN endpoint each.
+    """
+
+    def __init__(self, *accessories):
+        self.accessories = list(accessories) or [FakeAccessory()]
+
+    def enumerate_devices(self):
+        for accessory in self.accessories:
+            if accessory.plugged:
+                yield accessory
+
+    def get_device_descriptor(self, dev):
+        return _Descriptor(
+            bLength=18, bDescriptorType=1, bcdUSB=0x0200, bDeviceClass=0,
+            bDeviceSubClass=0, bDeviceProtocol=0, bMaxPacketSize0=64,
+            idVendor=dev.vendor_id, idProduct=dev.product_id,
+            bcdDevice=0x0100, iManufacturer=0, iProduct=0, iSerialNumber=0,
+            bNumConfigurations=1,
+            address=self.accessories.index(dev) + 1, bus=1,
+            port_number=None, port_numbers=None, speed=None)
+
+    def get_configuration_descriptor(self, dev, config):
+        return _Descriptor(
+            bLength=9, bDescriptorType=2, wTotalLength=32, bNumInterfaces=1,
+            bConfigurationValue=1, iConfiguration=0, bmAttributes=0x80,
+            bMaxPower=250)
+
+    def get_interface_descriptor(self, dev, intf, alt, config):
+        if intf != 0 or alt != 0:
+            raise IndexError('Invalid interface index %d' % intf)
+        return _Descriptor(
+            bLength=9, bDescriptorType=4, bInterfaceNumber=0,
+            bAlternateSetting=0, bNumEndpoints=2, bInterfaceClass=0xff,
+            bInterfaceSubClass=0xff, bInterfaceProtocol=0, iInterface=0)
+
+    def get_endpoint_descriptor(self, dev, ep, intf, alt, config):
+        if ep > 1:
+            raise IndexError('Invalid endpoint index %d' % ep)
+        return _Descriptor(
+            bLength=7, bDescriptorType=5,
+            bEndpointAddress=(ENDPOINT_OUT, ENDPOINT_IN)[ep],
+            bmAttributes=usb.util.ENDPOINT_TYPE_BULK, wMaxPacketSize=512,
+            bInterval=0, bRefresh=0, bSynchAddress=0)
+
+    def open_device(self, dev):
+        dev._checkPlugged()
+        return dev
+
+    def close_device(self, dev_handle):
+        pass
+
+    def set_configuration(self, dev_handle, config_value):
+        pass
+
+    def get_configuration(self, dev_handle):
+        return 1
+
+    def set_interface_altsetting(self, dev_handle, intf, altsetting):
+        pass
+
+    def claim_interface(self, dev_handle, intf):
+        dev_handle._checkPlugged()
+
+    def release_interface(self, dev_handle, intf):
+        pass
+
+    def bulk_write(self, dev_handle, ep, intf, data, timeout):
+        return dev_handle.bulk_write(data, timeout)
+
+    def bulk_read(self, dev_handle, ep, intf, buff, timeout):
+        return dev_handle.bulk_read(buff, timeout)
+
+    def ctrl_transfer(self, dev_handle, bmRequestType, bRequest, wValue,
+                      wIndex, data, timeout):
+        return dev_handle.control(bmRequestType, bRequest, wValue, wIndex,
+                                  data)
+
+    def clear_halt(self, dev_handle, ep):
+        pass
+
+    def reset_device(self, dev_handle):
+        dev_handle.reset()
+
+    def is_kernel_driver_active(self, dev_handle, intf):
+        return False
@@ -3,34 +3,213 @@
 Created on Sun Dec 06 20:14:02 2015
 
 @author: Sebastien Popoff
+
+SLMdisplay(backend = 'headless') draws into a NumPy framebuffer instead of
+a full screen window and does not need wxPython or a second monitor.
 """
 
 try:
     import wx
 except ImportError:
-    raise ImportError("The wxPython module is required to run this program.")
+    wx = None  # only the headless backend is available
+import collections
+import os
 import threading
+import time
 import numpy as np
 
 
 
 
 
-EVT_NEW_IMAGE = wx.PyEventBinder(wx.NewEventType(), 0)
+if wx is not None:
+    EVT_NEW_IMAGE = wx.PyEventBinder(wx.NewEventType(), 0)
+    _CommandEvent, _Frame = wx.PyCommandEvent, wx.Frame
+else:
+    EVT_NEW_IMAGE = None
+    _CommandEvent = _Frame = object
 
-class ImageEvent(wx.PyCommandEvent):
-    def __init__(self, eventType=EVT_NEW_IMAGE.evtType[0], id=0):
-        wx.PyCommandEvent.__init__(self, eventType, id)
+class ImageEvent(_CommandEvent):
+    def __init__(self, eventType=None, id=0):
+        if wx is not None:
+            if eventType is None:
+                eventType = EVT_NEW_IMAGE.evtType[0]
+            wx.PyCommandEvent.__init__(self, eventType, id)
         self.img = None
         self.color = False
         self.oldImageLock = None
         self.eventLock = None
+        # RGB buffer shared by img, handed back to freeBuffers once drawn
+        self.buffer = None
+        self.freeBuffers = None
+        self.t0 = None
+        # Key of a registered pattern to show instead of img
+        self.key = None
+        # Frame number and PresentationTracker to report the drawing to
+        self.frameId = None
+        self.tracker = None
+        # Set on the wake-up events of a latest-wins display: the frame
+        # draws whatever the mailbox holds instead of this event
+        self.mailbox = None
+
+
+class FrameMailbox:
+    """
+    Single-slot, latest-wins hand-over of image events to the GUI thread.
+
+    put() replaces a frame that has not been drawn yet, which is counted in
+    dropped and its RGB buffer handed back for reuse, so the GUI thread only
+    ever draws the newest frame.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.event = None
+        self.dropped = 0
+
+    def put(self, event):
+        """ Returns True if the slot was empty, i.e. the GUI thread must be woken up. """
+        with self.lock:
+            old, self.event = self.event, event
+            if old is None:
+                return True
+            self.dropped += 1
+        if old.freeBuffers is not None:
+            old.freeBuffers.append(old.buffer)
+        if old.tracker is not None:
+            old.tracker.dropped(old.frameId)
+        return False
+
+    def take(self):
+        with self.lock:
+            event, self.event = self.event, None
+        return event
+
+
+class PresentationTracker:
+    """
+    Presentation times of the frames of a display, as time.perf_counter()
+    timestamps.
+
+    Neither wx nor the headless backend can tell when the panel refreshes, so
+    a frame counts as presented at the first refresh after it was drawn: the
+    next multiple of the refresh period after 'phase' if it is given (e.g. a
+    known vsync timestamp), else one period after the drawing. The times of
+    the last 'history' frames are kept.
+    """
+    def __init__(self, refreshRate = 60.0, phase = None, history = 1000):
+        self.period = 1.0 / refreshRate
+        self.phase = phase
+        self.presentedCount = 0
+        self.lastFrameId = 0
+        self._times = collections.OrderedDict()  # frameId -> time, None if dropped
+        self._history = history
+        self._condition = threading.Condition()
+
+    def presented(self, frameId, drawnTime):
+        if self.phase is None:
+            t = drawnTime + self.period
+        else:
+            t = self.phase + (float(np.floor((drawnTime - self.phase) / self.period)) + 1) * self.period
+        self._record(frameId, t)
+        return t
+
+    def dropped(self, frameId):
+        self._record(frameId, None)
+
+    def _record(self, frameId, t):
+        with self._condition:
+            if t is not None:
+                self.presentedCount += 1
+            self._times[frameId] = t
+            while len(self._times) > self._history:
+                self._times.popitem(last = False)
+            self.lastFrameId = max(self.lastFrameId, frameId)
+            self._condition.notify_all()
+
+    def wait(self, frameId, timeout = None):
+        """
+        Block until frame frameId is on the panel and return its presentation
+        time, or None if it was dropped or timeout seconds passed first.
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: frameId in self._times or
+                                            self.lastFrameId > frameId + self._history,
+                                            timeout):
+                return None
+            t = self._times.get(frameId)
+        if t is not None:
+            delay = t - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        return t
+
+
+class PatternBank:
+    """
+    Ready-to-blit wx.Bitmaps (or, headless, screen-sized RGB arrays) of
+    registered patterns, keyed by any hashable.
+
+    When the bitmaps take more than 'budget' bytes, the least recently shown
+    patterns registered from an image file are evicted, and reloaded from it
+    when shown again. Patterns registered from an array have nothing to be
+    reloaded from and are never evicted, even over budget. Bitmaps are only
+    created and drawn by the GUI thread; the lock protects the bookkeeping
+    shared with callers.
+    """
+    def __init__(self, budget = 1 << 30):
+        self.budget = budget
+        self.size = 0
+        self.lock = threading.Lock()
+        self._bitmaps = collections.OrderedDict()  # key -> (bitmap, bytes)
+        self._paths = {}  # key -> image file, for reloading evicted patterns
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self._bitmaps or key in self._paths
+
+    def resident(self):
+        """ Keys of the bitmaps in memory, least recently shown first. """
+        with self.lock:
+            return list(self._bitmaps.keys())
+
+    def add(self, key, bmp, nbytes, path = None):
+        with self.lock:
+            if key in self._bitmaps:
+                self.size -= self._bitmaps.pop(key)[1]
+            self._paths.pop(key, None)
+            if path is not None:
+                self._paths[key] = path
+            self._bitmaps[key] = (bmp, nbytes)
+            self.size += nbytes
+            # Never evict the pattern just added, nor array-backed ones
+            while self.size > self.budget:
+                evicted = next((k for k in self._bitmaps
+                                if k in self._paths and k != key), None)
+                if evicted is None:
+                    break
+                self.size -= self._bitmaps.pop(evicted)[1]
+
+    def get(self, key):
+        """ Returns the resident bitmap of key, or None. """
+        with self.lock:
+            if key not in self._bitmaps:
+                return None
+            self._bitmaps.move_to_end(key)
+            return self._bitmaps[key][0]
+
+    def path(self, key):
+        """ Returns the image file of key, raising KeyError if it has none. """
+        with self.lock:
+            if key not in self._paths:
+                raise KeyError('Pattern %r is not registered' % (key,))
+            return self._paths[key]
         
         
-class SLMframe(wx.Frame):
+class SLMframe(_Frame):
     """Frame used to display full screen image."""
-    def __init__(self, monitor, isImageLock = True):   
+    def __init__(self, monitor, isImageLock = True, bankBudget = 1 << 30):   
         self.isImageLock = isImageLock
+        self.bank = PatternBank(bankBudget)
         # Create the frame
         #wx.Frame.__init__(self,None,-1,'SLM window',pos = (self._x0, self._y0), size = (self._resX, self._resY)) 
         self.SetMonitor(monitor)
@@ -39,6 +218,8 @@ class SLMframe(wx.Frame):
         self.img = wx.EmptyImage(2,2)
         self.bmp = self.img.ConvertToBitmap()
         self.clientSize = self.GetClientSize()
+        # Seconds from updateArray() to the image being drawn, last 1000 updates
+        self.drawLatency = collections.deque(maxlen=1000)
         # Update the image upon receiving an event EVT_NEW_IMAGE
         self.Bind(EVT_NEW_IMAGE, self.UpdateImage)
         # Set full screen
@@ -46,17 +227,73 @@ class SLMframe(wx.Frame):
         self.SetFocus()
 
     def InitBuffer(self):
+        self.bmp = self.ToBitmap(self.img)
+        self.DrawBuffer()
+
+    def ToBitmap(self, img):
         self.clientSize = self.GetClientSize()
-        self.bmp = self.img.Scale(self.clientSize[0], self.clientSize[1]).ConvertToBitmap()
+        if (img.GetWidth(), img.GetHeight()) == tuple(self.clientSize):
+            # Already the panel resolution, no need to rescale
+            return img.ConvertToBitmap()
+        return img.Scale(self.clientSize[0], self.clientSize[1]).ConvertToBitmap()
+
+    def DrawBuffer(self):
         dc = wx.ClientDC(self)
         dc.DrawBitmap(self.bmp,0,0)
 
-        
+    def RegisterPatterns(self, patterns, done, errors):
+        """
+        Convert (key, RGB array, path) triples into bitmaps of the bank. The
+        array is None for patterns to be loaded from path. An exception is
+        appended to errors for the caller waiting on done to raise.
+        """
+        try:
+            for key, rgb, path in patterns:
+                self.AddPattern(key, rgb, path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def AddPattern(self, key, rgb, path):
+        if rgb is None:
+            img = wx.Image(path)
+        else:
+            img = wx.ImageFromBuffer(width=rgb.shape[1], height=rgb.shape[0], dataBuffer=rgb)
+        bmp = self.ToBitmap(img)
+        self.bank.add(key, bmp, bmp.GetWidth() * bmp.GetHeight() * 4, path)
+        return bmp
+
+    def ShowPattern(self, key):
+        bmp = self.bank.get(key)
+        if bmp is None:
+            # Evicted since show() was called; reload it from its file
+            bmp = self.AddPattern(key, None, self.bank.path(key))
+        self.bmp = bmp
+        self.DrawBuffer()
+
     def UpdateImage(self, event):
+        if event.mailbox is not None:
+            event = event.mailbox.take()
+            if event is None:
+                return
         self.eventLock = event.eventLock
-        self.img = event.img
-        self.InitBuffer()
-        self.ReleaseEventLock()
+        # A failed draw must not leave an isImageLock caller waiting forever
+        try:
+            if event.key is not None:
+                self.ShowPattern(event.key)
+            else:
+                self.img = event.img
+                self.InitBuffer()
+            drawn = time.perf_counter()
+            if event.t0 is not None:
+                self.drawLatency.append(drawn - event.t0)
+            if event.freeBuffers is not None:
+                event.freeBuffers.append(event.buffer)
+            if event.tracker is not None:
+                event.tracker.presented(event.frameId, drawn)
+        finally:
+            self.ReleaseEventLock()
         
     def ReleaseEventLock(self):
         if self.eventLock:
@@ -67,56 +304,447 @@ class SLMframe(wx.Frame):
         if (monitor < 0 or monitor > wx.Display.GetCount()-1):
             raise ValueError('Invalid monitor (monitor %d).' % monitor)
         self._x0, self._y0, self._resX, self._resY = wx.Display(monitor).GetGeometry()
-        
+        # 0 when the driver does not report it
+        self.refreshRate = wx.Display(monitor).GetCurrentMode().refresh or 60
+
+
+class HeadlessFrame:
+    """
+    Stand-in for SLMframe that draws into 'framebuffer', a resY x resX x 3
+    uint8 array, optionally memory-mapped to the file memmapPath.
+
+    Images are drawn synchronously by the calling thread, rescaled with
+    nearest-neighbour sampling if they do not match the resolution. Every
+    drawn frame is counted in frameCount, and the last historyLength ones
+    are kept in history as (time.perf_counter() timestamp, frame copy).
+    """
+    def __init__(self, resolution = (1920, 1152), memmapPath = None,
+                 historyLength = 16, isImageLock = True, bankBudget = 1 << 30,
+                 refreshRate = 60.0):
+        self.isImageLock = isImageLock
+        self.bank = PatternBank(bankBudget)
+        self._x0, self._y0 = 0, 0
+        self._resX, self._resY = resolution
+        shape = (self._resY, self._resX, 3)
+        if memmapPath is None:
+            self.framebuffer = np.zeros(shape, dtype=np.uint8)
+        else:
+            self.framebuffer = np.memmap(memmapPath, dtype=np.uint8, mode='w+', shape=shape)
+        self.frameCount = 0
+        self.history = collections.deque(maxlen=historyLength)
+        self.drawLatency = collections.deque(maxlen=1000)
+        self.eventLock = None
+        # A virtual panel refreshing at refreshRate since its creation
+        self.refreshRate = refreshRate
+        self.vsyncPhase = time.perf_counter()
+
+    def AddPendingEvent(self, event):
+        # There is no event loop; draw right away
+        self.UpdateImage(event)
+
+    def Scale(self, rgb):
+        h, w = rgb.shape[0], rgb.shape[1]
+        if (h, w) == (self._resY, self._resX):
+            return rgb
+        rows = np.arange(self._resY) * h // self._resY
+        cols = np.arange(self._resX) * w // self._resX
+        return rgb[rows[:, np.newaxis], cols]
+
+    def Draw(self, rgb):
+        self.framebuffer[...] = self.Scale(rgb)
+        self.frameCount += 1
+        if self.history.maxlen:
+            self.history.append((time.perf_counter(), self.framebuffer.copy()))
+
+    def RegisterPatterns(self, patterns, done, errors):
+        try:
+            for key, rgb, path in patterns:
+                self.AddPattern(key, rgb, path)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def AddPattern(self, key, rgb, path):
+        if rgb is None:
+            from PIL import Image
+            rgb = np.asarray(Image.open(path).convert('RGB'))
+        frame = np.array(self.Scale(rgb), dtype=np.uint8)
+        self.bank.add(key, frame, frame.nbytes, path)
+        return frame
+
+    def ShowPattern(self, key):
+        frame = self.bank.get(key)
+        if frame is None:
+            frame = self.AddPattern(key, None, self.bank.path(key))
+        self.Draw(frame)
+
+    def UpdateImage(self, event):
+        if event.mailbox is not None:
+            event = event.mailbox.take()
+            if event is None:
+                return
+        self.eventLock = event.eventLock
+        try:
+            if event.key is not None:
+                self.ShowPattern(event.key)
+            else:
+                self.Draw(event.buffer)
+            drawn = time.perf_counter()
+            if event.t0 is not None:
+                self.drawLatency.append(drawn - event.t0)
+            if event.freeBuffers is not None:
+                event.freeBuffers.append(event.buffer)
+            if event.tracker is not None:
+                event.tracker.presented(event.frameId, drawn)
+        finally:
+            self.ReleaseEventLock()
+
+    def ReleaseEventLock(self):
+        if self.eventLock:
+            if self.eventLock.locked():
+                self.eventLock.release()
+
+    def Close(self):
+        if isinstance(self.framebuffer, np.memmap):
+            self.framebuffer.flush()
+
+
+class headlessThread:
+    """Counterpart of videoThread for the headless backend: no thread, no GUI."""
+    def __init__(self, parent):
+        self.parent = parent
+        self.frame = HeadlessFrame(resolution = parent.resolution,
+                                   memmapPath = parent.memmapPath,
+                                   historyLength = parent.historyLength,
+                                   isImageLock = parent.isImageLock,
+                                   bankBudget = parent.bankBudget,
+                                   refreshRate = parent.refreshRate or 60.0)
+
+
+class sharedThread:
+    """Counterpart of videoThread for a frame run by an SLMmanager's loop."""
+    def __init__(self, frame):
+        self.frame = frame
+
 
 class SLMdisplay:
-    """Interface for sending images to the display frame."""
-    def __init__(self ,monitor = 1, isImageLock = False):       
+    """
+    Interface for sending images to the display frame.
+
+    backend: 'wx' for a full screen window on monitor, or 'headless' for an
+    in-memory framebuffer of the given resolution (width, height), exposed
+    as getFramebuffer() and optionally memory-mapped to memmapPath, with the
+    last historyLength frames kept by the frame (see HeadlessFrame).
+
+    isLatestWins: instead of queueing every image for the GUI thread, keep
+    only the newest one not yet drawn (see FrameMailbox); the images it
+    replaces are dropped. updateArray() and show() return a frame number to
+    wait for with waitPresented(), and getCounters() reports how many frames
+    were submitted, presented and dropped. refreshRate is the refresh rate
+    of the panel in Hz, by default the one reported for the monitor (60 if
+    unknown, or headless).
+
+    frame: an SLMframe or HeadlessFrame that is already running, to be
+    driven instead of creating one; used by SLMmanager to share one GUI
+    loop between several windows.
+    """
+    def __init__(self ,monitor = 1, isImageLock = False, bankBudget = 1 << 30,
+                 backend = 'wx', resolution = (1920, 1152), memmapPath = None,
+                 historyLength = 16, isLatestWins = False, refreshRate = None,
+                 frame = None):       
         self.isImageLock = isImageLock            
+        self.isLatestWins = isLatestWins
+        self.refreshRate = refreshRate
         self.monitor = monitor
-        # Create the thread in which the window app will run
-        # It needs its thread to continuously refresh the window
-        self.vt =  videoThread(self)      
+        self.bankBudget = bankBudget
+        self.backend = backend
+        self.resolution = resolution
+        self.memmapPath = memmapPath
+        self.historyLength = historyLength
+        if frame is not None:
+            self.vt = sharedThread(frame)
+        elif backend == 'headless':
+            self.vt = headlessThread(self)
+        elif backend != 'wx':
+            raise ValueError('Invalid backend (%s).' % backend)
+        elif wx is None:
+            raise ImportError("The wxPython module is required to run this program.")
+        else:
+            # Create the thread in which the window app will run
+            # It needs its thread to continuously refresh the window
+            self.vt =  videoThread(self)      
         self.eventLock = threading.Lock()
         if (self.isImageLock):
             self.eventLock = threading.Lock()
+        # RGB buffers that the frame has finished drawing, ready for reuse
+        self._freeBuffers = []
+        # Seconds spent in each updateArray() call, last 1000 updates
+        self.updateLatency = collections.deque(maxlen=1000)
+        self.mailbox = FrameMailbox()
+        self.tracker = PresentationTracker(self.refreshRate or self.vt.frame.refreshRate,
+                                           getattr(self.vt.frame, 'vsyncPhase', None))
+        self._frameId = 0
         
     def getSize(self):
         return self.vt.frame._resX, self.vt.frame._resY
 
+    def getFramebuffer(self):
+        """The headless backend's framebuffer (resY x resX x 3 uint8 array)."""
+        return self.vt.frame.framebuffer
+
     def updateArray(self, array):
         """
         Update the SLM monitor with the supplied array.
         Note that the array is not the same size as the SLM resolution,
         the image will be deformed to fit the screen.
+
+        The array is copied once, into a reused RGB buffer (grayscale arrays
+        are broadcast to the three channels), and is not rescaled if it
+        already matches the screen. The time spent in each call is kept in
+        updateLatency, the time until the image is drawn in the frame's
+        drawLatency.
         """
-        #create a wx.Image from the array
-        h,w = array.shape[0], array.shape[1]
+        return self._post(self._imageEvent(array))
 
-        if len(array.shape) == 2:
-            bw_array = array.copy()
-            bw_array.shape = h, w, 1
-            color_array = np.concatenate((bw_array,bw_array,bw_array), axis=2)
-            data = color_array.tostring()
-        else :      
-            data = array.tostring()   
-        img = wx.ImageFromBuffer(width=w, height=h, dataBuffer=data)
+    def _imageEvent(self, array):
+        t0 = time.perf_counter()
+        #create a wx.Image sharing the memory of an RGB buffer
+        h,w = array.shape[0], array.shape[1]
+        buf = self._getBuffer(h, w)
+        if array.ndim == 2:
+            buf[...] = array[:, :, np.newaxis]
+        else:
+            buf[...] = array[:, :, :3]
         # Create the event
         event = ImageEvent()
-        event.img = img
+        if self.backend == 'wx':
+            event.img = wx.ImageFromBuffer(width=w, height=h, dataBuffer=buf)
+        event.buffer = buf
+        event.freeBuffers = self._freeBuffers
+        event.t0 = t0
+        return event
+
+    def registerPatterns(self, patterns, timeout = 60):
+        """
+        Convert patterns into screen-sized bitmaps once, so that show() only
+        has to draw them. Returns when all of them are ready, raises the
+        error of the first one that could not be converted, or TimeoutError
+        if the GUI thread did not convert them within timeout seconds.
+
+        patterns: dict or iterable of (key, pattern) pairs, where pattern is
+        an array as accepted by updateArray() or the path of an image file
+        (e.g. a BMP of a weight row). Patterns from files are reloaded if
+        they are shown after having been evicted by the memory budget;
+        patterns from arrays are never evicted.
+        """
+        if hasattr(patterns, 'items'):
+            patterns = patterns.items()
+        images = []
+        for key, pattern in patterns:
+            if isinstance(pattern, (str, bytes, os.PathLike)):
+                images.append((key, None, os.fspath(pattern)))
+            else:
+                buf = np.empty((pattern.shape[0], pattern.shape[1], 3), dtype=np.uint8)
+                if pattern.ndim == 2:
+                    buf[...] = pattern[:, :, np.newaxis]
+                else:
+                    buf[...] = pattern[:, :, :3]
+                images.append((key, buf, None))
+        done = threading.Event()
+        errors = []
+        if self.backend == 'wx':
+            # Bitmaps must be created by the GUI thread
+            wx.CallAfter(self.vt.frame.RegisterPatterns, images, done, errors)
+        else:
+            self.vt.frame.RegisterPatterns(images, done, errors)
+        if not done.wait(timeout):
+            raise TimeoutError('Patterns not registered within %s s.' % timeout)
+        if errors:
+            raise errors[0]
+
+    def show(self, key):
+        """
+        Display the pattern registered under key. Raises KeyError if it was
+        never registered.
+        """
+        if key not in self.vt.frame.bank:
+            raise KeyError(key)
+        event = ImageEvent()
+        event.key = key
+        event.t0 = time.perf_counter()
+        return self._post(event)
+
+    def waitPresented(self, frameId = None, timeout = None):
+        """
+        Block until frame frameId (by default the last one submitted) is on
+        the panel and return its presentation time (time.perf_counter()),
+        or None if it was dropped or timeout seconds passed first.
+        """
+        if frameId is None:
+            frameId = self._frameId
+        return self.tracker.wait(frameId, timeout)
+
+    def getCounters(self):
+        """ Numbers of frames submitted, presented and dropped so far. """
+        return dict(submitted = self._frameId,
+                    presented = self.tracker.presentedCount,
+                    dropped = self.mailbox.dropped)
+
+    def _prepare(self, event):
+        self._frameId += 1
+        event.frameId = self._frameId
+        event.tracker = self.tracker
         event.eventLock = self.eventLock
-        
         # Wait for the lock to be released (if isImageLock = True)
         # to be sure that the previous image has been displayed
         # before displaying the next one - it avoids skipping images
         if (self.isImageLock):
             event.eventLock.acquire()
+
+    def _post(self, event):
+        self._prepare(event)
         # Trigger the event (update image)
-        self.vt.frame.AddPendingEvent(event)
+        if not self.isLatestWins:
+            self.vt.frame.AddPendingEvent(event)
+        elif self.mailbox.put(event):
+            # The GUI thread takes the newest image when it gets to the wake-up
+            wake = ImageEvent()
+            wake.mailbox = self.mailbox
+            self.vt.frame.AddPendingEvent(wake)
+        self.updateLatency.append(time.perf_counter() - event.t0)
+        return event.frameId
+
+    def _getBuffer(self, h, w):
+        # A buffer stays with its event until the frame has drawn it, so
+        # there are as many buffers as updates in flight.
+        while self._freeBuffers:
+            buf = self._freeBuffers.pop()
+            if buf.shape[:2] == (h, w):
+                return buf
+        return np.empty((h, w, 3), dtype=np.uint8)
         
     def close(self):
         self.vt.frame.Close()
 
+
+class SLMmanager:
+    """
+    Several SLM windows, one per monitor, driven by a single GUI loop.
+
+    wx allows one wx.App per process, so instead of one SLMdisplay (and
+    videoThread) per monitor, the manager runs one thread creating all the
+    frames and exposes an SLMdisplay per window as manager[i], which
+    accepts every SLMdisplay call (updateArray, show, waitPresented, ...).
+    updateArrays() updates several windows at once: the images of all of
+    them are drawn by the same GUI callback, with no other update in
+    between.
+
+    monitors: the monitor of each window. The other arguments are those of
+    SLMdisplay and apply to every window, except that resolutions and
+    memmapPaths hold one entry per window for the headless backend (a
+    single resolution is used for all of them).
+    """
+    def __init__(self, monitors = (1, 2), isImageLock = False, bankBudget = 1 << 30,
+                 backend = 'wx', resolutions = (1920, 1152), memmapPaths = None,
+                 historyLength = 16, isLatestWins = False, refreshRate = None):
+        self.monitors = list(monitors)
+        self.isImageLock = isImageLock
+        self.bankBudget = bankBudget
+        self.backend = backend
+        if np.ndim(resolutions) == 1:
+            resolutions = [resolutions] * len(self.monitors)
+        if memmapPaths is None:
+            memmapPaths = [None] * len(self.monitors)
+        if backend == 'headless':
+            frames = [HeadlessFrame(resolution = tuple(resolution),
+                                    memmapPath = memmapPath,
+                                    historyLength = historyLength,
+                                    isImageLock = isImageLock,
+                                    bankBudget = bankBudget,
+                                    refreshRate = refreshRate or 60.0)
+                      for resolution, memmapPath in zip(resolutions, memmapPaths)]
+            # Virtual panels refreshing together
+            for frame in frames:
+                frame.vsyncPhase = frames[0].vsyncPhase
+        elif backend != 'wx':
+            raise ValueError('Invalid backend (%s).' % backend)
+        elif wx is None:
+            raise ImportError("The wxPython module is required to run this program.")
+        else:
+            self.vt = multiVideoThread(self)
+            frames = self.vt.frames
+        self.displays = [SLMdisplay(monitor = monitor, isImageLock = isImageLock,
+                                    bankBudget = bankBudget, backend = backend,
+                                    resolution = tuple(resolution),
+                                    memmapPath = memmapPath,
+                                    historyLength = historyLength,
+                                    isLatestWins = isLatestWins,
+                                    refreshRate = refreshRate, frame = frame)
+                         for monitor, resolution, memmapPath, frame
+                         in zip(self.monitors, resolutions, memmapPaths, frames)]
+
+    def __len__(self):
+        return len(self.displays)
+
+    def __getitem__(self, index):
+        return self.displays[index]
+
+    def updateArray(self, index, array):
+        """ Update window index only; same as self[index].updateArray(array). """
+        return self.displays[index].updateArray(array)
+
+    def updateArrays(self, arrays):
+        """
+        Update several windows at once with one array each, either a
+        sequence in window order or a dict {window index: array}. Returns
+        the frame numbers of the windows, in the same form, to be waited for
+        with waitPresented().
+
+        The updates are never dropped, even with isLatestWins.
+        """
+        items = list(arrays.items()) if hasattr(arrays, 'items') else list(enumerate(arrays))
+        displays = [self.displays[index] for index, _ in items]
+        # Copy every image before taking any lock, so that the GUI thread
+        # keeps drawing the previous ones in the meantime
+        events = [display._imageEvent(array) for display, (_, array) in zip(displays, items)]
+        for display, event in zip(displays, events):
+            display._prepare(event)
+        frames = [display.vt.frame for display in displays]
+        if self.backend == 'wx':
+            wx.CallAfter(self._drawAll, frames, events)
+        else:
+            self._drawAll(frames, events)
+        for display, event in zip(displays, events):
+            display.updateLatency.append(time.perf_counter() - event.t0)
+        frameIds = [event.frameId for event in events]
+        if hasattr(arrays, 'items'):
+            return dict(zip([index for index, _ in items], frameIds))
+        return frameIds
+
+    def waitPresented(self, frameIds, timeout = None):
+        """
+        Block until the frames returned by updateArrays() are all on their
+        panels; returns their presentation times in the same form (None for
+        the ones dropped or not presented within timeout seconds).
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        def wait(index, frameId):
+            remaining = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            return self.displays[index].waitPresented(frameId, remaining)
+        if hasattr(frameIds, 'items'):
+            return dict((index, wait(index, frameId)) for index, frameId in frameIds.items())
+        return [wait(index, frameId) for index, frameId in enumerate(frameIds)]
+
+    @staticmethod
+    def _drawAll(frames, events):
+        for frame, event in zip(frames, events):
+            frame.UpdateImage(event)
+
+    def close(self):
+        for display in self.displays:
+            display.close()
+
 class videoThread(threading.Thread):
     """Run the MainLoop as a thread. Access the frame with self.frame."""
     def __init__(self, parent,autoStart=True):
@@ -133,7 +761,8 @@ class videoThread(threading.Thread):
             self.start() #automatically start thread on init
     def run(self):
         app = wx.App()
-        frame = SLMframe(monitor = self.parent.monitor, isImageLock = self.parent.isImageLock)
+        frame = SLMframe(monitor = self.parent.monitor, isImageLock = self.parent.isImageLock,
+                         bankBudget = self.parent.bankBudget)
         frame.Show(True)
         self.frame = frame
         self.lock.release()
@@ -144,3 +773,24 @@ class videoThread(threading.Thread):
         self.start_orig()
         # Use lock to wait for the functions to get defined
         self.lock.acquire()
+
+
+class multiVideoThread(videoThread):
+    """Run the MainLoop of all the frames of an SLMmanager, in self.frames."""
+    def __init__(self, parent, autoStart=True):
+        self.frames = None #to be defined in self.run
+        videoThread.__init__(self, parent, autoStart)
+
+    def run(self):
+        app = wx.App()
+        frames = []
+        for monitor in self.parent.monitors:
+            frame = SLMframe(monitor = monitor, isImageLock = self.parent.isImageLock,
+                             bankBudget = self.parent.bankBudget)
+            frame.Show(True)
+            frames.append(frame)
+        self.frames = frames
+        self.frame = frames[0]
+        self.lock.release()
+        # Start GUI main loop
+        app.MainLoop()
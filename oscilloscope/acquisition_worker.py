@@ -0,0 +1,160 @@
+"""
+Background acquisition from an Agilent54845A into a preallocated ring buffer.
+
+The worker thread keeps reading waveforms while the main thread prepares and
+displays the next patterns. Every waveform is tagged with its time stamp and
+the frame ID set with set_frame() when it was acquired, and consumers take the
+waveforms of a frame by its ID:
+
+    worker = AcquisitionWorker(oscope).start()
+    for n, pattern in enumerate(patterns):
+        slm.waitPresented(slm.updateArray(pattern))
+        worker.set_frame(n)
+        next_pattern = prepare(...)     # overlaps with the acquisition
+        waves, times = worker.get_frame(n,count=50)
+    worker.stop()
+
+While the worker runs, the oscilloscope must not be used by other threads.
+"""
+import threading
+import time
+import numpy as np
+
+
+class AcquisitionWorker:
+    def __init__(self,oscope,capacity=4096,points=None,segments=1,
+                 reducer=None):
+        """
+        Parameters:
+        -----------
+        oscope                              Agilent54845A to acquire from.
+        capacity                            Waveforms kept in the ring buffer;
+                                            the oldest are overwritten.
+        points                              Samples per waveform, queried from
+                                            the scope if None.
+        segments                            Waveforms per acquisition, taken
+                                            with get_segments if more than 1.
+        reducer                             TraceReducer fed with the waveforms
+                                            of every frame, keyed by frame ID,
+                                            as they arrive.
+        """
+        self.oscope = oscope
+        self.capacity = capacity
+        self.segments = segments
+        self.reducer = reducer
+        if points is None:
+            points = oscope.get_num_points()
+        self.waves = np.empty((capacity,points))
+        self.timestamps = np.empty(capacity)
+        self.frame_ids = np.full(capacity,-1,dtype=np.int64)
+        self.count = 0 # waveforms written since the start
+        self.discarded = 0 # waveforms acquired without a frame or across a change
+        self._frame_id = None
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._error = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self,type,value,traceback):
+        self.stop()
+
+    def start(self):
+        with self._condition:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run)
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the worker after its current acquisition. """
+        with self._condition:
+            self._stopped.set()
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._raise()
+
+    def set_frame(self,frame_id):
+        """
+        Tags the waveforms acquired from now on with frame_id (an integer), or
+        discards them if frame_id is None, e.g. while the display changes.
+        Waveforms whose acquisition started before the call are not tagged
+        with frame_id.
+        """
+        with self._condition:
+            self._frame_id = frame_id
+            # Wakes the get_frame() calls waiting for the previous frame
+            self._condition.notify_all()
+
+    def get_frame(self,frame_id,count=None,timeout=None):
+        """
+        Returns the waveforms of frame_id still in the ring buffer, in the
+        order they were acquired, as a (waveforms, points) array and their
+        time.perf_counter() time stamps. If count is given, waits until at
+        least count waveforms of the frame are available (or timeout seconds
+        passed) and returns the first count. It does not wait if the worker
+        is not running or frame_id is not the current frame, since no more
+        waveforms of the frame will come, and then returns what is left.
+        """
+        def available():
+            self._raise()
+            return self._indices(frame_id)
+        def done():
+            return (len(available()) >= count or not self._running()
+                    or frame_id != self._frame_id)
+        with self._condition:
+            if count is not None:
+                self._condition.wait_for(done,timeout)
+            indices = available()[:count]
+            return self.waves[indices], self.timestamps[indices]
+
+    def latest(self,count=1):
+        """ Returns the last count waveforms, time stamps and frame IDs. """
+        with self._condition:
+            indices = np.arange(max(self.count - count,0),self.count) % self.capacity
+            return self.waves[indices], self.timestamps[indices], self.frame_ids[indices]
+
+    def _running(self):
+        return self._thread is not None and not self._stopped.is_set()
+
+    def _indices(self,frame_id):
+        order = np.arange(max(self.count - self.capacity,0),self.count) % self.capacity
+        return order[self.frame_ids[order] == frame_id]
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                frame_id = self._frame_id
+                t0 = time.perf_counter()
+                if self.segments > 1:
+                    waves, times = self.oscope.get_segments(self.segments)
+                    times = t0 + times
+                else:
+                    waves, times = self.oscope.get_waveform()[np.newaxis], [t0]
+                with self._condition:
+                    if frame_id is None or frame_id != self._frame_id:
+                        self.discarded += len(waves)
+                        continue
+                    indices = (self.count + np.arange(len(waves))) % self.capacity
+                    self.waves[indices] = waves
+                    self.timestamps[indices] = times
+                    self.frame_ids[indices] = frame_id
+                    self.count += len(waves)
+                    self._condition.notify_all()
+                if self.reducer is not None:
+                    self.reducer.add(frame_id,waves)
+        except Exception as error:
+            with self._condition:
+                self._error = error
+                self._stopped.set()
+                self._condition.notify_all()
@@ -1,15 +1,44 @@
-import visa
+try:
+    import pyvisa as visa
+except ImportError:
+    import visa
+import time
 import numpy as np
 
+# WAV:DATA? sample types of the binary waveform formats
+BINARY_DATATYPES = {"BYTE" : "b", "WORD" : "h"}
+# Full scale vertical range in volts
+MAX_RANGE = 16
+# Magnitude of the values the scope returns for clipped samples
+CLIPPED = 9.9e37
+
+class AutoscaleError(Exception):
+    pass
+
 class Agilent54845A:
-    def __init__(self,instrument,chan_num=1):
+    def __init__(self,instrument,chan_num=1,waveform_format="ASCII"):
         """
         Default constructor only requires direct access to the underlyign visa
         handler. See the method fromResourceManager for a more user-friendly way
         of constructing the class.
+
+        waveform_format selects how get_waveform transfers samples, see
+        set_waveform_format.
+
+        The vertical range and offset, time range and units are queried once
+        and then kept in a local model of the scope state. The set_*, recenter
+        and autoscale methods drop the values they change, which the scope may
+        have clamped or rounded, so that they are queried again when next
+        needed. Call sync_state after changing settings in any other way (e.g.
+        instrument.write, or the front panel).
         """
         self.channel_num = chan_num
         self.instrument = instrument
+        self.waveform_format = "ASCII"
+        self._preambles = {}
+        self._state = {}
+        if waveform_format != "ASCII":
+            self.set_waveform_format(waveform_format)
 
     @classmethod
     def fromResourceManager(cls,resource_manager,device_type="GPIB"):
@@ -38,20 +67,41 @@ class Agilent54845A:
 
         return cls(instrument)
 
+    def _cached(self,key,query):
+        if key not in self._state:
+            self._state[key] = query()
+        return self._state[key]
+
+    def sync_state(self):
+        """
+        Queries the range, offset, time range and units of the scope again and
+        returns them.
+        """
+        self._state = {}
+        self._preambles = {}
+        return {'x_range' : self.get_xrange(), 'x_units' : self.get_xunits(),
+                'y_range' : self.get_yrange(), 'y_units' : self.get_yunits(),
+                'offset' : self.get_offset()}
+
     def get_xrange(self):
-        return self.instrument.query_ascii_values("WAV:XRAN?")[0]
+        return self._cached('x_range',
+                            lambda: self.instrument.query_ascii_values("WAV:XRAN?")[0])
 
     def get_xunits(self):
-        return self.instrument.query("WAV:XUN?").rstrip('\n')
+        return self._cached('x_units',
+                            lambda: self.instrument.query("WAV:XUN?").rstrip('\n'))
 
     def get_yrange(self):
-        return self.instrument.query_ascii_values("WAV:YRAN?")[0]
+        return self._cached('y_range',
+                            lambda: self.instrument.query_ascii_values("WAV:YRAN?")[0])
 
     def get_yunits(self):
-        return self.instrument.query("WAV:YUN?").rstrip('\n')
+        return self._cached('y_units',
+                            lambda: self.instrument.query("WAV:YUN?").rstrip('\n'))
 
     def get_offset(self):
-        return self.instrument.query_ascii_values("CHAN%d:OFFS?" % self.channel_num)[0]
+        return self._cached('offset',
+                            lambda: self.instrument.query_ascii_values("CHAN%d:OFFS?" % self.channel_num)[0])
 
     def get_bottom_bound(self):
         """ Gets the voltage at the bottom of the scope window. """
@@ -65,15 +115,27 @@ class Agilent54845A:
         """ Sets the center of the window of the scope. """
         offset_command = "CHAN%d:OFFS " % self.channel_num
         self.instrument.write(offset_command + str(value))
+        self._state.pop('offset',None)
+        self._preambles.pop(self.channel_num,None)
 
     def set_range(self,value):
         """ Sets the total vertical range of the scope. """
         range_command = "CHAN%d:RANG " % self.channel_num
         self.instrument.write(range_command + str(value))
+        self._state.pop('y_range',None)
+        self._preambles.pop(self.channel_num,None)
+
+    def set_time_range(self,value):
+        """ Sets the total horizontal range of the scope, in seconds. """
+        self.instrument.write("TIM:RANG " + str(value))
+        self._state.pop('x_range',None)
+        self._preambles = {}
 
     def recenter(self):
         v_average = self.instrument.query_ascii_values("MEAS:VAV?")[0]
         self.instrument.write("CHAN" + str(self.channel_num) + ":OFFS " + str(v_average))
+        self._state.pop('offset',None)
+        self._preambles.pop(self.channel_num,None)
 
     def scope_autoscale(self):
         """
@@ -81,6 +143,8 @@ class Agilent54845A:
         values of the ranges after doing the autoscale.
         """
         self.instrument.write("AUT")
+        self._state = {}
+        self._preambles = {}
 
         # return range of x,y values after doing auto scale
         return {'x' : [self.get_xrange(), self.get_xunits()],
@@ -94,13 +158,69 @@ class Agilent54845A:
         self.recenter()
         self.recenter() # twice needed in case signal was out of range the first time.
 
-    def autoscale(self):
+    def autoscale(self,fast=True):
         """
         Auto scaling function to find the optimal window for a given signal.
+
+        With fast=True, uses fast_autoscale and falls back on the measurement
+        based rescale only if it does not settle. Returns the report of
+        fast_autoscale, or None after the fallback.
         """
+        if fast:
+            try:
+                return self.fast_autoscale()
+            except AutoscaleError:
+                pass
         self.reset_window()
         self.rescale(True)
 
+    def fast_autoscale(self,num_waveforms=4,sigmas=5,max_steps=6):
+        """
+        Fits the window to the signal from the statistics of a few waveforms,
+        computed on the host. While the signal is clipped, the window is
+        zoomed out around its average; once it fits, the window is set to the
+        average +/- the largest deviation seen, including 'sigmas' standard
+        deviations of the waveforms' extremes, and checked on new waveforms.
+
+        Parameters:
+        -----------
+        num_waveforms                       Waveforms taken at every step.
+        sigmas                              Margin for fluctuations of the
+                                            extremes, in standard deviations.
+        max_steps                           Raises AutoscaleError if the window
+                                            does not settle in that many steps.
+
+        Returns a dict with the number of steps, the time taken in seconds,
+        and the final range and offset.
+        """
+        t0 = time.perf_counter()
+        for step in range(1,max_steps + 1):
+            waves = np.array([self.read_waveform() for _ in range(num_waveforms)])
+            if not self.within_bounds(waves):
+                # clipped: go to full scale around the samples still in the window
+                valid = waves[np.abs(waves) < CLIPPED]
+                if valid.size:
+                    self.set_offset(valid.mean())
+                else:
+                    self.set_offset(self.get_offset() + np.sign(waves.mean())*self.get_yrange())
+                self.set_range(MAX_RANGE)
+                continue
+            v_av = waves.mean()
+            v_max, v_min = waves.max(axis=1), waves.min(axis=1)
+            v_amp = max(v_max.max() - v_av, v_av - v_min.min(),
+                        np.abs(v_max.mean() - v_av) + sigmas*np.sqrt(2)*v_max.std(),
+                        np.abs(v_min.mean() - v_av) + sigmas*np.sqrt(2)*v_min.std())
+            # the scope cannot zoom further on high voltage signals
+            rmin = 0.8 if v_av > 1.0 else 0.064
+            new_range = min(max(2*v_amp,rmin),MAX_RANGE)
+            if new_range > self.get_yrange()/2:
+                # less than a factor 2 to gain, the window fits
+                return {'steps' : step, 'time' : time.perf_counter() - t0,
+                        'y_range' : self.get_yrange(), 'offset' : self.get_offset()}
+            self.set_offset(v_av)
+            self.set_range(new_range)
+        raise AutoscaleError("Window did not settle in %d steps." % max_steps)
+
     def rescale(self,quick_scale=True):
         """
         Rescales the window based on measurements on signal iteratively as best it
@@ -201,6 +321,79 @@ class Agilent54845A:
         """
         self.channel_num = channel_num
         self.instrument.write("WAV:SOUR CHAN %d" % channel_num)
+        # range, offset and units are those of the new source
+        self._state = dict((key, value) for key, value in self._state.items()
+                           if key.startswith('x_'))
+
+    def set_waveform_format(self,waveform_format):
+        """
+        Parameters
+        ----------
+        waveform_format                 "ASCII" to transfer samples as text in
+                                        volts, or "WORD"/"BYTE" to transfer the
+                                        16/8-bit digitizer codes as a binary
+                                        block, converted to volts on the host
+                                        with the scaling of the preamble.
+        """
+        waveform_format = waveform_format.upper()
+        if waveform_format != "ASCII" and waveform_format not in BINARY_DATATYPES:
+            raise ValueError("Unsupported waveform format " + waveform_format)
+        self.instrument.write("WAV:FORM " + waveform_format)
+        if waveform_format in BINARY_DATATYPES:
+            self.instrument.write("WAV:BYT MSBF")
+        self.waveform_format = waveform_format
+        self._preambles = {}
+
+    def get_preamble(self):
+        """
+        Returns the scaling of the waveform data of the current source as a
+        dict with the x/y increment, origin and reference of the preamble.
+        The preamble of every source is queried once and kept until its
+        window, the time base or the format changes.
+        """
+        if self.channel_num not in self._preambles:
+            fields = self.instrument.query("WAV:PRE?").split(",")
+            self._preambles[self.channel_num] = {"points" : int(float(fields[2])),
+                              "x_increment" : float(fields[4]),
+                              "x_origin" : float(fields[5]),
+                              "x_reference" : float(fields[6]),
+                              "y_increment" : float(fields[7]),
+                              "y_origin" : float(fields[8]),
+                              "y_reference" : float(fields[9])}
+        return self._preambles[self.channel_num]
+
+    def get_raw_waveform(self):
+        """
+        Returns the digitizer codes of the current waveform (binary formats
+        only) as an int8/int16 array.
+        """
+        return self.instrument.query_binary_values("WAV:DATA?",
+                    datatype=BINARY_DATATYPES[self.waveform_format],
+                    is_big_endian=True,container=np.array)
+
+    def to_volts(self,codes):
+        """
+        Converts digitizer codes into volts with the cached preamble. Clipped
+        samples (the extreme codes) become +/-inf, like the values beyond
+        +/-CLIPPED of the ASCII format, so that they fail bounds checks.
+        """
+        preamble = self.get_preamble()
+        volts = codes - preamble["y_reference"]
+        volts *= preamble["y_increment"]
+        volts += preamble["y_origin"]
+        limits = np.iinfo(codes.dtype)
+        volts[codes == limits.max] = np.inf
+        volts[codes == limits.min] = -np.inf
+        return volts
+
+    def read_waveform(self):
+        """
+        Returns the waveform currently measured by the oscilloscope, in volts,
+        without checking it against the window bounds.
+        """
+        if self.waveform_format == "ASCII":
+            return self.instrument.query_ascii_values("WAV:DATA?",container = np.array)
+        return self.to_volts(self.get_raw_waveform())
 
     def enable_header_data(self):
         self.instrument.write("SYST:HEAD ON")
@@ -208,21 +401,120 @@ class Agilent54845A:
     def disable_header_data(self):
         self.instrument.write("SYST:HEAD OFF")
 
-    def get_waveform(self):
+    def get_waveform(self,max_attempts=3):
         """
         Main data-taking function. Grabs the waveform currently measured by
         oscilloscope while checking that the waveform is currently within window
-        bounds. If not, will automatically autoscale.
+        bounds. If not, will automatically autoscale, up to max_attempts times.
         """
-        num_attempts = 0
-        while True:
-            wave = self.instrument.query_ascii_values("WAV:DATA?",container = np.array)
-            within_bounds = (wave < self.get_top_bound()).all() and (wave > self.get_bottom_bound()).all()
-            if within_bounds:
+        for _ in range(max_attempts):
+            wave = self.read_waveform()
+            if self.within_bounds(wave):
                 return wave
             else:
                 self.autoscale()
-                num_attempts += 1
+        raise Exception("Waveform out of window bounds after %d autoscales." % max_attempts)
+
+    def within_bounds(self,wave):
+        """ True if all samples of wave lie strictly inside the scope window. """
+        return (wave < self.get_top_bound()).all() and (wave > self.get_bottom_bound()).all()
+
+    def get_segments(self,num_segments,max_attempts=3):
+        """
+        Acquires num_segments triggers in segmented memory and transfers them
+        all at once. Returns a (num_segments, points) array of volts and the
+        trigger times of the segments in seconds, relative to the first one.
+        If any segment leaves the window bounds, autoscales and acquires all
+        segments again, up to max_attempts times.
+
+        Requires the segmented memory acquisition mode (ACQ:MODE SEGM). The
+        scope is set back to real time acquisition and running afterwards, and
+        while autoscaling, so that the window is fitted to live waveforms
+        rather than to the segments already in memory.
+        """
+        try:
+            for _ in range(max_attempts):
+                self.instrument.write("ACQ:MODE SEGM")
+                self.instrument.write("ACQ:SEGM:COUN %d" % num_segments)
+                self.instrument.write("WAV:SEGM:ALL ON")
+                self.instrument.write("DIG")
+                waves = self.read_waveform().reshape(num_segments,-1)
+                if self.within_bounds(waves):
+                    times = self.instrument.query_ascii_values("WAV:SEGM:XLIS? TTAG",
+                                                               container=np.array)
+                    return waves, times
+                self._stop_segments()
+                self.autoscale()
+        finally:
+            self._stop_segments()
+        raise Exception("Segments out of window bounds after %d autoscales." % max_attempts)
+
+    def _stop_segments(self):
+        """ Back to real time acquisition of one waveform, running. """
+        self.instrument.write("WAV:SEGM:ALL OFF")
+        self.instrument.write("ACQ:MODE RTIM")
+        self.instrument.write("RUN")
+
+    def get_displayed_channels(self):
+        """ Returns the numbers of the channels turned on, among 1 to 4. """
+        return [num for num in range(1,5)
+                if int(self.instrument.query_ascii_values("CHAN%d:DISP?" % num)[0])]
+
+    def get_channels(self,channels=None,max_attempts=3):
+        """
+        Acquires all channels from the same trigger (DIG CHAN1,CHAN2,...) and
+        reads their waveforms one after another, only switching the waveform
+        source in between. Returns a (channels, points) array of volts and
+        the timing shared by all channels: a dict with the points, the x
+        increment, origin and reference of the preamble, and 'time', the
+        time.perf_counter() when the acquisition was triggered.
+
+        Parameters:
+        -----------
+        channels                            Channel numbers to read, in the
+                                            order of the rows; the displayed
+                                            channels if None.
+        max_attempts                        If a channel is clipped, it is
+                                            autoscaled and all channels are
+                                            acquired again, up to max_attempts
+                                            times.
+
+        The scope is left running, with the waveform source it had before.
+        """
+        if channels is None:
+            channels = self.get_displayed_channels()
+        source = self.channel_num
+        autoscaled = False
+        try:
+            for _ in range(max_attempts):
+                t0 = time.perf_counter()
+                self.instrument.write("DIG " + ",".join("CHAN%d" % num for num in channels))
+                waves = []
+                for num in channels:
+                    if num != self.channel_num:
+                        self.instrument.write("WAV:SOUR CHAN %d" % num)
+                        self.channel_num = num
+                    waves.append(self.read_waveform())
+                waves = np.array(waves)
+                clipped = ~(np.abs(waves) < CLIPPED).all(axis=1)
+                if not clipped.any():
+                    timing = dict((key, value) for key, value in self.get_preamble().items()
+                                  if key.startswith('x_') or key == 'points')
+                    timing['time'] = t0
+                    return waves, timing
+                self.instrument.write("RUN")
+                for num in np.array(channels)[clipped]:
+                    self.set_waveform_source(int(num))
+                    self.autoscale()
+                autoscaled = True
+        finally:
+            self.instrument.write("RUN")
+            if autoscaled:
+                self.set_waveform_source(source)
+            elif self.channel_num != source:
+                self.instrument.write("WAV:SOUR CHAN %d" % source)
+                self.channel_num = source
+        raise Exception("Channels out of window bounds after %d autoscales." % max_attempts)
 
 
     def get_num_points(self):
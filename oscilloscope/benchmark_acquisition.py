@@ -0,0 +1,172 @@
+"""
+Benchmarks of Agilent54845A acquisition on SimulatedAgilent54845A.
+
+    formats     time per get_waveform() call and bus bytes per trace for the
+                ASCII, WORD and BYTE formats; checks that the binary formats
+                give the same volts as ASCII up to their quantization step
+    commands    commands sent per get_waveform() call and per oscope_info()
+                of the notebooks, with the local model of the scope state
+    segments    the repeats loop of the notebooks (get_waveform() per trace)
+                against one get_segments() call
+    channels    four channels read with set_waveform_source() and
+                get_waveform() each, against one get_channels() call on a
+                single trigger
+    autoscale   fast_autoscale() from a badly set window, and the measurement
+                based reset_window() + rescale() with --rescale (it waits 8 s
+                for statistics at every step)
+
+Usage: python benchmark_acquisition.py [benchmark ...] [--traces N]
+                                       [--latency ms] [--bandwidth kB/s]
+                                       [--command-time ms] [--rescale]
+"""
+import argparse
+import time
+import numpy as np
+
+try:
+    from .agilent54845A import Agilent54845A
+    from .simulated_agilent54845A import SimulatedAgilent54845A
+except ImportError:
+    from agilent54845A import Agilent54845A
+    from simulated_agilent54845A import SimulatedAgilent54845A
+
+
+def make_scope(args,waveform_format="WORD"):
+    scope = SimulatedAgilent54845A(latency=args.latency/1e3,
+                                   bandwidth=args.bandwidth*1e3 or None,
+                                   command_time=args.command_time/1e3)
+    return scope, Agilent54845A(scope,waveform_format=waveform_format)
+
+
+def oscope_info(oscope):
+    """ The scope state saved with the data by the notebooks. """
+    return {"ID" : oscope.id(),
+            "x_range" : oscope.get_xrange(), "x_unit" : oscope.get_xunits(),
+            "y_range" : oscope.get_yrange(), "y_unit" : oscope.get_yunits(),
+            "y_offset" : oscope.get_offset(),
+            "y_bounds" : [oscope.get_bottom_bound(),oscope.get_top_bound()]}
+
+
+def benchmark_formats(args):
+    results = {}
+    for waveform_format in ("ASCII","WORD","BYTE"):
+        scope, oscope = make_scope(args,waveform_format)
+        oscope.get_waveform() # preamble and first-call costs
+        bytes_before = scope.bytes_transferred
+        t0 = time.perf_counter()
+        traces = [oscope.get_waveform() for _ in range(args.traces)]
+        elapsed = time.perf_counter() - t0
+        results[waveform_format] = np.array(traces)
+        print("%-6s %8.2f ms/trace %8.0f bytes/trace"
+              % (waveform_format,1e3*elapsed/args.traces,
+                 (scope.bytes_transferred - bytes_before)/args.traces))
+
+    # Same seed, so the same traces up to quantization
+    for waveform_format, step in (("WORD",6.0/2**16),("BYTE",6.0/2**8)):
+        error = np.abs(results[waveform_format] - results["ASCII"]).max()
+        assert error <= step, (waveform_format,error)
+
+
+def benchmark_commands(args):
+    scope, oscope = make_scope(args)
+    for name, call in (("oscope_info",lambda: oscope_info(oscope)),
+                       ("get_waveform",oscope.get_waveform)):
+        for label in ("first","then"):
+            before = scope.num_commands
+            call()
+            print("%-12s %-6s %3d commands" % (name,label,scope.num_commands - before))
+    before = scope.num_commands
+    oscope.sync_state()
+    print("%-12s %-6s %3d commands" % ("sync_state","",scope.num_commands - before))
+
+
+def benchmark_segments(args):
+    for name in ("get_waveform","get_segments"):
+        scope, oscope = make_scope(args)
+        oscope.get_waveform()
+        t0 = time.perf_counter()
+        if name == "get_waveform":
+            waves = np.array([oscope.get_waveform() for _ in range(args.traces)])
+        else:
+            waves, _ = oscope.get_segments(args.traces)
+        elapsed = time.perf_counter() - t0
+        assert waves.shape == (args.traces,scope.points)
+        print("%-12s %8.2f ms/trace" % (name,1e3*elapsed/args.traces))
+
+
+def benchmark_channels(args):
+    channels = [1,2,3,4]
+    for name in ("get_waveform","get_channels"):
+        scope, oscope = make_scope(args)
+        for num in channels:
+            oscope.set_waveform_source(num)
+            oscope.get_waveform()
+        oscope.set_waveform_source(1)
+        before = scope.num_commands
+        t0 = time.perf_counter()
+        for _ in range(args.traces):
+            if name == "get_waveform":
+                waves = []
+                for num in channels:
+                    oscope.set_waveform_source(num)
+                    waves.append(oscope.get_waveform())
+                oscope.set_waveform_source(1)
+                waves = np.array(waves)
+            else:
+                waves, _ = oscope.get_channels(channels)
+        elapsed = time.perf_counter() - t0
+        assert waves.shape == (len(channels),scope.points)
+        print("%-12s %8.2f ms/shot %5.1f commands/shot"
+              % (name,1e3*elapsed/args.traces,
+                 (scope.num_commands - before)/args.traces))
+
+
+def benchmark_autoscale(args):
+    methods = ["fast_autoscale"] + (["rescale"] if args.rescale else [])
+    for method in methods:
+        for y_range, offset in ((0.01,3.0),(16,0.0),(0.2,0.5)):
+            scope, oscope = make_scope(args)
+            oscope.set_range(y_range)
+            oscope.set_offset(offset)
+            t0 = time.perf_counter()
+            if method == "fast_autoscale":
+                oscope.fast_autoscale()
+            else:
+                oscope.autoscale(fast=False)
+            elapsed = time.perf_counter() - t0
+            assert oscope.within_bounds(oscope.read_waveform())
+            print("%-14s from %5.2f V at %4.1f V: %6.3f s -> %5.3f V at %5.3f V"
+                  % (method,y_range,offset,elapsed,oscope.get_yrange(),
+                     oscope.get_offset()))
+
+
+BENCHMARKS = {"formats" : benchmark_formats,
+              "commands" : benchmark_commands,
+              "segments" : benchmark_segments,
+              "channels" : benchmark_channels,
+              "autoscale" : benchmark_autoscale}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark Agilent54845A acquisition on a simulated scope.")
+    parser.add_argument("benchmarks",nargs="*",
+                        help="benchmarks to run among %s, all by default"
+                             % ", ".join(BENCHMARKS))
+    parser.add_argument("--traces",type=int,default=50)
+    parser.add_argument("--latency",type=float,default=2.0,
+                        help="bus latency per transfer in ms")
+    parser.add_argument("--bandwidth",type=float,default=400.0,
+                        help="bus bandwidth in kB/s, 0 for no limit")
+    parser.add_argument("--command-time",type=float,default=0.0,
+                        help="instrument time per command in ms")
+    parser.add_argument("--rescale",action="store_true",
+                        help="also time the measurement based rescale")
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+    for name in args.benchmarks or BENCHMARKS:
+        print("== %s" % name)
+        BENCHMARKS[name](args)
+        print()
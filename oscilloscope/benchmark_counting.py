@@ -0,0 +1,48 @@
+"""
+Benchmark of PhotonCounter on synthetic MPPC pulse trains.
+
+Traces come from SimulatedAgilent54845A.traces, which also returns the true
+number of fired pixels of every trace. For every mean number of pulses per
+trace, reports the throughput of each detection method in traces per second
+and the bias (absolute and relative to the true mean) and spread of the counts
+against the truth.
+
+Usage: python benchmark_counting.py [--traces N] [--pulses n [n ...]]
+"""
+import argparse
+import time
+import numpy as np
+
+try:
+    from .photon_counting import PhotonCounter
+    from .simulated_agilent54845A import SimulatedAgilent54845A
+except ImportError:
+    from photon_counting import PhotonCounter
+    from simulated_agilent54845A import SimulatedAgilent54845A
+
+
+def benchmark(args):
+    print("%7s %-10s %12s %8s %8s %8s" % ("pulses","method","traces/s","bias","bias %","rms"))
+    for pulses in args.pulses:
+        scope = SimulatedAgilent54845A(pulse_rate=pulses/1e-4,seed=1)
+        waves, truth = scope.traces(args.traces,return_pixels=True)
+        for method in ("threshold","derivative"):
+            counter = PhotonCounter(pulse_height=scope.pulse_height,method=method)
+            counter.count(waves[:10])
+            t0 = time.perf_counter()
+            counts = counter.count(waves)
+            elapsed = time.perf_counter() - t0
+            error = counts - truth
+            print("%7.1f %-10s %12.0f %8.3f %8.1f %8.3f"
+                  % (pulses,method,len(waves)/elapsed,error.mean(),
+                     100*error.mean()/max(truth.mean(),1e-9),
+                     np.sqrt((error**2).mean())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark MPPC photon counting on synthetic traces.")
+    parser.add_argument("--traces",type=int,default=10000)
+    parser.add_argument("--pulses",type=float,nargs="+",default=[0.5,2,10,20],
+                        help="mean pulses per trace")
+    benchmark(parser.parse_args())
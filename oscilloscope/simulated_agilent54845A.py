@@ -0,0 +1,405 @@
+"""
+Stand-in for the VISA resource of an Agilent 54845A, so that Agilent54845A
+can be run without the instrument:
+
+    oscope = Agilent54845A(SimulatedAgilent54845A())
+
+or, through the usual constructor, with a SimulatedResourceManager in place
+of pyvisa's:
+
+    oscope = Agilent54845A.fromResourceManager(SimulatedResourceManager())
+
+The simulated scope answers the SCPI commands used by Agilent54845A (channel
+window and display, time base, waveform format, source and data, preamble, segmented
+memory, measurements with statistics and autoscale) with synthetic MPPC
+traces: a noisy baseline with a pulse for every detected photon or dark
+count, each with the gain spread and optical crosstalk of a multi-pixel
+photon counter.
+
+Every command is charged a bus cost, a fixed latency plus the transfer time
+of the bytes sent and received at the given bus bandwidth, and an
+instrument cost, command_time plus any entry of command_costs. The
+query_*_values methods parse the replies with pyvisa's own routines, so the
+host side costs the same as on a real resource.
+"""
+import time
+import numpy as np
+from pyvisa import util
+
+# WAV:FORM codes, as reported in the first field of WAV:PRE?
+FORMATS = {"ASC" : 0, "BYTE" : 1, "WORD" : 2}
+# Digitizer codes spanning the vertical range, per binary format
+CODE_SPAN = {"BYTE" : 2**8, "WORD" : 2**16}
+# ASCII value of clipped samples
+CLIPPED = 9.99999e37
+# Seconds the instrument spends on slow commands
+COMMAND_COSTS = {"AUT" : 1.0, "*RST" : 0.5}
+# Measurement names of MEAS:RES?, by command
+MEASUREMENTS = {"VMAX" : "V MAX", "VMIN" : "V MIN", "VAV" : "V AVG"}
+
+
+class SimulatedAgilent54845A:
+    def __init__(self,points=1004,time_range=1e-4,offset=2.0,y_range=6.0,
+                 baseline=0.5,noise=0.005,pulse_rate=2e5,pulse_height=0.1,
+                 pulse_tau=2e-6,rise_tau=2e-7,gain_spread=0.1,crosstalk=0.05,
+                 dark_rate=0.0,trigger_rate=1e3,latency=2e-3,bandwidth=4e5,
+                 command_time=0.0,command_costs=None,seed=0):
+        """
+        Parameters:
+        -----------
+        points                              Samples per waveform.
+        time_range                          Full horizontal scale in seconds.
+        offset, y_range                     Initial vertical window of the
+                                            four channels, in volts.
+        baseline, noise                     Signal level without pulses and
+                                            standard deviation of its noise.
+        pulse_rate, dark_rate               Mean detected photons and dark
+                                            counts per second.
+        pulse_height                        Amplitude (V) of a single photon
+                                            pulse, varying by gain_spread
+                                            (relative standard deviation).
+        crosstalk                           Probability that a fired pixel
+                                            fires a neighbour as well.
+        rise_tau, pulse_tau                 Rise and decay times (s) of a
+                                            pulse.
+        trigger_rate                        Mean triggers per second, which
+                                            paces segmented acquisitions and
+                                            measurement statistics.
+        latency                             Bus seconds charged per transfer.
+        bandwidth                           Bus bytes per second, None for no
+                                            limit.
+        command_time                        Instrument seconds per command.
+        command_costs                       Extra instrument seconds per
+                                            command header, COMMAND_COSTS by
+                                            default.
+        """
+        self.points = points
+        self.time_range = time_range
+        self.channels = dict((num, {"offset" : offset, "range" : y_range,
+                                    "display" : num == 1}) for num in range(1,5))
+        self.source = 1
+        self.format = "ASC"
+        self.big_endian = True
+        self.header = False
+        self.baseline = baseline
+        self.noise = noise
+        self.pulse_rate = pulse_rate
+        self.dark_rate = dark_rate
+        self.pulse_height = pulse_height
+        self.gain_spread = gain_spread
+        self.crosstalk = crosstalk
+        self.rise_tau = rise_tau
+        self.pulse_tau = pulse_tau
+        self.trigger_rate = trigger_rate
+        self.acquisition_mode = "RTIM"
+        self.segment_count = 1
+        self.segmented_all = False
+        self._segments = {}
+        self._time_tags = None
+        self.measurements = []
+        self.statistics = False
+        self._measure_since = time.perf_counter()
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.command_time = command_time
+        self.command_costs = (dict(COMMAND_COSTS) if command_costs is None
+                              else command_costs)
+        self.timeout = 6000
+        self.num_commands = 0
+        self.bytes_transferred = 0
+        self._rng = np.random.default_rng(seed)
+        self._reply = b""
+
+    # VISA resource interface ----------------------------------------------
+
+    def write(self,command):
+        self.num_commands += 1
+        self._charge(len(command) + 1)
+        self._reply = self._execute(command.strip())
+
+    def read_raw(self):
+        reply, self._reply = self._reply, b""
+        self._charge(len(reply))
+        return reply
+
+    def read(self):
+        return self.read_raw().decode("ascii")
+
+    def query(self,command):
+        self.write(command)
+        return self.read()
+
+    def query_ascii_values(self,command,converter="f",separator=",",
+                           container=list):
+        return util.from_ascii_block(self.query(command),converter,separator,
+                                     container)
+
+    def query_binary_values(self,command,datatype="f",is_big_endian=False,
+                            container=list,header_fmt="ieee",
+                            expect_termination=True):
+        self.write(command)
+        block = self.read_raw()
+        if expect_termination:
+            block = block[:-1]
+        return util.from_ieee_block(block,datatype,is_big_endian,container)
+
+    def close(self):
+        pass
+
+    # Instrument -----------------------------------------------------------
+
+    def _charge(self,num_bytes):
+        self.bytes_transferred += num_bytes
+        duration = self.latency
+        if self.bandwidth:
+            duration += num_bytes/self.bandwidth
+        if duration > 0:
+            time.sleep(duration)
+
+    def _execute(self,command):
+        header, _, argument = command.partition(" ")
+        header = header.upper()
+        cost = self.command_time + self.command_costs.get(header,0.0)
+        if cost > 0:
+            time.sleep(cost)
+        channel = self._channel(self.source)
+        if header == "*IDN?":
+            return b"AGILENT TECHNOLOGIES,54845A,SIM00000,A.04.50\n"
+        if header == "*RST":
+            self.__init__(**self._settings())
+        elif header.startswith("CHAN"):
+            num, _, setting = header[4:].partition(":")
+            channel = self._channel(int(num))
+            if setting.startswith("DISP"):
+                if setting.endswith("?"):
+                    return b"%d\n" % channel["display"]
+                channel["display"] = argument.upper() in ("ON","1")
+                return b""
+            key = "offset" if setting.startswith("OFFS") else "range"
+            if setting.endswith("?"):
+                return self._ascii([channel[key]])
+            channel[key] = float(argument)
+        elif header == "SYST:HEAD":
+            self.header = argument.upper() in ("ON","1")
+        elif header == "WAV:SOUR":
+            self.source = int(argument.split()[-1].upper().replace("CHAN",""))
+        elif header == "WAV:FORM":
+            self.format = argument.upper()[:4].rstrip("I")
+        elif header == "WAV:BYT":
+            self.big_endian = argument.upper().startswith("MSBF")
+        elif header == "WAV:POIN?":
+            return self._ascii([self.points])
+        elif header in ("WAV:XRAN?","TIM:RANG?"):
+            return self._ascii([self.time_range])
+        elif header == "TIM:RANG":
+            self.time_range = float(argument)
+        elif header == "WAV:XUN?":
+            return b"SECOND\n"
+        elif header == "WAV:YUN?":
+            return b"VOLT\n"
+        elif header == "WAV:YRAN?":
+            return self._ascii([channel["range"]])
+        elif header == "ACQ:MODE":
+            self.acquisition_mode = argument.upper()[:4]
+        elif header == "ACQ:SEGM:COUN":
+            self.segment_count = int(argument)
+        elif header == "WAV:SEGM:ALL":
+            self.segmented_all = argument.upper() in ("ON","1")
+        elif header == "DIG":
+            self._digitize(argument)
+        elif header == "RUN":
+            self._segments = {}
+        elif header == "WAV:SEGM:XLIS?":
+            return self._ascii(self._time_tags)
+        elif header == "WAV:PRE?":
+            return self._preamble(channel)
+        elif header == "WAV:DATA?":
+            return self._data(channel)
+        elif header == "AUT":
+            self._autoscale()
+        elif header.startswith("MEAS:"):
+            return self._measure(header[5:],argument)
+        else:
+            raise ValueError("Unsupported command: " + command)
+        return b""
+
+    def _settings(self):
+        return dict(points=self.points,time_range=self.time_range,
+                    baseline=self.baseline,noise=self.noise,
+                    pulse_rate=self.pulse_rate,pulse_height=self.pulse_height,
+                    pulse_tau=self.pulse_tau,rise_tau=self.rise_tau,
+                    gain_spread=self.gain_spread,crosstalk=self.crosstalk,
+                    dark_rate=self.dark_rate,trigger_rate=self.trigger_rate,
+                    latency=self.latency,bandwidth=self.bandwidth,
+                    command_time=self.command_time,
+                    command_costs=self.command_costs)
+
+    def _channel(self,num):
+        if num not in self.channels:
+            raise ValueError("No channel %d" % num)
+        return self.channels[num]
+
+    def _ascii(self,values):
+        return (",".join("%+.6E" % value for value in values) + "\n").encode()
+
+    def _scale(self,channel):
+        """ Returns (y increment, y origin) of the current binary format. """
+        span = CODE_SPAN.get(self.format,CODE_SPAN["WORD"])
+        return channel["range"]/span, channel["offset"]
+
+    def _preamble(self,channel):
+        y_increment, y_origin = self._scale(channel)
+        x_increment = self.time_range/self.points
+        fields = [FORMATS[self.format], 1, self.points, 1,
+                  "%+.6E" % x_increment, "%+.6E" % (-self.time_range/2), 0,
+                  "%+.6E" % y_increment, "%+.6E" % y_origin, 0,
+                  1, "%+.6E" % self.time_range, "%+.6E" % (-self.time_range/2),
+                  "%+.6E" % channel["range"], "%+.6E" % channel["offset"],
+                  '"1 JAN 2000"', '"00:00:00:00"', '"54845A:SIM00000"',
+                  2, 100, 2, 1, "+2.0E+09", "+0.0E+00"]
+        return (",".join(str(field) for field in fields) + "\n").encode()
+
+    def traces(self,count,return_pixels=False):
+        """
+        count new waveforms in volts, before digitizing, as a (count, points)
+        array, and with return_pixels the number of pixels fired in each.
+        """
+        waves = self.baseline + self.noise*self._rng.standard_normal((count,self.points))
+        # Primary avalanches (photons and dark counts) per waveform, each
+        # firing 1 + crosstalk pixels
+        rate = (self.pulse_rate + self.dark_rate)*self.time_range
+        fired = self._rng.poisson(rate,count)
+        num_pulses = fired.sum()
+        if num_pulses == 0:
+            return (waves, np.zeros(count,dtype=int)) if return_pixels else waves
+        pixels = self._rng.geometric(1 - self.crosstalk,num_pulses)
+        heights = self.pulse_height*pixels*(1 + self.gain_spread*self._rng.standard_normal(num_pulses))
+        # An impulse at the arrival sample of every pulse, shaped by convolution
+        impulses = np.zeros((count,self.points))
+        rows = np.repeat(np.arange(count),fired)
+        cols = self._rng.integers(0,self.points,num_pulses)
+        np.add.at(impulses,(rows,cols),heights)
+        t = np.arange(self.points)*(self.time_range/self.points)
+        shape = np.exp(-t/self.pulse_tau) - np.exp(-t/self.rise_tau)
+        shape /= shape.max()
+        n = 2*self.points
+        waves += np.fft.irfft(np.fft.rfft(impulses,n)*np.fft.rfft(shape,n),n)[:,:self.points]
+        if return_pixels:
+            return waves, np.bincount(rows,weights=pixels,minlength=count).astype(int)
+        return waves
+
+    def trace(self):
+        """ A new waveform in volts, before digitizing. """
+        return self.traces(1)[0]
+
+    def _digitize(self,argument):
+        """
+        Acquires the channels listed in argument (e.g. "CHAN1,CHAN2"), or the
+        displayed channels and the waveform source, on the same triggers:
+        each channel detects its own photons.
+        """
+        if argument:
+            sources = [int(source.strip().upper().replace("CHAN",""))
+                       for source in argument.split(",")]
+        else:
+            sources = set([self.source] + [num for num, channel in self.channels.items()
+                                           if channel["display"]])
+        count = self.segment_count if self.acquisition_mode == "SEGM" else 1
+        intervals = self._rng.exponential(1/self.trigger_rate,count)
+        intervals[0] = 0
+        time.sleep(intervals.sum())
+        self._time_tags = np.cumsum(intervals)
+        self._segments = dict((num, self.traces(count)) for num in sources)
+
+    def _data(self,channel):
+        segments = self._segments.get(self.source)
+        if segments is None:
+            wave = self.trace()
+        elif self.segmented_all:
+            wave = segments.ravel()
+        else:
+            wave = segments[-1]
+        y_increment, y_origin = self._scale(channel)
+        span = CODE_SPAN.get(self.format,CODE_SPAN["WORD"])
+        codes = np.clip(np.round((wave - y_origin)/y_increment),-span//2,span//2 - 1)
+        if self.format == "ASC":
+            volts = codes*y_increment + y_origin
+            volts[codes == span//2 - 1] = CLIPPED
+            volts[codes == -span//2] = -CLIPPED
+            return self._ascii(volts)
+        datatype = "h" if self.format == "WORD" else "b"
+        return util.to_ieee_block(codes.astype(datatype),datatype,
+                                  self.big_endian) + b"\n"
+
+    def _autoscale(self):
+        """ Fits the window of the source to a few waveforms, like AUT. """
+        waves = self.traces(8)
+        channel = self._channel(self.source)
+        channel["offset"] = (waves.max() + waves.min())/2
+        channel["range"] = max(1.25*(waves.max() - waves.min()),0.064)
+
+    def _measure(self,setting,argument):
+        """
+        MEAS:CLE, MEAS:STAT, MEAS:<name> to add a measurement, MEAS:<name>?
+        to measure one waveform and MEAS:RES? for the results of all of them.
+        """
+        if setting.startswith("CLE"):
+            self.measurements = []
+            self._measure_since = time.perf_counter()
+        elif setting == "STAT":
+            self.statistics = argument.upper() in ("ON","1")
+        elif setting.rstrip("?") in MEASUREMENTS:
+            name = setting.rstrip("?")
+            if setting.endswith("?"):
+                return self._ascii([self._statistic(name,self.traces(1))[0]])
+            if name not in self.measurements:
+                self.measurements.append(name)
+        elif setting == "RES?":
+            # The scope measures every waveform acquired since MEAS:CLE
+            elapsed = time.perf_counter() - self._measure_since
+            waves = self.traces(int(np.clip(elapsed*self.trigger_rate,1,500)))
+            fields = []
+            for name in self.measurements:
+                values = self._statistic(name,waves)
+                fields.append("%s(%d)" % (MEASUREMENTS[name],self.source))
+                if self.statistics:
+                    fields += ["%+.6E" % value for value in
+                               (values[-1],values.min(),values.max(),
+                                values.mean(),values.std())]
+                    fields.append("%d" % len(values))
+                else:
+                    fields.append("%+.6E" % values[-1])
+            return (",".join(fields) + "\n").encode()
+        else:
+            raise ValueError("Unsupported command: MEAS:" + setting)
+        return b""
+
+    def _statistic(self,name,waves):
+        """ Measurement 'name' of each of the waveforms, clipped to the window. """
+        channel = self._channel(self.source)
+        waves = np.clip(waves,channel["offset"] - channel["range"]/2,
+                        channel["offset"] + channel["range"]/2)
+        if name == "VMAX":
+            return waves.max(axis=1)
+        if name == "VMIN":
+            return waves.min(axis=1)
+        return waves.mean(axis=1)
+
+
+class SimulatedResourceManager:
+    """
+    Stand-in for pyvisa.ResourceManager with one simulated scope on the GPIB
+    bus, for Agilent54845A.fromResourceManager. Keyword arguments are those
+    of SimulatedAgilent54845A.
+    """
+    def __init__(self,resource_id="GPIB0::7::INSTR",**settings):
+        self.resource_id = resource_id
+        self.settings = settings
+
+    def list_resources(self):
+        return (self.resource_id,)
+
+    def open_resource(self,resource_id):
+        if resource_id != self.resource_id:
+            raise ValueError("No resource " + resource_id)
+        return SimulatedAgilent54845A(**self.settings)
@@ -0,0 +1,172 @@
+"""
+Streaming reduction of oscilloscope traces to per-trace statistics.
+
+Instead of storing every 1004-point trace, a TraceReducer computes a few
+numbers per trace as batches arrive (from get_waveform, get_segments or an
+AcquisitionWorker) and keeps, per key (e.g. a (test sample, output node)
+pair), the per-trace values and a running mean and variance across repeats
+(Welford's algorithm, merged batch by batch). Raw traces are kept only when
+the sampling policy asks for them:
+
+    reducer = TraceReducer(("mean","integral","peaks"),peak_threshold=0.05,
+                           keep_raw=keep_first(2))
+    for n in nodes:
+        waves, _ = oscope.get_segments(50)
+        reducer.add((idx,n),waves)
+    reducer.summary((idx,n))["mean"]    # (repeats, mean, std)
+"""
+import threading
+import numpy as np
+
+
+def keep_none(key,indices):
+    return np.zeros(len(indices),dtype=bool)
+
+def keep_all(key,indices):
+    return np.ones(len(indices),dtype=bool)
+
+def keep_first(count):
+    """ Keeps the first count raw traces of every key. """
+    return lambda key, indices: indices < count
+
+def keep_every(step):
+    """ Keeps one raw trace in step of every key. """
+    return lambda key, indices: indices % step == 0
+
+
+class TraceReducer:
+    def __init__(self,statistics=("mean","integral"),x_increment=1.0,
+                 baseline=0.0,peak_threshold=None,keep_raw=keep_none):
+        """
+        Parameters:
+        -----------
+        statistics                          Per-trace statistics, names among
+                                            "mean", "integral", "peaks", "max"
+                                            and "min", or (name, function)
+                                            pairs where function maps a
+                                            (traces, points) array to one
+                                            value per trace.
+        x_increment                         Seconds per sample, for "integral"
+                                            (e.g. the x_increment of
+                                            Agilent54845A.get_preamble()).
+        baseline                            Volts subtracted before integrating.
+        peak_threshold                      Height above the trace median (V)
+                                            at which "peaks" counts a pulse.
+        keep_raw                            Sampling policy: a function of the
+                                            key and the repeat indices of a
+                                            batch returning which raw traces to
+                                            keep (keep_none, keep_all,
+                                            keep_first(n), keep_every(n)).
+        """
+        self.x_increment = x_increment
+        self.baseline = baseline
+        self.peak_threshold = peak_threshold
+        self.keep_raw = keep_raw
+        self.names = []
+        self._functions = []
+        builtin = {"mean" : self._mean, "integral" : self._integral,
+                   "peaks" : self._peaks, "max" : self._max, "min" : self._min}
+        for statistic in statistics:
+            name, function = (statistic if isinstance(statistic,tuple)
+                              else (statistic,builtin.get(statistic)))
+            if function is None:
+                raise ValueError("Unknown statistic " + name)
+            if name == "peaks" and peak_threshold is None:
+                raise ValueError("The peaks statistic needs a peak_threshold.")
+            self.names.append(name)
+            self._functions.append(function)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._means = {}
+        self._m2 = {}
+        self._values = {}
+        self._raw = {}
+
+    def keys(self):
+        with self._lock:
+            return list(self._counts)
+
+    def add(self,key,waves):
+        """
+        Reduces a (traces, points) array, or a single trace, of key. Returns
+        the (traces, statistics) values, columns in the order of self.names.
+        """
+        waves = np.atleast_2d(waves)
+        values = np.column_stack([function(waves) for function in self._functions])
+        n_b = len(values)
+        mean_b = values.mean(axis=0)
+        m2_b = ((values - mean_b)**2).sum(axis=0)
+        with self._lock:
+            n_a = self._counts.get(key,0)
+            indices = np.arange(n_a,n_a + n_b)
+            if n_a == 0:
+                self._means[key], self._m2[key] = mean_b, m2_b
+                self._values[key], self._raw[key] = [], []
+            else:
+                # Chan et al. update of the running mean and sum of squares
+                delta = mean_b - self._means[key]
+                n = n_a + n_b
+                self._means[key] = self._means[key] + delta*n_b/n
+                self._m2[key] = self._m2[key] + m2_b + delta**2*n_a*n_b/n
+            self._counts[key] = n_a + n_b
+            self._values[key].append(values)
+            keep = self.keep_raw(key,indices)
+            if keep.any():
+                self._raw[key].append((indices[keep],waves[keep].copy()))
+        return values
+
+    def values(self,key):
+        """ Per-trace values of key as a (traces, statistics) array. """
+        with self._lock:
+            return np.concatenate(self._values[key])
+
+    def summary(self,key):
+        """ Returns {statistic : (traces, mean, standard deviation)} of key. """
+        with self._lock:
+            n = self._counts[key]
+            std = np.sqrt(self._m2[key]/(n - 1)) if n > 1 else np.zeros(len(self.names))
+            return dict((name,(n,mean,sigma)) for name, mean, sigma
+                        in zip(self.names,self._means[key],std))
+
+    def raw(self,key):
+        """ Repeat indices and (kept traces, points) array of the raw traces of key. """
+        with self._lock:
+            if not self._raw.get(key):
+                return np.empty(0,dtype=int), None
+            indices, waves = zip(*self._raw[key])
+            return np.concatenate(indices), np.concatenate(waves)
+
+    def to_dataframe(self):
+        """
+        Summary of all keys as a pandas DataFrame, indexed by key, with the
+        count and the mean and standard deviation of every statistic.
+        """
+        import pandas
+        rows = {}
+        for key in self.keys():
+            row = {}
+            for name, (n, mean, sigma) in self.summary(key).items():
+                row["count"] = n
+                row[name + "_mean"] = mean
+                row[name + "_std"] = sigma
+            rows[key] = row
+        return pandas.DataFrame.from_dict(rows,orient="index")
+
+    # Statistics -----------------------------------------------------------
+
+    def _mean(self,waves):
+        return waves.mean(axis=1)
+
+    def _integral(self,waves):
+        return (waves.sum(axis=1) - self.baseline*waves.shape[1])*self.x_increment
+
+    def _peaks(self,waves):
+        """ Upward crossings of median + peak_threshold. """
+        above = waves > np.median(waves,axis=1,keepdims=True) + self.peak_threshold
+        return (above[:,1:] & ~above[:,:-1]).sum(axis=1)
+
+    def _max(self,waves):
+        return waves.max(axis=1)
+
+    def _min(self,waves):
+        return waves.min(axis=1)
@@ -0,0 +1,179 @@
+"""
+Benchmarks of the vectorized Kaleidoscope methods against the original
+implementations, kept below as LoopTransform and LoopExpan:
+
+    transform   KaleidoTransform with its precompiled gather plan against the
+                loop over blocks, on the configurations of the data collection
+                notebooks:
+                    input    one 28x28 input replicated over 5x5 mirrored blocks
+                    weights  the 100 rows of a weight matrix tiled 10x10
+                    example  the 6 row example of kaleidoscope.py, with a -1
+                             in pxIdx
+                reporting the loop, the first planned call (compiling the
+                plan) and the cached calls
+    expan       KaleidoExpan of a (N, 28, 28) uint8 batch of MNIST-like images
+                in one call, into float and uint8 tensors and into a phone
+                sized canvas, against one call of LoopExpan per image
+    readout     KaleidoReadout of (N, H, W) batches of transformed images of
+                growing block grids, per block element and reduced over the
+                replicas, in ns per pixel (constant for a linear cost)
+
+All check their results against the original implementations or, for the
+readout, against the matrix that was transformed.
+
+Usage: python benchmark_kaleidoscope.py [benchmark ...] [--repeats N] [--images N]
+"""
+import argparse
+import time
+import torch
+
+try:
+    from .kaleidoscope import Kaleidoscope
+except ImportError:
+    from kaleidoscope import Kaleidoscope
+
+
+def LoopTransform(kale, matIn, pxIdx, blkIdx, centerBlk=()):
+    """ KaleidoTransform as a Python loop over the blocks. """
+    pad = kale.padding
+    (blk_h, blk_w) = pxIdx.shape
+    (blk_h_pad, blk_w_pad) = (blk_h+sum(pad[0:2]), blk_w+sum(pad[2:]))
+    (blk_rowCount, blk_colCount) = blkIdx.shape
+    transImage = torch.zeros(blk_colCount * blk_w_pad, blk_rowCount, blk_h_pad)
+    for i in range(0,blk_rowCount):
+        transBlkRow = torch.zeros(blk_h_pad, blk_colCount, blk_w_pad)
+        for j in range(0, blk_colCount):
+            linIdx = pxIdx.view(-1,)
+            linBlk = torch.take(matIn[blkIdx[i, j], :], linIdx)
+            blk2D = linBlk.view(pxIdx.shape)
+            if centerBlk and len(centerBlk) == 2:
+                if (i-centerBlk[0])%2 == 1:
+                    blk2D = torch.flip(blk2D, [0])
+                if (j-centerBlk[1])%2 == 1:
+                    blk2D = torch.flip(blk2D, [1])
+                blk2D = blk2D * kale.reflectivity ** (abs(i-centerBlk[0])+abs(j-centerBlk[1]))
+            transBlkRow[pad[0]:pad[0]+blk_h, j, pad[2]:pad[2]+blk_w] = blk2D
+        transImage[:, i, :] = transBlkRow.view(blk_h_pad, -1).t()
+    transImage = transImage.view(blk_colCount * blk_w_pad, -1)
+    return transImage.t()
+
+
+def LoopExpan(kale, im):
+    """ KaleidoExpan of one h x w image with repeated copies and a loop. """
+    pad = kale.padding
+    repN = kale.repNums
+    (h, w) = im.shape
+    (h, w) = (h + pad[0] + pad[1], w + pad[2] + pad[3])
+    im_padded = torch.zeros(h, w)
+    im_padded[pad[0]:(h-pad[1]), pad[2]:(w-pad[3])] = im
+    rowMirror = LoopMirrorCavity(kale, im_padded, repN[2:])
+    return LoopMirrorCavity(kale, rowMirror.t(), repN[0:2]).t()
+
+
+def LoopMirrorCavity(kale, im, num_reps):
+    (h, w) = im.shape
+    imageRow = torch.zeros(h, sum(num_reps)+1, w)
+    flipIdx = [*range(num_reps[0]-1, -1, -2), *range(num_reps[0]+1, sum(num_reps)+1, 2)]
+    keepIdx = list(set(range(0, sum(num_reps)+1))-set(flipIdx))
+    attenIdx = torch.cat((torch.arange(num_reps[0], 0, -1, dtype=torch.double), torch.arange(0, num_reps[1]+1, dtype=torch.double)))
+    attenFactor = kale.reflectivity ** attenIdx
+    imHoriFlip = torch.flip(im, [1])
+    imageRow[:, flipIdx, :] = torch.repeat_interleave(imHoriFlip.unsqueeze(1), len(flipIdx), dim=1)
+    imageRow[:, keepIdx, :] = torch.repeat_interleave(im.unsqueeze(1), len(keepIdx), dim=1)
+    for i in range(sum(num_reps)+1):
+        imageRow[:, i, :] = imageRow[:, i, :] * attenFactor[i]
+    return imageRow.view(h, -1)
+
+
+def Configurations():
+    pxIdx = torch.arange(0, 784).view(28, -1)
+    examplePxIdx = pxIdx.clone()
+    examplePxIdx[0, 0] = -1
+    return [('input', Kaleidoscope((2,2,2,2), (2,2,2,2), 0.9),
+             torch.rand(1, 784), pxIdx, torch.zeros(5, 5, dtype=torch.long), (2,2)),
+            ('weights', Kaleidoscope((0,0,0,0), (1,1,1,1)),
+             torch.rand(100, 784), pxIdx, torch.arange(0, 100).view(10, -1), ()),
+            ('example', Kaleidoscope((1,2,1,1), (2,2,2,2), 0.8),
+             torch.rand(6, 784), examplePxIdx, torch.arange(0, 6).view(2, -1), (0,1))]
+
+
+def TimePerCall(function, repeats):
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        result = function()
+    return (time.perf_counter() - t0)/repeats, result
+
+
+def BenchmarkTransform(args):
+    repeats = args.repeats
+    print("%-8s %12s %14s %14s %8s" % ("", "loop (ms)", "planning (ms)", "planned (ms)", "speedup"))
+    for (name, kale, matIn, pxIdx, blkIdx, centerBlk) in Configurations():
+        tLoop, expected = TimePerCall(lambda: LoopTransform(kale, matIn, pxIdx, blkIdx, centerBlk), repeats)
+        tFirst, _ = TimePerCall(lambda: kale.KaleidoTransform(matIn, pxIdx, blkIdx, centerBlk), 1)
+        tPlan, result = TimePerCall(lambda: kale.KaleidoTransform(matIn, pxIdx, blkIdx, centerBlk), repeats)
+        assert result.shape == expected.shape and torch.allclose(result, expected), name
+        print("%-8s %12.3f %14.3f %14.3f %7.0fx" % (name, 1e3*tLoop, 1e3*tFirst, 1e3*tPlan, tLoop/tPlan))
+
+
+def BenchmarkExpan(args):
+    kale = Kaleidoscope((2,2,1,3), (2,1,2,0), 0.9)
+    images = torch.randint(0, 256, (args.images, 28, 28), dtype=torch.uint8)
+    (H, W) = kale.ExpanShape(28, 28)
+    canvas = torch.zeros(args.images, 1920, 1080, dtype=torch.uint8)
+    (y0, x0) = ((1920 - H)//2, (1080 - W)//2)
+
+    tLoop, expected = TimePerCall(lambda: torch.stack([LoopExpan(kale, im) for im in images]), 1)
+    cases = [('float', lambda: kale.KaleidoExpan(images, batch=True)),
+             ('uint8', lambda: kale.KaleidoExpan(images, dtype=torch.uint8, batch=True)),
+             ('canvas', lambda: kale.KaleidoExpan(images, out=canvas[:, y0:y0+H, x0:x0+W], batch=True))]
+    print("%-8s %10.2f ms/image" % ("loop", 1e3*tLoop/args.images))
+    for (name, call) in cases:
+        t, result = TimePerCall(call, 1)
+        if result.is_floating_point():
+            assert torch.allclose(result, expected), name
+        else:
+            assert (result.float() - expected).abs().max() <= 0.5, name
+        print("%-8s %10.4f ms/image %7.0fx" % (name, 1e3*t/args.images, tLoop/t))
+    assert not canvas[:, :y0].any() and not canvas[:, y0+H:].any()
+
+
+def BenchmarkReadout(args):
+    kale = Kaleidoscope((0,0,0,0), (1,1,1,1), 0.9)
+    pxIdx = torch.arange(0, 784).view(28, -1)
+    print("%-8s %10s %12s %12s" % ("blocks", "pixels", "elements", "replicas"))
+    for grid in (2, 4, 8, 16):
+        # 4 matrix rows, each replicated over the grid
+        matIn = torch.rand(4, 784)
+        blkIdx = torch.arange(0, grid*grid).view(grid, -1) % 4
+        centerBlk = (grid//2, grid//2)
+        frames = kale.KaleidoTransform(matIn, pxIdx, blkIdx, centerBlk).expand(args.images, -1, -1)
+        pixels = frames.numel()
+        kale.TransformPlan(pxIdx, blkIdx, centerBlk, matIn.shape)
+        tElements, values = TimePerCall(lambda: kale.KaleidoReadout(frames, pxIdx, blkIdx, centerBlk, matIn.shape), 1)
+        tReplicas, estimate = TimePerCall(lambda: kale.KaleidoReadout(frames, pxIdx, blkIdx, centerBlk, matIn.shape, reduce="replicas"), 1)
+        assert torch.allclose(values[-1], matIn.view(4, 28, 28)[blkIdx], atol=1e-5)
+        assert torch.allclose(estimate[-1], matIn, atol=1e-5)
+        print("%-8s %10d %9.2f ns %9.2f ns" % ("%dx%d" % (grid, grid), pixels,
+                                                1e9*tElements/pixels, 1e9*tReplicas/pixels))
+
+
+BENCHMARKS = {"transform" : BenchmarkTransform,
+              "expan" : BenchmarkExpan,
+              "readout" : BenchmarkReadout}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the vectorized Kaleidoscope methods against the original loops.")
+    parser.add_argument("benchmarks", nargs="*",
+                        help="benchmarks to run among %s, all by default" % ", ".join(BENCHMARKS))
+    parser.add_argument("--repeats", type=int, default=100)
+    parser.add_argument("--images", type=int, default=200)
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: " + ", ".join(sorted(unknown)))
+    for name in args.benchmarks or BENCHMARKS:
+        print("== %s" % name)
+        BENCHMARKS[name](args)
+        print()
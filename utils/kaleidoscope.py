@@ -1,10 +1,96 @@
 from torchvision.transforms import ToTensor
 from torchvision.transforms import ToPILImage
 from torchvision.datasets import MNIST
+import collections
 import torch
 import numpy
 import PIL
 
+class KaleidoPlan:
+    """
+    A precompiled KaleidoTransform: for every pixel of the transformed image,
+    the flat index of the element of the input matrix it shows, and the
+    attenuation it is multiplied by (0 for the padding pixels). Applying the
+    plan is then a single gather and a single multiplication, and so is
+    reading measured images back block by block (see Readout).
+    """
+
+    def __init__(self, index, atten, matShape, blockPixels):
+        """
+        index: a 2D torch.tensor (long) of flat indices into the input matrix,
+        of the shape of the transformed image.
+
+        atten: a torch.tensor of the same shape with the attenuation factor of
+        each pixel.
+
+        matShape: the shape (M, N) of the input matrices the plan applies to.
+
+        blockPixels: a 4D torch.tensor (long) with, at [i, j, y, x], the flat
+        index in the transformed image of the element [y, x] of the block [i, j],
+        undoing the flips of the reflections.
+        """
+
+        self.index = index
+        self.atten = atten
+        self.matShape = tuple(matShape)
+        self.blockPixels = blockPixels
+
+        # Input matrix element and attenuation of every block element
+        pixels = blockPixels.view(-1)
+        self.blockElements = index.view(-1)[pixels]
+        self.blockAtten = atten.view(-1)[pixels]
+        self.elementCounts = torch.bincount(self.blockElements, minlength=self.matShape[0]*self.matShape[1])
+
+    def ToDevice(self, device):
+        """ Returns the plan with its tensors on 'device'. """
+        return KaleidoPlan(self.index.to(device), self.atten.to(device), self.matShape,
+                           self.blockPixels.to(device))
+
+    def Apply(self, matIn):
+        """
+        Returns the transformed image of 'matIn', a M x N torch.tensor, in the
+        dtype of the attenuation map.
+        """
+        assert tuple(matIn.shape) == self.matShape, "The plan was compiled for a %s matrix" % (self.matShape,)
+        matOut = torch.take(matIn, self.index).to(self.atten.dtype)
+        return matOut.mul_(self.atten)
+
+    def Readout(self, frames, reduce=None):
+        """
+        The inverse of Apply for measured images: returns the value of every
+        element of every block in 'frames', with the attenuation of the block
+        divided out and the flips undone.
+
+        frames: a torch.tensor (or numpy array) of the shape of the transformed
+        image, or a (F, H, W) batch of F frames.
+
+        reduce: None for the (F, rows, columns, blk_h, blk_w) values of the
+        elements of the blocks of blkIdx; "block" for the (F, rows, columns)
+        sums of the blocks; "replicas" for the (F, M, N) estimate of the input
+        matrix, the mean of all the replicas of each element (NaN for the
+        elements shown nowhere). The F dimension is dropped for a single frame.
+        """
+        frames = torch.as_tensor(frames)
+        assert frames.shape[-2:] == self.index.shape, "The plan was compiled for %s images" % (tuple(self.index.shape),)
+        images = frames.reshape(-1, self.index.numel())
+        if not images.is_floating_point():
+            images = images.to(self.atten.dtype)
+
+        values = images.index_select(1, self.blockPixels.view(-1)) / self.blockAtten
+        if reduce is None:
+            values = values.view((-1,) + self.blockPixels.shape)
+        elif reduce == "block":
+            values = values.view((-1,) + self.blockPixels.shape).sum((3, 4))
+        elif reduce == "replicas":
+            sums = torch.zeros(len(values), self.elementCounts.numel(), dtype=values.dtype, device=values.device)
+            sums.index_add_(1, self.blockElements, values)
+            values = (sums / self.elementCounts).view((-1,) + self.matShape)
+        else:
+            raise ValueError("Unknown reduction " + str(reduce))
+
+        return values if frames.dim() > 2 else values[0]
+
+
 class Kaleidoscope:
     """
     A class of methods that spatially rearrange the activation vector to mimic
@@ -12,7 +98,7 @@ class Kaleidoscope:
     correspondingly. 
     """
 
-    def __init__(self, repNums, padding=(0, 0, 0, 0), reflectivity=1.0):
+    def __init__(self, repNums, padding=(0, 0, 0, 0), reflectivity=1.0, maxPlans=16):
         """
         repNums: a 4-element tuple specifying the number of copies in the up, down,
         left and right direction from the original image in the center.
@@ -26,41 +112,98 @@ class Kaleidoscope:
         mirror. e.g., there is no intensity decrease if reflectivity equals to 1.
         The number of reflection equals the norm-1 distance from the virtual image
         to the original image.
+
+        maxPlans: the number of KaleidoTransform configurations whose plans are
+        kept, the least recently used being dropped first (see TransformPlan).
         """
 
         self.repNums = repNums
         self.padding = padding
         self.reflectivity = reflectivity
+        self.maxPlans = maxPlans
+        self._plans = collections.OrderedDict() # KaleidoPlan of each KaleidoTransform configuration
 
-    def KaleidoExpan(self, original_image):
+    def KaleidoExpan(self, original_image, out=None, dtype=None, batch=None):
         """
         The function returns a torch.tensor 'fullMirror' that is the virtual image
         array generated by a rectangular kaleidoscope around the original image. 
 
         original_image: the input image is either a PIL image, torch.tensor, or a
         numpy array, and it will be converted to torch.tensor before processed.
+        A torch.tensor of shape (N, H, W) or (N, 1, H, W), e.g. MNIST().data, is a
+        batch of N images, expanded all at once into a (N, H', W') tensor.
+
+        batch: whether a tensor with a leading dimension of 1 is a batch of one
+        image, expanded into a (1, H', W') tensor. If None, it is squeezed as the
+        channel of a single image (e.g. ToTensor()(img) of shape (1, H, W)) and
+        the result is (H', W').
+
+        out: an optional tensor of the shape of the result, (N, H', W') or
+        (H', W') with (H', W') = self.ExpanShape(H, W), that the virtual images
+        are written into instead of a new tensor, e.g. a region of a phone
+        display sized canvas: out = canvas[:, y0:y0+H', x0:x0+W'].
+
+        dtype: the dtype of the new tensor when 'out' is not given, the default
+        torch dtype if None. For integer dtypes (e.g. torch.uint8), the
+        attenuated pixel values are rounded; floating point images, such as
+        those of ToTensor(), are taken as intensities in [0, 1] and scaled to
+        0-255 first.
         """
 
         if isinstance(original_image, (PIL.Image.Image,)) or isinstance(original_image, (numpy.ndarray,)):
             im = ToTensor()(original_image)
+            im = im.squeeze(0) # Get rid of dim 0 for color channel.
         elif isinstance(original_image, (torch.Tensor,)):
             im = original_image
-            
-        im = im.squeeze() # Get rid of dim 0 for color channel.
-        (h, w) = im.shape 
-
-        # Pad the surroundings of the image
+            if im.dim() == 4:
+                im = im.squeeze(1) # Get rid of the color channel of a batch.
+            if im.dim() == 3 and im.shape[0] == 1 and not batch:
+                im = im.squeeze(0) # A single image with its color channel.
+        (h, w) = im.shape[-2:]
+
+        # Flat index of the original pixel shown at every pixel of the
+        # kaleidoscope, and attenuation of every pixel (0 in the padding).
         pad = self.padding
         repN = self.repNums
-        (h, w) = (h + pad[0] + pad[1], w + pad[2] + pad[3])
-        im_padded = torch.zeros(h, w)
-        im_padded[pad[0]:(h-pad[1]), pad[2]:(w-pad[3])] = im
-        im = im_padded
-
-        rowMirror = self.ParaMirrorCavity(im, repN[2:])
-        fullMirror = self.ParaMirrorCavity(rowMirror.t(), repN[0:2])
-
-        return fullMirror.t()
+        (rowIdx, rowAtten) = self._MirrorIndex(h, repN[0:2], pad[0:2])
+        (colIdx, colAtten) = self._MirrorIndex(w, repN[2:], pad[2:])
+        flatIdx = (rowIdx.unsqueeze(1) * w + colIdx.unsqueeze(0)).view(-1).to(im.device)
+        atten = torch.outer(rowAtten, colAtten).to(im.device)
+
+        if out is None:
+            out = torch.empty(im.shape[:-2] + atten.shape, device=im.device,
+                              dtype=torch.get_default_dtype() if dtype is None else dtype)
+        assert out.shape == im.shape[:-2] + atten.shape, "out must be of shape %s" % (tuple(im.shape[:-2] + atten.shape),)
+
+        # Intensities in [0, 1] written as integers are scaled to 0-255.
+        scaled = im.is_floating_point() and not out.is_floating_point()
+        if scaled:
+            atten = atten * 255
+
+        # Gather and attenuate a chunk of images at a time, to bound the size of
+        # the intermediates.
+        images = im.reshape(-1, h * w)
+        fullMirror = out if out.dim() == 3 else out.unsqueeze(0)
+        chunk = max(1, 2**22 // atten.numel())
+        for k in range(0, len(images), chunk):
+            expanded = images[k:k+chunk].to(atten.dtype).index_select(1, flatIdx).view((-1,) + atten.shape)
+            if out.is_floating_point():
+                torch.mul(expanded, atten, out=fullMirror[k:k+chunk])
+            elif scaled:
+                fullMirror[k:k+chunk] = expanded.mul_(atten).round_().clamp_(0, 255)
+            else:
+                fullMirror[k:k+chunk] = expanded.mul_(atten).round_()
+
+        return out
+
+    def ExpanShape(self, h, w):
+        """
+        The function returns the shape (H', W') of the output of KaleidoExpan for
+        images of h x w pixels.
+        """
+        pad = self.padding
+        repN = self.repNums
+        return ((sum(repN[0:2])+1) * (h + pad[0] + pad[1]), (sum(repN[2:])+1) * (w + pad[2] + pad[3]))
 
     def ParaMirrorCavity(self, padded_image, num_reps):
         """
@@ -68,48 +211,43 @@ class Kaleidoscope:
         array generated by two parallel flat mirrors around the input image
         'original_image'.
 
+        padded_image: a h x w torch.tensor, or a (N, h, w) batch of images.
+
         num_reps: a 2-element tuple specifying the number of replication on the
         left and right of the original image. 
         """
         im = padded_image
-        (h, w) = im.shape 
-
-        # Create a 3D array to store the row of mirror images of the original image.
-        # dim 0: the vertical pixel coordinate of each image; 
-        # dim 1: the horizontal position of each mirror image (e.g.,
-        # rowMirror[:,0,:] the leftest image, rowMirror[:,repCol,:] the righest).
-        # dim 2: the horizontal pixel coordinate of each mirror image. 
-        # dim 2 is a sub-dimension of dim 1 so that they are contiguous and can
-        # later be binded into one single dimension by torch.tensor.view() 
-        imageRow = torch.zeros(h, sum(num_reps)+1, w) # Images are copied in the row direction.
-
-        # The list of image indices to be flipped horizontally. 
-        flipIdx = [*range(num_reps[0]-1, -1, -2), *range(num_reps[0]+1, sum(num_reps)+1, 2)] 
+        w = im.shape[-1]
 
-        # The list of image indices NOT to be flipped horizontally.
-        keepIdx = list(set(range(0, sum(num_reps)+1))-set(flipIdx)) 
+        # The horizontal pixel coordinate in the original image of every column
+        # of the row of mirror images (e.g. reversed in the flipped images), and
+        # the attenuation factor of every column.
+        (colIdx, attenFactor) = self._MirrorIndex(w, num_reps)
 
-        # The tensor encoding attenuation factor of each image in the row
-        attenIdx = torch.cat((torch.arange(num_reps[0], 0, -1, dtype=torch.double), torch.arange(0, num_reps[1]+1, dtype=torch.double)))
-        attenFactor = self.reflectivity ** attenIdx
+        # Copy the columns in place and apply the attenuation by broadcasting.
+        imageRow = im.index_select(-1, colIdx.to(im.device)).to(attenFactor.dtype)
+        imageRow *= attenFactor.to(im.device)
 
-        # The flipped version of the image
-        imHoriFlip = torch.flip(im, [1])
-
-        # Assign the copies of the flipped image to correct horizontal positions.
-        imageRow[:, flipIdx, :] = torch.repeat_interleave(imHoriFlip.unsqueeze(1), len(flipIdx), dim=1)
-
-        # Assign the copies of un-flipped image to correct horizontal positions.
-        imageRow[:, keepIdx, :] = torch.repeat_interleave(im.unsqueeze(1), len(keepIdx), dim=1)
+        return imageRow
 
-        # Apply attenuation coefficient to each of the image copies.
-        for i in range(sum(num_reps)+1):
-            imageRow[:, i, :] = imageRow[:, i, :] * attenFactor[i]
+    def _MirrorIndex(self, length, num_reps, pad=(0, 0)):
+        """
+        The function returns, for every pixel along a row of mirror images of a
+        'length' pixel long image padded by pad = (before, after) pixels, the
+        index of the pixel of the image it shows and its attenuation factor,
+        which is 0 for the padding.
+        """
+        padded = length + pad[0] + pad[1]
 
-        # reshape and bind dim 1 to dim 2 (The horizontal position of each mirror image)
-        imageRow = imageRow.view(h, -1) 
+        # The number of reflections of each image in the row, which flips the
+        # image when odd.
+        reflections = (torch.arange(sum(num_reps)+1) - num_reps[0]).abs().repeat_interleave(padded)
+        pos = torch.arange(padded).repeat(sum(num_reps)+1)
+        pos = torch.where(reflections % 2 == 1, padded-1-pos, pos) - pad[0]
 
-        return imageRow
+        inImage = (pos >= 0) & (pos < length)
+        atten = self.reflectivity ** reflections.double() * inImage
+        return (pos.clamp(0, length-1), atten.to(torch.get_default_dtype()))
 
     def KaleidoTransform(self, matIn, pxIdx, blkIdx, centerBlk=()):
         """
@@ -139,47 +277,113 @@ class Kaleidoscope:
         """
         #assert matIn.shape[1] == pxIdx.shape[0]*pxIdx.shape[1], "The number of elements in pxIdx must match the number of columns in matIn"
 
+        plan = self.TransformPlan(pxIdx, blkIdx, centerBlk, matIn.shape, matIn.device)
+        return plan.Apply(matIn)
+
+    def KaleidoReadout(self, frames, pxIdx, blkIdx, centerBlk=(), matShape=None, reduce=None):
+        """
+        The function reads measured images of KaleidoTransform back: it returns
+        the value of every element of every block of 'frames', a 2D image or a
+        (F, H, W) batch of images, with the flips of the reflections undone and
+        the reflectivity attenuation divided out. See KaleidoPlan.Readout.
+
+        pxIdx, blkIdx, centerBlk: the arguments of the KaleidoTransform that
+        generated the displayed image.
+
+        matShape: the shape (M, N) of the transformed matrix, see TransformPlan.
+
+        reduce: None for the values of the block elements, "block" for the sum
+        of each block, or "replicas" for the mean of the replicas of every
+        element of the M x N matrix.
+        """
+        frames = torch.as_tensor(frames)
+        plan = self.TransformPlan(pxIdx, blkIdx, centerBlk, matShape, frames.device)
+        return plan.Readout(frames, reduce)
+
+    def TransformPlan(self, pxIdx, blkIdx, centerBlk=(), matShape=None, device=None):
+        """
+        The function returns the KaleidoPlan of KaleidoTransform for 'pxIdx',
+        'blkIdx' and 'centerBlk' (see KaleidoTransform), with the current padding
+        and reflectivity, for M x N input matrices with matShape = (M, N). The
+        last maxPlans plans are cached by configuration, so that repeated
+        transforms only pay for the gather and the multiplication; ClearPlans
+        frees them.
+
+        matShape: the shape of the input matrices. The default is the largest
+        index in blkIdx and in pxIdx plus one.
+
+        device: the torch.device of the input matrices, the CPU by default.
+        """
+        if matShape is None:
+            matShape = (int(blkIdx.max())+1, int(pxIdx.max())+1)
+        device = torch.device('cpu') if device is None else torch.device(device)
+        key = (self._TensorKey(pxIdx), self._TensorKey(blkIdx), tuple(centerBlk),
+               tuple(self.padding), self.reflectivity, tuple(matShape), device)
+        if key in self._plans:
+            self._plans.move_to_end(key)
+        else:
+            self._plans[key] = self._CompilePlan(pxIdx, blkIdx, centerBlk, matShape).ToDevice(device)
+            while len(self._plans) > self.maxPlans:
+                self._plans.popitem(last=False)
+        return self._plans[key]
+
+    def ClearPlans(self):
+        """ Frees the cached KaleidoTransform plans. """
+        self._plans.clear()
+
+    @staticmethod
+    def _TensorKey(tensor):
+        array = tensor.detach().cpu().numpy()
+        return (array.shape, array.dtype.str, array.tobytes())
+
+    def _CompilePlan(self, pxIdx, blkIdx, centerBlk, matShape):
         pad = self.padding
         (blk_h, blk_w) = pxIdx.shape
         # number of pixels in each column and row
-        (blk_h_pad, blk_w_pad) = (blk_h+sum(pad[0:2]), blk_w+sum(pad[2:])) 
+        (blk_h_pad, blk_w_pad) = (blk_h+sum(pad[0:2]), blk_w+sum(pad[2:]))
 
         # number of blocks in each column and row
         (blk_rowCount, blk_colCount) = blkIdx.shape
 
-        # pre-allocate space for the entire image
-        transImage = torch.zeros(blk_colCount * blk_w_pad, blk_rowCount, blk_h_pad)
-        
-        for i in range(0,blk_rowCount):
-            # pre-allocate space for each row of image
-            transBlkRow = torch.zeros(blk_h_pad, blk_colCount, blk_w_pad)
-
-            for j in range(0, blk_colCount):
-                # Reshape the pixel index into a row vector, map each element to
-                # their position, and then reshape the row vector back to 2D
-                # block.
-                linIdx = pxIdx.view(-1,)
-                linBlk = torch.take(matIn[blkIdx[i, j], :], linIdx)
-                blk2D = linBlk.view(pxIdx.shape)
-
-                if not centerBlk: # no reflection
-                    pass
-                elif len(centerBlk) == 2:
-                    if (i-centerBlk[0])%2 == 1: # the odd index from the original image is reflected
-                        blk2D = torch.flip(blk2D, [0])
-                    if (j-centerBlk[1])%2 == 1: # the odd index from the original image is reflected
-                        blk2D = torch.flip(blk2D, [1])
-                    blk2D = blk2D * self.reflectivity ** (abs(i-centerBlk[0])+abs(j-centerBlk[1]))
-
-                # Bind the images in the horizontal direction.
-                transBlkRow[pad[0]:pad[0]+blk_h, j, pad[2]:pad[2]+blk_w] = blk2D
-
-            # Bind the rows of images in the vertical direction.
-            transImage[:, i, :] = transBlkRow.view(blk_h_pad, -1).t()
-
-        # Reshape the transformed image into a 2D image.
-        transImage = transImage.view(blk_colCount * blk_w_pad, -1)        
-        return transImage.t()
+        # Block index and pixel coordinate within the (unpadded) block of every
+        # row and every column of the image.
+        i = torch.arange(blk_rowCount).repeat_interleave(blk_h_pad)
+        j = torch.arange(blk_colCount).repeat_interleave(blk_w_pad)
+        y = torch.arange(blk_h_pad).repeat(blk_rowCount) - pad[0]
+        x = torch.arange(blk_w_pad).repeat(blk_colCount) - pad[2]
+        inBlock = ((y >= 0) & (y < blk_h)).unsqueeze(1) & ((x >= 0) & (x < blk_w)).unsqueeze(0)
+
+        if centerBlk and len(centerBlk) == 2:
+            # the odd indices from the original image are reflected
+            y = torch.where((i-centerBlk[0])%2 == 1, blk_h-1-y, y)
+            x = torch.where((j-centerBlk[1])%2 == 1, blk_w-1-x, x)
+            reflections = (i-centerBlk[0]).abs().unsqueeze(1) + (j-centerBlk[1]).abs().unsqueeze(0)
+            atten = self.reflectivity ** reflections.double()
+        else: # no reflection
+            atten = torch.ones(len(i), len(j), dtype=torch.double)
+        atten = (atten * inBlock).to(torch.get_default_dtype())
+
+        # Like torch.take and matIn[blkIdx], negative indices count from the
+        # end and indices out of range raise.
+        (M, N) = matShape
+        if pxIdx.numel() and (pxIdx.min() < -N or pxIdx.max() >= N):
+            raise IndexError("pxIdx out of range for %d columns" % N)
+        if blkIdx.numel() and (blkIdx.min() < -M or blkIdx.max() >= M):
+            raise IndexError("blkIdx out of range for %d rows" % M)
+        cols = pxIdx.long().cpu()[y.clamp(0, blk_h-1).unsqueeze(1), x.clamp(0, blk_w-1).unsqueeze(0)] % N
+        rows = blkIdx.long().cpu()[i.unsqueeze(1), j.unsqueeze(0)] % M
+
+        # The image row (column) of every row (column) of every unflipped block,
+        # for reading the blocks back.
+        blkRows = torch.zeros(blk_rowCount, blk_h, dtype=torch.long)
+        blkCols = torch.zeros(blk_colCount, blk_w, dtype=torch.long)
+        inRow = (y >= 0) & (y < blk_h)
+        inCol = (x >= 0) & (x < blk_w)
+        blkRows[i[inRow], y[inRow]] = torch.arange(len(y))[inRow]
+        blkCols[j[inCol], x[inCol]] = torch.arange(len(x))[inCol]
+        blockPixels = blkRows[:, None, :, None] * len(x) + blkCols[None, :, None, :]
+
+        return KaleidoPlan(rows*N + cols, atten, matShape, blockPixels)
 
 
 if __name__ == "__main__":